@@ -4,6 +4,7 @@ from .models import (
     Chategory, Course, Section, Topic, 
     Question, Answer, Quiz, QuizAttempt, SelectedAnswer
 )
+from .ratings import recount_ratings
 
 
 # Inline classes for nested administration
@@ -61,7 +62,7 @@ class ChategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Course)
 class CourseAdmin(admin.ModelAdmin):
-    list_display = ('title', 'category', 'price', 'course_type', 'course_level', 'created_at')
+    list_display = ('title', 'category', 'price', 'course_type', 'course_level', 'average_rating', 'review_count', 'created_at')
     list_filter = ('category', 'course_type', 'course_level', 'created_at')
     search_fields = ('title', 'description')
     fieldsets = (
@@ -75,6 +76,17 @@ class CourseAdmin(admin.ModelAdmin):
     )
     inlines = [SectionInline]
     list_per_page = 20
+    
+    actions = ['recount_ratings']
+    
+    def recount_ratings(self, request, queryset):
+        updated = 0
+        for course_id in queryset.values_list('id', flat=True):
+            recount_ratings(course_id)
+            updated += 1
+        self.message_user(request, f'Recounted ratings for {updated} courses.')
+    
+    recount_ratings.short_description = "Recount selected courses' ratings"
 
 
 @admin.register(Section)
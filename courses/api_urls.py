@@ -0,0 +1,7 @@
+from django.urls import path
+from .api_views import CourseCatalogView
+
+urlpatterns = [
+    # Catalog
+    path('', CourseCatalogView.as_view(), name='api-course-catalog'),
+]
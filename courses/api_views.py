@@ -0,0 +1,54 @@
+# courses/api_views.py
+from rest_framework import permissions
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import catalog
+from .serializers import CourseCardSerializer
+
+MAX_PAGE_SIZE = 50
+
+
+class CourseCatalogView(APIView):
+    """
+    API endpoint for the course catalog, with the filters of the HTML catalog.
+    Pages are keyset paginated through the `cursor` links in `next` and
+    `previous`; `count` is only computed with ?count=1. Searches, ranked by
+    relevance, and ?sort=rating are paginated with `page` numbers instead.
+    """
+    authentication_classes = [JWTAuthentication, SessionAuthentication]
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request):
+        try:
+            page_size = min(max(int(request.query_params.get('page_size', catalog.COURSES_PER_PAGE)), 1), MAX_PAGE_SIZE)
+        except ValueError:
+            page_size = catalog.COURSES_PER_PAGE
+        filters = catalog.catalog_filters(request.query_params)
+        courses = catalog.filter_courses(filters)
+        url = request.build_absolute_uri()
+
+        if not catalog.uses_cursor(filters):
+            page = catalog.catalog_page(courses, request.query_params.get('page'), request.user, per_page=page_size)
+            count = page.paginator.count
+            next_url = replace_query_param(url, 'page', page.next_page_number()) if page.has_next() else None
+            previous_url = replace_query_param(url, 'page', page.previous_page_number()) if page.has_previous() else None
+        else:
+            page = catalog.cursor_page(
+                courses, request.query_params.get('cursor'), request.user, per_page=page_size,
+                with_count=request.query_params.get('count') == '1',
+            )
+            count = page.count
+            url = remove_query_param(url, 'page')
+            next_url = replace_query_param(url, 'cursor', page.next_cursor) if page.has_next() else None
+            previous_url = replace_query_param(url, 'cursor', page.previous_cursor) if page.has_previous() else None
+
+        return Response({
+            "count": count,
+            "next": next_url,
+            "previous": previous_url,
+            "results": CourseCardSerializer(page, many=True, context={'request': request}).data,
+        })
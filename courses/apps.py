@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CoursesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'courses'
+
+    def ready(self):
+        """
+        Connect signals when the app is ready.
+        They keep derived structures such as the topic sequence in sync.
+        """
+        import courses.signals
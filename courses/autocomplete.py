@@ -0,0 +1,117 @@
+"""
+In-process prefix index for search-as-you-type.
+
+Every word of a course title or category name starts one key, the text from
+that word to the end, so "dev" finds "Web development". Keys live in a sorted
+list and a prefix lookup is a bisect plus a short scan, the database is not
+queried per keystroke. The index is built on first use, patched by
+courses.signals once a change made by this process commits, and rebuilt after
+MAX_AGE seconds so changes made by other worker processes show up too.
+
+Builds and patches hold the index lock, so a patch waits for a build that may
+have read the rows before the change, and is applied on top of it. Lookups
+never wait: they read the current containers, which are swapped, not mutated.
+Only the first build blocks lookups, a stale index is refreshed by the one
+thread that gets the lock while the others keep serving it.
+"""
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+
+from .models import Chategory, Course
+
+COURSE = 'course'
+CATEGORY = 'category'
+
+# Seconds before the index is rebuilt to pick up changes of other processes
+MAX_AGE = 300
+DEFAULT_LIMIT = 10
+
+
+def normalize(text):
+    """Case and accent insensitive form of a title, words separated by single spaces."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.casefold().split())
+
+
+def _keys(label):
+    words = normalize(label).split(' ')
+    return [' '.join(words[index:]) for index in range(len(words)) if words[index]]
+
+
+class PrefixIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Sorted (key, kind, id) entries and (kind, id) -> label, replaced together
+        self._index = ([], {})
+        self._built_at = None
+
+    def _entries(self, kind, item_id, label):
+        return [(key, kind, item_id) for key in _keys(label)]
+
+    def build(self):
+        with self._lock:
+            self._build()
+
+    def _build(self):
+        # Called with the lock held, patches wait until the rows read here are swapped in
+        labels = {(COURSE, course_id): title for course_id, title in Course.objects.values_list('id', 'title')}
+        labels.update(((CATEGORY, category_id), name) for category_id, name in Chategory.objects.values_list('id', 'name'))
+        keys = sorted(entry for (kind, item_id), label in labels.items() for entry in self._entries(kind, item_id, label))
+        self._index, self._built_at = (keys, labels), time.monotonic()
+
+    def _is_stale(self):
+        return time.monotonic() - self._built_at > MAX_AGE
+
+    def _ensure_fresh(self):
+        if self._built_at is None:
+            with self._lock:
+                if self._built_at is None:  # Not built by the thread this one waited for
+                    self._build()
+        elif self._is_stale() and self._lock.acquire(blocking=False):
+            try:
+                if self._is_stale():
+                    self._build()
+            finally:
+                self._lock.release()
+
+    def update(self, kind, item_id, label):
+        """Add, rename or, with label None, remove one course or category."""
+        with self._lock:
+            if self._built_at is None:
+                return  # Not built yet, the first lookup reads the current state
+            # Swap in new containers, lookups running in other threads keep consistent ones
+            keys, labels = self._index
+            keys = [entry for entry in keys if entry[1:] != (kind, item_id)]
+            labels = dict(labels)
+            labels.pop((kind, item_id), None)
+            if label is not None:
+                for entry in self._entries(kind, item_id, label):
+                    insort(keys, entry)
+                labels[(kind, item_id)] = label
+            self._index = (keys, labels)
+
+    def lookup(self, prefix, limit=DEFAULT_LIMIT):
+        """Courses and categories with a word starting with `prefix`, as (kind, id, label)."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        self._ensure_fresh()
+        keys, labels = self._index
+        results, seen = [], set()
+        index = bisect_left(keys, (prefix,))
+        while index < len(keys) and len(results) < limit:
+            key, kind, item_id = keys[index]
+            if not key.startswith(prefix):
+                break
+            if (kind, item_id) not in seen:
+                seen.add((kind, item_id))
+                results.append((kind, item_id, labels[(kind, item_id)]))
+            index += 1
+        return results
+
+
+index = PrefixIndex()
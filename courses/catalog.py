@@ -0,0 +1,235 @@
+"""
+Query layer of the course catalog.
+
+The catalog is the most visited page, so a page of courses is fetched with
+everything its cards show, the category, the section count and the viewer's
+enrollment state, as columns of one query. The cost no longer grows with the
+page size.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db.models import Count, Exists, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from subscribtion.models import CourseProgress, Enrollment
+from . import search
+from .models import Course, Section
+
+COURSES_PER_PAGE = 12
+
+NEWEST = 'newest'
+TOP_RATED = 'rating'
+SORT_CHOICES = [(NEWEST, 'Newest'), (TOP_RATED, 'Top rated')]
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _price(value):
+    try:
+        return Decimal(value).normalize() if value else None
+    except (ArithmeticError, ValueError):
+        return None
+
+
+def catalog_filters(params):
+    """
+    The search and filter fields of a GET query, validated and normalized.
+    Unknown or malformed values are dropped, so equal filters compare equal.
+    """
+    course_type = params.get('course_type')
+    course_level = params.get('course_level')
+    return {
+        'search': ' '.join((params.get('search') or '').split()),
+        'category': _int(params.get('category')),
+        'course_type': course_type if course_type in [Course.LOCKED, Course.MANAGED, Course.UNLOCKED] else None,
+        'course_level': course_level if course_level in [
+            Course.BEGINNER, Course.INTERMEDIATE, Course.ADVANCED, Course.GENERAL,
+        ] else None,
+        'min_price': _price(params.get('min_price')),
+        'max_price': _price(params.get('max_price')),
+        'sort': TOP_RATED if params.get('sort') == TOP_RATED else NEWEST,
+    }
+
+
+def uses_cursor(filters):
+    """Keyset pagination applies to the newest-first order only, not to search or rating order."""
+    return not filters['search'] and filters['sort'] == NEWEST
+
+
+def filter_courses(filters, exclude=()):
+    """
+    The catalog queryset for `filters`, as returned by catalog_filters().
+    The filters named in `exclude` are skipped.
+    """
+    courses = Course.objects.select_related('category').order_by('-created_at')
+
+    if filters['category'] is not None and 'category' not in exclude:
+        courses = courses.filter(category_id=filters['category'])
+    if filters['course_type'] and 'course_type' not in exclude:
+        courses = courses.filter(course_type=filters['course_type'])
+    if filters['course_level'] and 'course_level' not in exclude:
+        courses = courses.filter(course_level=filters['course_level'])
+    if filters['min_price'] is not None:
+        courses = courses.filter(price__gte=filters['min_price'])
+    if filters['max_price'] is not None:
+        courses = courses.filter(price__lte=filters['max_price'])
+
+    # Searching orders by relevance instead of recency
+    if filters['search']:
+        courses = search.search_courses(courses, filters['search'])
+    if filters['sort'] == TOP_RATED:
+        # Stored aggregates, see courses.ratings
+        courses = courses.order_by('-average_rating', '-review_count', '-created_at')
+    return courses
+
+
+def with_card_data(courses, user=None):
+    """
+    Annotate section_count and, for an authenticated user, is_enrolled,
+    progress, completed, enrollment_status and resume_topic_id, the attributes
+    the course cards read. Progress defaults to 0 when the enrollment has no progress yet.
+    """
+    section_count = (
+        Section.objects.filter(course=OuterRef('pk'))
+        .order_by()
+        .values('course')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    courses = courses.annotate(section_count=Coalesce(Subquery(section_count), Value(0), output_field=IntegerField()))
+    if user is None or not user.is_authenticated:
+        return courses
+
+    enrollment = Enrollment.objects.filter(user=user, course=OuterRef('pk'))
+    progress = CourseProgress.objects.filter(enrollment_model__user=user, enrollment_model__course=OuterRef('pk'))
+    return courses.annotate(
+        is_enrolled=Exists(enrollment),
+        enrollment_status=Subquery(enrollment.values('enrolement_status')[:1]),
+        progress=Coalesce(Subquery(progress.values('progress_percentage')[:1]), Value(Decimal('0.00'))),
+        completed=Coalesce(Subquery(progress.values('completed')[:1]), Value(False)),
+        resume_topic_id=Subquery(progress.values('resume_topic_id')[:1]),
+    )
+
+
+def attach_highlights(page, search_query):
+    """Set search_highlight, the highlighted title and snippet, on the courses of a page."""
+    highlights = search.get_backend().highlight(search_query, [course.id for course in page])
+    for course in page:
+        course.search_highlight = highlights.get(course.id)
+
+
+def catalog_page(courses, page_number, user=None, per_page=COURSES_PER_PAGE):
+    """
+    The requested page of `courses` with card data. Invalid page numbers
+    fall back to the first page, out of range ones to the last.
+    """
+    paginator = Paginator(with_card_data(courses, user), per_page)
+    try:
+        return paginator.page(page_number)
+    except PageNotAnInteger:
+        return paginator.page(1)
+    except EmptyPage:
+        return paginator.page(paginator.num_pages)
+
+
+# -- keyset pagination ---------------------------------------------------------
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(course, direction):
+    """An opaque token for the position of `course` in the (-created_at, -id) order."""
+    payload = json.dumps([course.created_at.isoformat(), course.id, direction])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """(created_at, id, direction) of a cursor token, None when it is missing or malformed."""
+    if not token:
+        return None
+    try:
+        payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        created_at, course_id, direction = json.loads(payload)
+        if direction not in (NEXT, PREVIOUS):
+            return None
+        return datetime.fromisoformat(created_at), int(course_id), direction
+    except (binascii.Error, ValueError, TypeError):
+        return None
+
+
+class CursorPage:
+    """
+    A page of a keyset paginated catalog. Reads like a Paginator page for the
+    course cards, without page numbers. count is None unless it was asked for.
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None, count=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def cursor_page(courses, cursor=None, user=None, per_page=COURSES_PER_PAGE, with_count=False):
+    """
+    The page of `courses` after (or before) `cursor`, newest first. Each page
+    is an index range scan of per_page + 1 rows on (created_at, id), so deep
+    pages cost the same as the first one. Counting the whole filtered catalog
+    is the expensive part and only happens with `with_count`.
+    """
+    position = decode_cursor(cursor)
+    courses_with_data = with_card_data(courses, user)
+
+    if position is None or position[2] == NEXT:
+        if position is not None:
+            created_at, course_id, _ = position
+            courses_with_data = courses_with_data.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=course_id)
+            )
+        rows = list(courses_with_data.order_by('-created_at', '-id')[:per_page + 1])
+        has_more = len(rows) > per_page
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1], NEXT) if has_more else None
+        previous_cursor = encode_cursor(rows[0], PREVIOUS) if position is not None and rows else None
+    else:
+        created_at, course_id, _ = position
+        rows = list(
+            courses_with_data.filter(Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=course_id))
+            .order_by('created_at', 'id')[:per_page + 1]
+        )
+        has_more = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        previous_cursor = encode_cursor(rows[0], PREVIOUS) if has_more else None
+        next_cursor = encode_cursor(rows[-1], NEXT) if rows else None
+
+    count = courses.order_by().count() if with_count else None
+    return CursorPage(rows, next_cursor, previous_cursor, count)
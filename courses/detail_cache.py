@@ -0,0 +1,31 @@
+"""
+Versions of the cached public fragments of the course detail page.
+
+The curriculum, the review list and the related courses render the same for
+every visitor who is not enrolled, so course_detail.html caches them with the
+{% cache %} tag, and the view hands them lazy querysets that only run on a miss.
+The per-user parts (progress, enroll buttons, the review form) stay outside the
+cached fragments. Fragment keys hold Course.structure_version, which section and
+topic changes bump, and the per-course version below, which courses.signals bumps
+on Course and Review changes. The related courses fragment lists other courses
+and uses the catalog version of courses.facets instead.
+"""
+from django.core.cache import cache
+
+FRAGMENT_TIMEOUT = 300
+
+
+def _version_key(course_id):
+    return f'course-detail:{course_id}:version'
+
+
+def version(course_id):
+    return cache.get_or_set(_version_key(course_id), 1, None)
+
+
+def invalidate(course_id):
+    """Forget the cached fragments of a course."""
+    try:
+        cache.incr(_version_key(course_id))
+    except ValueError:
+        cache.set(_version_key(course_id), 1, None)
@@ -0,0 +1,91 @@
+"""
+Facet counts of the course catalog.
+
+One grouped aggregation over the search and price filtered catalog returns a
+row per (category, course type, level, price bucket) combination. Every facet
+is summed from those rows with the other facets' selections applied, so a
+facet lists the counts its values would give, not only the selected one.
+Results are cached per normalized filter signature; Course changes bump a
+version number that is part of every key (see courses.signals).
+"""
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, Value, When
+
+from learning_platform.caching import get_or_compute
+
+from .catalog import filter_courses
+
+FACETS = ('category', 'course_type', 'course_level')
+
+# (key, label, lower bound, upper bound exclusive)
+PRICE_BUCKETS = [
+    ('free', 'Free', 0, 0.01),
+    ('under_25', 'Under $25', 0.01, 25),
+    ('25_to_100', '$25 to $100', 25, 100),
+    ('over_100', 'Over $100', 100, None),
+]
+
+CACHE_TIMEOUT = 300
+VERSION_KEY = 'catalog-facets:version'
+
+
+def version():
+    """The catalog version, bumped whenever a course changes."""
+    return cache.get_or_set(VERSION_KEY, 1, None)
+
+
+def invalidate():
+    """Forget every cached facet count, called when courses change."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def _signature(filters):
+    normalized = {name: str(value) for name, value in filters.items() if value not in (None, '') and name != 'sort'}
+    normalized['search'] = normalized.get('search', '').casefold()
+    return hashlib.sha1(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+
+def _price_bucket():
+    whens = []
+    for key, _, lower, upper in PRICE_BUCKETS:
+        condition = {'price__gte': lower}
+        if upper is not None:
+            condition['price__lt'] = upper
+        whens.append(When(then=Value(key), **condition))
+    return Case(*whens, default=Value(''), output_field=CharField())
+
+
+def compute_facets(filters):
+    """Facet name -> {value: course count} for `filters` (see catalog.catalog_filters)."""
+    rows = (
+        filter_courses(filters, exclude=FACETS)
+        .order_by()
+        .annotate(price_bucket=_price_bucket())
+        .values('category_id', 'course_type', 'course_level', 'price_bucket')
+        .annotate(count=Count('id'))
+    )
+    counts = {facet: {} for facet in FACETS + ('price',)}
+    for row in rows:
+        values = {'category': row['category_id'], 'course_type': row['course_type'], 'course_level': row['course_level']}
+        for facet in FACETS:
+            others_match = all(
+                filters[other] is None or filters[other] == values[other]
+                for other in FACETS if other != facet
+            )
+            if others_match:
+                counts[facet][values[facet]] = counts[facet].get(values[facet], 0) + row['count']
+        if all(filters[facet] is None or filters[facet] == values[facet] for facet in FACETS):
+            counts['price'][row['price_bucket']] = counts['price'].get(row['price_bucket'], 0) + row['count']
+    return counts
+
+
+def facet_counts(filters):
+    """compute_facets() through the cache, one worker recomputes an expired entry."""
+    key = f"catalog-facets:{version()}:{_signature(filters)}"
+    return get_or_compute(key, lambda: compute_facets(filters), CACHE_TIMEOUT)
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from courses.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the course search index from the courses, sections and topics."
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        started = time.monotonic()
+        indexed = backend.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {indexed} course(s) with {type(backend).__name__} in {time.monotonic() - started:.2f}s"
+        ))
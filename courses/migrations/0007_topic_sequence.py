@@ -0,0 +1,57 @@
+# Generated by Django 5.1.7 on 2026-10-18 02:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_sequences(apps, schema_editor):
+    """Materialize the topic order of every existing course."""
+    Section = apps.get_model('courses', 'Section')
+    Topic = apps.get_model('courses', 'Topic')
+    TopicSequence = apps.get_model('courses', 'TopicSequence')
+
+    entries = []
+    for course_id in Section.objects.values_list('course_id', flat=True).distinct():
+        section_ids = list(
+            Section.objects.filter(course_id=course_id).order_by('created_at', 'id').values_list('id', flat=True)
+        )
+        topics_by_section = {section_id: [] for section_id in section_ids}
+        for topic_id, section_id in Topic.objects.filter(section__course_id=course_id).order_by('created_at', 'id').values_list('id', 'section_id'):
+            topics_by_section[section_id].append(topic_id)
+        position = 0
+        for section_index, section_id in enumerate(section_ids):
+            for section_position, topic_id in enumerate(topics_by_section[section_id]):
+                entries.append(TopicSequence(
+                    course_id=course_id, section_id=section_id, topic_id=topic_id,
+                    position=position, section_index=section_index, section_position=section_position,
+                ))
+                position += 1
+    TopicSequence.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0006_review'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TopicSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('section_index', models.PositiveIntegerField()),
+                ('section_position', models.PositiveIntegerField()),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='topic_sequence', to='courses.course')),
+                ('section', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='topic_sequence', to='courses.section')),
+                ('topic', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='sequence', to='courses.topic')),
+            ],
+            options={
+                'ordering': ['course', 'position'],
+                'indexes': [models.Index(fields=['section', 'section_position'], name='courses_top_section_d56b80_idx'), models.Index(fields=['course', 'section_index', 'section_position'], name='courses_top_course__5cf06d_idx')],
+                'unique_together': {('course', 'position')},
+            },
+        ),
+        migrations.RunPython(build_sequences, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+SEARCH_TABLE = 'courses_coursesearch'
+
+
+def create_search_index(apps, schema_editor):
+    """FTS5 index of courses, see courses.search. Other databases use a fallback backend."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+        "title, description, outline, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    schema_editor.execute(f"""
+        INSERT INTO {SEARCH_TABLE} (rowid, title, description, outline)
+        SELECT c.id, c.title, c.description,
+               COALESCE((SELECT group_concat(s.title, ' ') FROM courses_section s WHERE s.course_id = c.id), '')
+               || ' ' ||
+               COALESCE((SELECT group_concat(t.title, ' ') FROM courses_topic t
+                         JOIN courses_section s ON s.id = t.section_id WHERE s.course_id = c.id), '')
+        FROM courses_course c
+    """)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {SEARCH_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_topic_sequence'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.1.7 on 2026-10-18 03:16
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def backfill_ratings(apps, schema_editor):
+    """Aggregate the existing reviews of every course."""
+    Course = apps.get_model('courses', 'Course')
+    Review = apps.get_model('courses', 'Review')
+
+    histograms = {}
+    rows = Review.objects.order_by().values('course_id', 'rating').annotate(count=models.Count('id'))
+    for row in rows:
+        histograms.setdefault(row['course_id'], {})[row['rating']] = row['count']
+    for course_id, histogram in histograms.items():
+        review_count = sum(histogram.values())
+        rating_sum = sum(rating * count for rating, count in histogram.items())
+        Course.objects.filter(pk=course_id).update(
+            review_count=review_count,
+            rating_sum=rating_sum,
+            average_rating=(Decimal(rating_sum) / review_count).quantize(Decimal('0.01')),
+            **{f'rating_{rating}_count': histogram.get(rating, 0) for rating in range(1, 6)},
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0009_course_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='average_rating',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=3),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['average_rating', 'review_count'], name='course_rating_idx'),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
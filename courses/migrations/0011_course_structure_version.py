@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 03:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_course_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='structure_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 04:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_course_structure_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='sequence_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -66,8 +66,37 @@ class Course(models.Model):  # Corrected typo in "model" to "models"
         default=GENERAL,
     )
 
+    # Bumped on every section / topic change, part of the outline cache key (courses.outline)
+    structure_version = models.PositiveIntegerField(default=0)
+    # Bumped by courses.sequence when a rebuild moves existing topics to other positions
+    sequence_version = models.PositiveIntegerField(default=0)
+
+    # Denormalized review aggregates, maintained by courses.ratings
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    average_rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+
     def __str__(self):
         return self.title
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the catalog, see courses.catalog.cursor_page
+            models.Index(fields=['created_at', 'id'], name='course_created_idx'),
+            models.Index(fields=['price', 'created_at', 'id'], name='course_price_created_idx'),
+            # Catalog sorted by rating
+            models.Index(fields=['average_rating', 'review_count'], name='course_rating_idx'),
+        ]
+
+    @property
+    def rating_histogram(self):
+        """Star rating -> number of reviews, from 1 to 5."""
+        return {rating: getattr(self, f'rating_{rating}_count') for rating in range(1, 6)}
     
 
 class Section(models.Model):
@@ -117,6 +146,32 @@ class Topic(models.Model):
         return self.title
 
 
+class TopicSequence(models.Model):
+    """
+    Materialized linear order of every topic of a course, across its sections.
+    Rebuilt by courses.sequence whenever the structure changes, so next /
+    previous / first-of-section navigation is a single indexed lookup.
+    Deleting topics or sections may leave gaps, lookups use ranges, not +1.
+    """
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='topic_sequence')
+    section = models.ForeignKey(Section, on_delete=models.CASCADE, related_name='topic_sequence')
+    topic = models.OneToOneField(Topic, on_delete=models.CASCADE, related_name='sequence')
+    position = models.PositiveIntegerField()  # 0-based position in the whole course
+    section_index = models.PositiveIntegerField()  # 0-based position of the section in the course
+    section_position = models.PositiveIntegerField()  # 0-based position of the topic in its section
+
+    class Meta:
+        unique_together = ('course', 'position')
+        indexes = [
+            models.Index(fields=['section', 'section_position']),
+            models.Index(fields=['course', 'section_index', 'section_position']),
+        ]
+        ordering = ['course', 'position']
+
+    def __str__(self):
+        return f"{self.course_id}:{self.position} {self.topic_id}"
+
+
 
 
 
@@ -0,0 +1,116 @@
+"""
+Cached outline of a course: its sections and their topics, in course order.
+
+The outline holds what the curriculum sidebars and navigation need, ids,
+titles, content types, required and quiz flags, as immutable tuples. It is cached
+under the course id and Course.structure_version, which courses.signals bumps
+whenever a section or topic is saved or deleted, so stale outlines are never
+read and need no explicit invalidation. With the course row at hand a warm
+outline costs no query.
+"""
+from collections import namedtuple
+
+from django.db.models import Exists, F, OuterRef
+
+from learning_platform.caching import get_or_compute
+from .models import Course, Quiz, Section, Topic
+
+CACHE_TIMEOUT = 60 * 60 * 24
+# Part of the cache key, bump it when the cached row layout changes
+ROW_FORMAT = 2
+
+
+class OutlineTopic(namedtuple('OutlineTopic', 'id title content_type is_required section_id has_quiz')):
+    __slots__ = ()
+
+    @property
+    def pk(self):
+        return self.id
+
+
+class OutlineSection(namedtuple('OutlineSection', 'id title is_required topics')):
+    __slots__ = ()
+
+    @property
+    def pk(self):
+        return self.id
+
+    @property
+    def topic_count(self):
+        return len(self.topics)
+
+
+class Outline:
+    """The sections of a course with their topics, plus sequence navigation."""
+
+    def __init__(self, course_id, version, sections):
+        self.course_id = course_id
+        self.version = version
+        self.sections = sections
+        self.topics = tuple(topic for section in sections for topic in section.topics)
+        self._index = {topic.id: index for index, topic in enumerate(self.topics)}
+
+    def __iter__(self):
+        return iter(self.sections)
+
+    def __len__(self):
+        return len(self.sections)
+
+    def position(self, topic_id):
+        """The index of `topic_id` in self.topics, None when it is not part of the course."""
+        return self._index.get(topic_id)
+
+    def topic(self, topic_id):
+        index = self._index.get(topic_id)
+        return self.topics[index] if index is not None else None
+
+    def next_topic(self, topic_id):
+        """The topic after `topic_id` in the course, possibly in a later section."""
+        index = self._index.get(topic_id)
+        if index is None or index + 1 >= len(self.topics):
+            return None
+        return self.topics[index + 1]
+
+    def previous_topic(self, topic_id):
+        """The topic before `topic_id` in the course, possibly in an earlier section."""
+        index = self._index.get(topic_id)
+        if not index:
+            return None
+        return self.topics[index - 1]
+
+
+def _cache_key(course_id, version):
+    return f'course-outline:{ROW_FORMAT}:{course_id}:{version}'
+
+
+def _load(course_id):
+    """The outline rows, plain tuples so the cached value stays small."""
+    sections = list(
+        Section.objects.filter(course_id=course_id).order_by('created_at', 'id').values_list('id', 'title', 'is_required')
+    )
+    topics = {section_id: [] for section_id, _, _ in sections}
+    rows = (
+        Topic.objects.filter(section__course_id=course_id)
+        .annotate(has_quiz=Exists(Quiz.objects.filter(topic_id=OuterRef('pk'))))
+        .order_by('created_at', 'id')
+        .values_list('id', 'title', 'content_type', 'is_required', 'section_id', 'has_quiz')
+    )
+    for row in rows:
+        topics[row[4]].append(row)
+    return tuple((section_id, title, is_required, tuple(topics[section_id])) for section_id, title, is_required in sections)
+
+
+def get_outline(course):
+    """The outline of `course`, a Course instance with a current structure_version."""
+    key = _cache_key(course.pk, course.structure_version)
+    rows = get_or_compute(key, lambda: _load(course.pk), CACHE_TIMEOUT)
+    sections = tuple(
+        OutlineSection(section_id, title, is_required, tuple(OutlineTopic(*topic) for topic in topics))
+        for section_id, title, is_required, topics in rows
+    )
+    return Outline(course.pk, course.structure_version, sections)
+
+
+def bump_structure_version(course_id):
+    """Make the cached outline of a course unreachable. update() skips the Course save signals."""
+    Course.objects.filter(pk=course_id).update(structure_version=F('structure_version') + 1)
@@ -0,0 +1,60 @@
+"""
+Denormalized review aggregates of a course.
+
+Course.review_count, rating_sum, average_rating and the rating_N_count
+histogram are adjusted by the Review signals in courses.signals, inside the
+transaction that writes the review. The course row is locked while the new
+values are computed, so concurrent reviews of a course never lose an update.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Course, Review
+
+AGGREGATE_FIELDS = ['review_count', 'rating_sum'] + [f'rating_{rating}_count' for rating in range(1, 6)]
+
+
+def _average(rating_sum, review_count):
+    if not review_count:
+        return Decimal('0.00')
+    return (Decimal(rating_sum) / review_count).quantize(Decimal('0.01'))
+
+
+def apply_rating_change(course_id, old_rating=None, new_rating=None):
+    """
+    Move one review from `old_rating` to `new_rating`. None stands for no
+    review, so (None, 4) adds a review and (4, None) removes one.
+    """
+    if old_rating == new_rating:
+        return
+    with transaction.atomic():
+        values = Course.objects.select_for_update().filter(pk=course_id).values(*AGGREGATE_FIELDS).first()
+        if values is None:
+            return  # The course itself is being deleted
+        if old_rating is not None:
+            values['review_count'] -= 1
+            values['rating_sum'] -= old_rating
+            values[f'rating_{old_rating}_count'] -= 1
+        if new_rating is not None:
+            values['review_count'] += 1
+            values['rating_sum'] += new_rating
+            values[f'rating_{new_rating}_count'] += 1
+        # Counters that drifted below zero are repaired by recount_ratings
+        values = {field: max(value, 0) for field, value in values.items()}
+        values['average_rating'] = _average(values['rating_sum'], values['review_count'])
+        # update() rather than save(), Course save signals reindex search and facets
+        Course.objects.filter(pk=course_id).update(**values)
+
+
+def recount_ratings(course_id):
+    """Rebuild the aggregates of a course from its reviews."""
+    histogram = dict(
+        Review.objects.filter(course_id=course_id).order_by().values_list('rating').annotate(count=Count('id'))
+    )
+    values = {f'rating_{rating}_count': histogram.get(rating, 0) for rating in range(1, 6)}
+    values['review_count'] = sum(histogram.values())
+    values['rating_sum'] = sum(rating * count for rating, count in histogram.items())
+    values['average_rating'] = _average(values['rating_sum'], values['review_count'])
+    Course.objects.filter(pk=course_id).update(**values)
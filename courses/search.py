@@ -0,0 +1,199 @@
+"""
+Course search.
+
+Courses are indexed on their title, description and an outline made of their
+section and topic titles. On SQLite the index is the FTS5 table created by
+migration 0008, kept in sync by courses.signals in the same transaction as the
+content, searched with bm25 ranking and highlighted with FTS5's own functions.
+Other databases fall back to LikeSearchBackend until a native backend is
+configured: COURSE_SEARCH_BACKEND takes the dotted path of a SearchBackend.
+
+The catalog filters and ranks courses with SearchBackend.rank(), which both
+built-in backends answer inside the course query, so every match can be
+paged to. Backends that only implement search() are ranked from its first
+SEARCH_RESULT_LIMIT ids.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+
+from .models import Course
+
+# Ranked course ids returned per search() call
+SEARCH_RESULT_LIMIT = 1000
+
+SEARCH_TABLE = 'courses_coursesearch'
+
+# One statement indexes courses, restricted to one id by index_course
+_INDEX_SQL = f"""
+    INSERT INTO {SEARCH_TABLE} (rowid, title, description, outline)
+    SELECT c.id, c.title, c.description,
+           COALESCE((SELECT group_concat(s.title, ' ') FROM courses_section s WHERE s.course_id = c.id), '')
+           || ' ' ||
+           COALESCE((SELECT group_concat(t.title, ' ') FROM courses_topic t
+                     JOIN courses_section s ON s.id = t.section_id WHERE s.course_id = c.id), '')
+    FROM courses_course c
+"""
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+# Markers put around matches by FTS5, swapped for <mark> once the text is escaped
+_OPEN, _CLOSE = '\x02', '\x03'
+
+
+def search_terms(query):
+    """The words of a user query, punctuation and operators dropped."""
+    return _WORD.findall(query or '')
+
+
+def _mark(text):
+    return escape(text).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>')
+
+
+class SearchBackend:
+    """Interface of the search backends, every method takes and returns plain values."""
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        """Ids of the courses matching `query`, best match first."""
+        raise NotImplementedError
+
+    def rank(self, courses, query):
+        """`courses` restricted to the matches of `query`, best match first."""
+        course_ids = self.search(query)
+        ranking = Case(*[When(pk=course_id, then=Value(rank)) for rank, course_id in enumerate(course_ids)],
+                       output_field=IntegerField()) if course_ids else Value(0)
+        return courses.filter(pk__in=course_ids).annotate(search_rank=ranking).order_by('search_rank')
+
+    def highlight(self, query, course_ids):
+        """Course id -> {'title', 'snippet'} HTML with the matches wrapped in <mark>."""
+        return {}
+
+    def index_course(self, course_id):
+        pass
+
+    def remove_course(self, course_id):
+        pass
+
+    def rebuild(self):
+        """Index every course from scratch, returns the number of courses indexed."""
+        return 0
+
+
+class LikeSearchBackend(SearchBackend):
+    """Substring matching on the course columns, title matches first. Scans the table."""
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        return list(self.rank(Course.objects.all(), query).values_list('id', flat=True)[:limit])
+
+    def rank(self, courses, query):
+        terms = search_terms(query)
+        if not terms:
+            return courses.none()
+        in_title = Q()
+        for term in terms:
+            courses = courses.filter(Q(title__icontains=term) | Q(description__icontains=term))
+            in_title &= Q(title__icontains=term)
+        return courses.annotate(
+            search_rank=Case(When(in_title, then=Value(0)), default=Value(1), output_field=IntegerField())
+        ).order_by('search_rank', '-created_at', '-id')
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """FTS5 index, every word of the query must match, the last one as a prefix."""
+
+    # bm25 weights of the title, description and outline columns
+    WEIGHTS = (10.0, 2.0, 1.0)
+
+    def _match(self, query):
+        terms = search_terms(query)
+        if not terms:
+            return None
+        quoted = ['"%s"' % term for term in terms]
+        quoted[-1] += '*'
+        return ' '.join(quoted)
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        match = self._match(query)
+        if match is None:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s "
+                f"ORDER BY bm25({SEARCH_TABLE}, %s, %s, %s) LIMIT %s",
+                [match, *self.WEIGHTS, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def rank(self, courses, query):
+        # MATCH and bm25 run inside the course query, the paginator's LIMIT and OFFSET page the matches
+        match = self._match(query)
+        if match is None:
+            return courses.none()
+        table = Course._meta.db_table
+        return courses.filter(
+            pk__in=RawSQL(f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s", [match])
+        ).annotate(search_rank=RawSQL(
+            f"SELECT bm25({SEARCH_TABLE}, %s, %s, %s) FROM {SEARCH_TABLE} "
+            f"WHERE {SEARCH_TABLE} MATCH %s AND rowid = {table}.id",
+            [*self.WEIGHTS, match],
+        )).order_by('search_rank', 'id')
+
+    def highlight(self, query, course_ids):
+        match = self._match(query)
+        if match is None or not course_ids:
+            return {}
+        placeholders = ', '.join(['%s'] * len(course_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, highlight({SEARCH_TABLE}, 0, %s, %s), snippet({SEARCH_TABLE}, -1, %s, %s, '…', 24) "
+                f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s AND rowid IN ({placeholders})",
+                [_OPEN, _CLOSE, _OPEN, _CLOSE, match, *course_ids],
+            )
+            return {
+                course_id: {'title': _mark(title), 'snippet': _mark(snippet)}
+                for course_id, title, snippet in cursor.fetchall()
+            }
+
+    def index_course(self, course_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [course_id])
+            cursor.execute(_INDEX_SQL + " WHERE c.id = %s", [course_id])
+
+    def remove_course(self, course_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [course_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+            cursor.execute(_INDEX_SQL)
+            cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+            cursor.execute(f"SELECT count(*) FROM {SEARCH_TABLE}")
+            return cursor.fetchone()[0]
+
+
+_backend = None
+
+
+def get_backend():
+    """The configured backend, FTS5 on SQLite and LIKE matching elsewhere by default."""
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'COURSE_SEARCH_BACKEND', None)
+        if path:
+            _backend = import_string(path)()
+        elif connection.vendor == 'sqlite':
+            _backend = SQLiteSearchBackend()
+        else:
+            _backend = LikeSearchBackend()
+    return _backend
+
+
+def search_courses(courses, query):
+    """`courses` restricted to the matches of `query` and ordered by relevance."""
+    return get_backend().rank(courses, query)
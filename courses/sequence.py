@@ -0,0 +1,110 @@
+from django.db import transaction
+from django.db.models import F, Q
+from django.dispatch import Signal
+
+from .models import Course, Section, Topic, TopicSequence
+
+# Sent inside the rebuild transaction with course_id, old_topics (old position
+# -> topic id), new_positions (topic id -> new position) and version, the
+# Course.sequence_version of the new positions, so data keyed by sequence
+# positions can follow the topics.
+sequence_rebuilt = Signal()
+
+
+def rebuild_course_sequence(course_id):
+    """
+    Rebuild the TopicSequence rows of a course from its sections and topics,
+    both ordered by creation time. Three reads, one delete and one bulk insert.
+    """
+    section_ids = list(
+        Section.objects.filter(course_id=course_id).order_by('created_at', 'id').values_list('id', flat=True)
+    )
+    section_index = {section_id: index for index, section_id in enumerate(section_ids)}
+
+    topics_by_section = {section_id: [] for section_id in section_ids}
+    topic_rows = (
+        Topic.objects.filter(section__course_id=course_id)
+        .order_by('created_at', 'id')
+        .values_list('id', 'section_id')
+    )
+    for topic_id, section_id in topic_rows:
+        topics_by_section[section_id].append(topic_id)
+
+    entries = []
+    for section_id in section_ids:
+        for section_position, topic_id in enumerate(topics_by_section[section_id]):
+            entries.append(TopicSequence(
+                course_id=course_id,
+                section_id=section_id,
+                topic_id=topic_id,
+                position=len(entries),
+                section_index=section_index[section_id],
+                section_position=section_position,
+            ))
+
+    with transaction.atomic():
+        old_topics = dict(TopicSequence.objects.filter(course_id=course_id).values_list('position', 'topic_id'))
+        # Also drop rows of topics that were moved here from another course
+        TopicSequence.objects.filter(Q(course_id=course_id) | Q(topic__section__course_id=course_id)).delete()
+        TopicSequence.objects.bulk_create(entries, batch_size=500)
+        new_positions = {entry.topic_id: entry.position for entry in entries}
+        if any(new_positions.get(topic_id) != position for position, topic_id in old_topics.items()):
+            Course.objects.filter(pk=course_id).update(sequence_version=F('sequence_version') + 1)
+        version = Course.objects.filter(pk=course_id).values_list('sequence_version', flat=True).first()
+        sequence_rebuilt.send(
+            sender=TopicSequence,
+            course_id=course_id,
+            old_topics=old_topics,
+            new_positions=new_positions,
+            version=version,
+        )
+    return entries
+
+
+def get_sequence_entry(topic):
+    """
+    Return the TopicSequence row of a topic, rebuilding the course sequence
+    if it is missing. Fetch topics with select_related('sequence') to skip the query.
+    """
+    try:
+        return topic.sequence
+    except TopicSequence.DoesNotExist:
+        rebuild_course_sequence(topic.section.course_id)
+        return TopicSequence.objects.get(topic=topic)
+
+
+def _topic_at(queryset):
+    return queryset.select_related('topic__section').first()
+
+
+def next_topic(topic):
+    """The topic after `topic` in the course, possibly in a later section."""
+    entry = get_sequence_entry(topic)
+    next_entry = _topic_at(
+        TopicSequence.objects.filter(course_id=entry.course_id, position__gt=entry.position).order_by('position')
+    )
+    return next_entry.topic if next_entry else None
+
+
+def previous_topic(topic):
+    """The topic before `topic` in the course, possibly in an earlier section."""
+    entry = get_sequence_entry(topic)
+    previous_entry = _topic_at(
+        TopicSequence.objects.filter(course_id=entry.course_id, position__lt=entry.position).order_by('-position')
+    )
+    return previous_entry.topic if previous_entry else None
+
+
+def first_topic_of_section(section):
+    """The first topic of a section, or None when it is empty."""
+    entry = _topic_at(TopicSequence.objects.filter(section=section).order_by('section_position'))
+    return entry.topic if entry else None
+
+
+def first_topic_after_section(topic):
+    """The first topic of the next non-empty section after the section of `topic`."""
+    entry = get_sequence_entry(topic)
+    next_entry = _topic_at(
+        TopicSequence.objects.filter(course_id=entry.course_id, section_index__gt=entry.section_index).order_by('position')
+    )
+    return next_entry.topic if next_entry else None
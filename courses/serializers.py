@@ -0,0 +1,38 @@
+# courses/serializers.py
+from rest_framework import serializers
+
+from .models import Course
+
+
+class CourseCardSerializer(serializers.ModelSerializer):
+    """
+    A catalog entry, built from the annotations of courses.catalog.with_card_data.
+    The enrollment fields are null for anonymous requests.
+    """
+    category = serializers.CharField(source='category.name', read_only=True)
+    section_count = serializers.IntegerField(read_only=True)
+    is_enrolled = serializers.SerializerMethodField()
+    enrollment_status = serializers.SerializerMethodField()
+    progress = serializers.SerializerMethodField()
+    completed = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Course
+        fields = [
+            'id', 'title', 'description', 'image', 'category', 'price', 'course_type', 'course_level',
+            'deadline', 'created_at', 'section_count', 'average_rating', 'review_count',
+            'is_enrolled', 'enrollment_status', 'progress', 'completed',
+        ]
+
+    def get_is_enrolled(self, course):
+        return getattr(course, 'is_enrolled', None)
+
+    def get_enrollment_status(self, course):
+        return getattr(course, 'enrollment_status', None)
+
+    def get_progress(self, course):
+        progress = getattr(course, 'progress', None)
+        return float(progress) if progress is not None else None
+
+    def get_completed(self, course):
+        return getattr(course, 'completed', None)
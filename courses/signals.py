@@ -0,0 +1,149 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import autocomplete, detail_cache, facets
+from .models import Chategory, Course, Quiz, Review, Section, Topic, TopicSequence
+from .outline import bump_structure_version
+from .ratings import apply_rating_change
+from .search import get_backend
+from .sequence import rebuild_course_sequence
+
+
+@receiver(post_save, sender=Topic)
+def rebuild_sequence_on_topic_save(sender, instance, created, raw=False, **kwargs):
+    """
+    A new topic, or a topic moved to another section, changes the order of the course.
+    Deletions only leave gaps in the sequence, which lookups tolerate.
+    """
+    if raw:
+        return
+    if not created:
+        stored = TopicSequence.objects.filter(topic=instance).values_list('section_id', flat=True).first()
+        if stored == instance.section_id:
+            return
+    rebuild_course_sequence(instance.section.course_id)
+
+
+@receiver(post_save, sender=Section)
+def rebuild_sequence_on_section_save(sender, instance, created, raw=False, **kwargs):
+    """A section moved to another course takes its topics along."""
+    if raw or created:
+        return
+    if TopicSequence.objects.filter(section=instance).exclude(course_id=instance.course_id).exists():
+        rebuild_course_sequence(instance.course_id)
+
+
+@receiver(post_save, sender=Course)
+def index_course_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_backend().index_course(instance.pk)
+
+
+@receiver(post_delete, sender=Course)
+def unindex_course_on_delete(sender, instance, **kwargs):
+    get_backend().remove_course(instance.pk)
+
+
+@receiver(post_save, sender=Section)
+@receiver(post_delete, sender=Section)
+def index_course_on_section_change(sender, instance, raw=False, **kwargs):
+    """Section titles are part of the indexed outline of their course."""
+    if not raw:
+        get_backend().index_course(instance.course_id)
+
+
+@receiver(post_save, sender=Topic)
+@receiver(post_delete, sender=Topic)
+def index_course_on_topic_change(sender, instance, raw=False, **kwargs):
+    """Topic titles are part of the indexed outline of their course."""
+    if raw:
+        return
+    course_id = Section.objects.filter(pk=instance.section_id).values_list('course_id', flat=True).first()
+    if course_id:
+        get_backend().index_course(course_id)
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def update_autocomplete_course(sender, instance, raw=False, **kwargs):
+    """Patched once committed, a rolled back change must not reach the index."""
+    label = None if kwargs['signal'] is post_delete else instance.title
+    course_id = instance.pk
+    transaction.on_commit(lambda: autocomplete.index.update(autocomplete.COURSE, course_id, label))
+
+
+@receiver(post_save, sender=Chategory)
+@receiver(post_delete, sender=Chategory)
+def update_autocomplete_category(sender, instance, raw=False, **kwargs):
+    label = None if kwargs['signal'] is post_delete else instance.name
+    category_id = instance.pk
+    transaction.on_commit(lambda: autocomplete.index.update(autocomplete.CATEGORY, category_id, label))
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_catalog_facets(sender, instance, **kwargs):
+    facets.invalidate()
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_course_detail_on_course_change(sender, instance, **kwargs):
+    detail_cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_course_detail_on_review_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        detail_cache.invalidate(instance.course_id)
+
+
+@receiver(post_init, sender=Review)
+def remember_review_rating(sender, instance, **kwargs):
+    """The rating as loaded, so a save knows which histogram bucket it leaves."""
+    # __dict__ so a deferred rating is not loaded here
+    instance._stored_rating = instance.__dict__.get('rating') if instance.pk else None
+
+
+@receiver(post_save, sender=Review)
+def update_ratings_on_review_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    apply_rating_change(instance.course_id, None if created else instance._stored_rating, instance.rating)
+    instance._stored_rating = instance.rating
+
+
+@receiver(post_delete, sender=Review)
+def update_ratings_on_review_delete(sender, instance, **kwargs):
+    stored = instance._stored_rating if instance._stored_rating is not None else instance.rating
+    apply_rating_change(instance.course_id, stored, None)
+
+
+@receiver(post_save, sender=Section)
+@receiver(post_delete, sender=Section)
+def bump_outline_on_section_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_structure_version(instance.course_id)
+
+
+@receiver(post_save, sender=Topic)
+@receiver(post_delete, sender=Topic)
+def bump_outline_on_topic_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    course_id = Section.objects.filter(pk=instance.section_id).values_list('course_id', flat=True).first()
+    if course_id is not None:
+        bump_structure_version(course_id)
+
+
+@receiver(post_save, sender=Quiz)
+@receiver(post_delete, sender=Quiz)
+def bump_outline_on_quiz_change(sender, instance, created=False, raw=False, **kwargs):
+    """The outline flags topics that have a quiz."""
+    if raw or (kwargs['signal'] is post_save and not created):
+        return
+    course_id = Topic.objects.filter(pk=instance.topic_id).values_list('section__course_id', flat=True).first()
+    if course_id is not None:
+        bump_structure_version(course_id)
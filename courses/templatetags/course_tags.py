@@ -25,8 +25,12 @@ def get_item(dictionary, key):
 def count_reviews_with_rating(reviews, rating):
     """
     Count the number of reviews with a specific rating
-    Example usage: {{ reviews|count_reviews_with_rating:5 }}
+    Example usage: {{ course|count_reviews_with_rating:5 }} reads the stored
+    histogram of a course, {{ reviews|count_reviews_with_rating:5 }} counts a list
     """
+    histogram = getattr(reviews, 'rating_histogram', None)
+    if histogram is not None:
+        return histogram.get(int(rating), 0)
     count = 0
     for review in reviews:
         if review.rating == rating:
@@ -1,3 +1,389 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from learning_platform.testing import SharedCacheMixin, create_course, create_curriculum, create_learner
+from subscribtion.models import Enrollment
+from . import autocomplete, catalog, facets, sequence
+from .models import Chategory, Course, Quiz, Review, Section, Topic, TopicSequence
+from .outline import get_outline
+from .sequence import sequence_rebuilt
+
+
+class CourseListTests(TestCase):
+    """The catalog costs the same number of queries whatever the page size."""
+
+    def setUp(self):
+        self.category = Chategory.objects.create(name='Programming', description='')
+        self.user = create_learner()
+        self.client.force_login(self.user)
+
+    def add_courses(self, count):
+        for i in range(count):
+            course = create_course(f'Course {i}', self.category, course_type=Course.UNLOCKED)
+            create_curriculum(course, topics=0)
+            Enrollment.objects.create(user=self.user, course=course)
+
+    def queries_for_page(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('course_list'))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_queries_do_not_grow_with_page_size(self):
+        self.add_courses(2)
+        _, small_page = self.queries_for_page()
+        self.add_courses(10)
+        response, full_page = self.queries_for_page()
+
+        self.assertEqual(small_page, full_page)
+        course = response.context['courses'][0]
+        self.assertTrue(course.is_enrolled)
+        self.assertEqual((course.section_count, course.progress, course.completed), (1, 0, False))
+        self.assertEqual(course.enrollment_status, 'active')
+
+
+class CourseSearchTests(TestCase):
+    """Catalog search is ranked, highlighted and follows content changes."""
+
+    def setUp(self):
+        self.in_description = create_course('Web development', description='Build sites with Django')
+        category = self.in_description.category
+        self.in_title = create_course('Django <basics>', category, description='Start here')
+        self.other = create_course('Data science', category, description='Pandas')
+
+    def search(self, query):
+        response = self.client.get(reverse('course_list'), {'search': query})
+        return list(response.context['courses'])
+
+    def test_results_are_ranked_and_highlighted(self):
+        results = self.search('djan')
+
+        self.assertEqual(results, [self.in_title, self.in_description])
+        self.assertEqual(results[0].search_highlight['title'], '<mark>Django</mark> &lt;basics&gt;')
+
+    def test_outline_follows_topic_changes(self):
+        section = Section.objects.create(course=self.other, title='Numpy')
+        topic = Topic.objects.create(section=section, title='Vectorization')
+        self.assertEqual(self.search('vectorization'), [self.other])
+
+        topic.delete()
+        self.assertEqual(self.search('vectorization'), [])
+        self.assertEqual(self.search('numpy'), [self.other])
+
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search('numpy'), [self.other])
+
+    def test_every_match_can_be_paged_to(self):
+        category = self.in_title.category
+        extra = [create_course(f'Django {index}', category) for index in range(catalog.COURSES_PER_PAGE + 1)]
+        response = self.client.get(reverse('course_list'), {'search': 'django', 'page': 2})
+        first_page = self.search('django')
+
+        self.assertEqual(response.context['courses'].paginator.count, len(extra) + 2)
+        self.assertEqual(len(first_page) + len(response.context['courses']), len(extra) + 2)
+        self.assertEqual(set(first_page) | set(response.context['courses']), set(extra) | {self.in_title, self.in_description})
+        # Title matches rank above the description match
+        self.assertEqual(list(response.context['courses'])[-1], self.in_description)
+
+
+class AutocompleteTests(TestCase):
+    """Suggestions come from the in-process index, which follows saves."""
+
+    def setUp(self):
+        self.course = create_course('Web Development')
+        autocomplete.index.build()
+
+    def suggest(self, query):
+        response = self.client.get(reverse('course_autocomplete'), {'q': query})
+        return [(result['type'], result['label']) for result in response.json()['results']]
+
+    def test_prefix_of_any_word(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('dev'), [('course', 'Web Development')])
+        self.assertEqual(self.suggest('PROG'), [('category', 'Programming')])
+        self.assertEqual(self.suggest('x'), [])
+
+    def test_saves_update_the_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.course.title = 'Data Engineering'
+            self.course.save()
+            Chategory.objects.create(name='Design', description='')
+            # Not before the change commits
+            self.assertEqual(self.suggest('data'), [])
+
+        self.assertEqual(self.suggest('d'), [('course', 'Data Engineering'), ('category', 'Design')])
+        self.assertEqual(self.suggest('web'), [])
+
+    def test_stale_index_is_served_while_another_thread_refreshes(self):
+        Course.objects.filter(pk=self.course.pk).update(title='Data Engineering')
+        autocomplete.index._built_at -= autocomplete.MAX_AGE + 1
+        with autocomplete.index._lock, self.assertNumQueries(0):
+            self.assertEqual(self.suggest('web'), [('course', 'Web Development')])
+        self.assertEqual(self.suggest('web'), [])
+        self.assertEqual(self.suggest('data'), [('course', 'Data Engineering')])
+
+
+class CursorPaginationTests(TestCase):
+    """Keyset pages cover the catalog once, in order, at a constant cost."""
+
+    def setUp(self):
+        category = Chategory.objects.create(name='Programming', description='')
+        for i in range(30):
+            create_course(f'Course {i}', category, price=i)
+        self.expected = list(Course.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def test_walk_forward_and_back(self):
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                page = catalog.cursor_page(Course.objects.all(), cursor, per_page=7)
+                ids = [course.id for course in page]
+            seen.extend(ids)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, self.expected)
+
+        previous = catalog.cursor_page(Course.objects.all(), page.previous_cursor, per_page=7)
+        self.assertEqual([course.id for course in previous], self.expected[21:28])
+
+    def test_api_follows_next_links(self):
+        response = self.client.get(reverse('api-course-catalog'), {'page_size': 20, 'count': 1, 'min_price': 5})
+        self.assertEqual(response.data['count'], 25)
+        ids = [course['id'] for course in response.data['results']]
+        response = self.client.get(response.data['next'])
+        ids += [course['id'] for course in response.data['results']]
+
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(ids, [course_id for course_id in self.expected if course_id > 5])
+
+
+class FacetTests(TestCase):
+    """Facet counts come from one grouped query and are cached until courses change."""
+
+    def setUp(self):
+        cache.clear()
+        self.python = Chategory.objects.create(name='Python', description='')
+        self.design = Chategory.objects.create(name='Design', description='')
+        for category, course_type, price in [
+            (self.python, Course.LOCKED, 0), (self.python, Course.UNLOCKED, 30), (self.design, Course.LOCKED, 150),
+        ]:
+            create_course('Course', category, course_type=course_type, price=price)
+
+    def test_counts_apply_the_other_facets(self):
+        filters = catalog.catalog_filters({'category': str(self.python.id)})
+        with self.assertNumQueries(1):
+            counts = facets.facet_counts(filters)
+
+        # The category facet ignores the selected category, the others apply it
+        self.assertEqual(counts['category'], {self.python.id: 2, self.design.id: 1})
+        self.assertEqual(counts['course_type'], {Course.LOCKED: 1, Course.UNLOCKED: 1})
+        self.assertEqual(counts['price'], {'free': 1, '25_to_100': 1})
+
+        with self.assertNumQueries(0):
+            facets.facet_counts(catalog.catalog_filters({'category': f' {self.python.id}', 'course_type': 'bogus'}))
+
+        create_course('New', self.python, price=5)
+        self.assertEqual(facets.facet_counts(filters)['price']['under_25'], 1)
+
+
+class RatingAggregateTests(TestCase):
+    """Review writes keep the stored rating aggregates of the course in step."""
+
+    def setUp(self):
+        self.course = create_course()
+        self.other = create_course('Go', self.course.category)
+        self.users = [create_learner(f'u{i}') for i in range(2)]
+        for user in self.users:
+            Enrollment.objects.create(user=user, course=self.course)
+
+    def review(self, user, rating):
+        self.client.force_login(user)
+        self.client.post(reverse('submit_review', args=[self.course.id]), {'rating': rating, 'comment': 'ok'})
+
+    def test_create_update_and_delete(self):
+        self.review(self.users[0], 5)
+        self.review(self.users[1], 2)
+        self.review(self.users[1], 4)  # Updates the existing review
+
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.review_count, self.course.rating_sum), (2, 9))
+        self.assertEqual(self.course.average_rating, Decimal('4.50'))
+        self.assertEqual(self.course.rating_histogram, {1: 0, 2: 0, 3: 0, 4: 1, 5: 1})
+
+        response = self.client.get(reverse('course_detail', args=[self.course.id]))
+        self.assertEqual((response.context['total_reviews'], response.context['star_counts'][4]), (2, 1))
+
+        response = self.client.get(reverse('course_list'), {'sort': 'rating'})
+        self.assertEqual(list(response.context['courses']), [self.course, self.other])
+
+        Review.objects.get(user=self.users[0]).delete()
+        self.course.refresh_from_db()
+        self.assertEqual((self.course.review_count, self.course.average_rating), (1, Decimal('4.00')))
+        self.assertEqual(self.course.rating_5_count, 0)
+
+
+class OutlineTests(TestCase):
+    """The course outline is served from the cache until the structure changes."""
+
+    def setUp(self):
+        cache.clear()
+        self.course = create_course()
+        self.first = Section.objects.create(course=self.course, title='Basics')
+        self.second = Section.objects.create(course=self.course, title='Advanced')
+        self.intro = Topic.objects.create(section=self.first, title='Intro')
+        self.loops = Topic.objects.create(section=self.second, title='Loops')
+
+    def test_cached_until_a_topic_changes(self):
+        self.course.refresh_from_db()
+        with self.assertNumQueries(2):
+            outline = get_outline(self.course)
+        with self.assertNumQueries(0):
+            outline = get_outline(self.course)
+        self.assertEqual([section.topic_count for section in outline], [1, 1])
+        self.assertEqual(outline.next_topic(self.intro.id).id, self.loops.id)
+        self.assertIsNone(outline.previous_topic(self.intro.id))
+
+        Topic.objects.create(section=self.first, title='Setup')
+        self.course.refresh_from_db()
+        outline = get_outline(self.course)
+        self.assertEqual([topic.title for topic in outline.topics], ['Intro', 'Setup', 'Loops'])
+
+
+class SequenceTests(TestCase):
+    """TopicSequence orders the topics of a course across its sections."""
+
+    def setUp(self):
+        self.course = create_course()
+        self.topics = create_curriculum(self.course, sections=3, topics=2)
+        self.first, self.second, self.third = Section.objects.filter(course=self.course).order_by('id')
+
+    def order(self):
+        return list(
+            TopicSequence.objects.filter(course=self.course).order_by('position')
+            .values_list('topic_id', 'section_id', 'section_index', 'section_position')
+        )
+
+    def test_rebuild_orders_sections_then_topics(self):
+        TopicSequence.objects.filter(course=self.course).delete()
+        received = []
+        sequence_rebuilt.connect(lambda **kwargs: received.append(kwargs), weak=False, dispatch_uid='test-sequence')
+        self.addCleanup(sequence_rebuilt.disconnect, dispatch_uid='test-sequence')
+
+        entries = sequence.rebuild_course_sequence(self.course.id)
+
+        self.assertEqual([entry.position for entry in entries], list(range(6)))
+        self.assertEqual(self.order(), [
+            (topic.id, topic.section_id, index // 2, index % 2) for index, topic in enumerate(self.topics)
+        ])
+        self.assertEqual(received[0]['old_topics'], {})
+        self.assertEqual(received[0]['new_positions'], {topic.id: index for index, topic in enumerate(self.topics)})
+
+    def test_neighbours_cross_section_boundaries(self):
+        self.assertEqual(sequence.next_topic(self.topics[0]), self.topics[1])
+        self.assertEqual(sequence.next_topic(self.topics[1]), self.topics[2])
+        self.assertIsNone(sequence.next_topic(self.topics[5]))
+        self.assertEqual(sequence.previous_topic(self.topics[2]), self.topics[1])
+        self.assertIsNone(sequence.previous_topic(self.topics[0]))
+        self.assertEqual(sequence.first_topic_after_section(self.topics[0]), self.topics[2])
+        self.assertIsNone(sequence.first_topic_after_section(self.topics[4]))
+
+        # Empty sections are skipped
+        Topic.objects.filter(section=self.second).delete()
+        sequence.rebuild_course_sequence(self.course.id)
+        self.assertEqual(sequence.first_topic_after_section(self.topics[1]), self.topics[4])
+        self.assertEqual(sequence.next_topic(self.topics[1]), self.topics[4])
+
+    def test_missing_entry_is_rebuilt(self):
+        TopicSequence.objects.filter(course=self.course).delete()
+        topic = Topic.objects.get(pk=self.topics[2].pk)
+        self.assertEqual(sequence.previous_topic(topic), self.topics[1])
+        self.assertEqual(TopicSequence.objects.filter(course=self.course).count(), 6)
+
+    def test_moved_topic_is_resequenced(self):
+        moved = self.topics[0]
+        moved.section = self.third
+        moved.save()
+
+        # The third section orders its topics by creation, the moved topic is the oldest
+        self.assertEqual([row[0] for row in self.order()], [topic.id for topic in self.topics[1:4] + [moved] + self.topics[4:]])
+        self.assertEqual(self.order()[3:], [
+            (moved.id, self.third.id, 2, 0), (self.topics[4].id, self.third.id, 2, 1), (self.topics[5].id, self.third.id, 2, 2),
+        ])
+        self.assertEqual(sequence.first_topic_after_section(self.topics[3]), moved)
+        self.assertIsNone(sequence.previous_topic(self.topics[1]))
+
+    def test_reordered_topics_are_resequenced(self):
+        received = []
+        sequence_rebuilt.connect(lambda **kwargs: received.append(kwargs), weak=False, dispatch_uid='test-sequence')
+        self.addCleanup(sequence_rebuilt.disconnect, dispatch_uid='test-sequence')
+        # Topics are ordered by creation time, put the second topic of the course first
+        Topic.objects.filter(pk=self.topics[1].pk).update(created_at=self.topics[0].created_at - timedelta(minutes=1))
+
+        sequence.rebuild_course_sequence(self.course.id)
+
+        self.assertEqual([row[0] for row in self.order()[:2]], [self.topics[1].id, self.topics[0].id])
+        self.assertEqual(received[0]['old_topics'][0], self.topics[0].id)
+        self.assertEqual(received[0]['new_positions'][self.topics[0].id], 1)
+        self.assertEqual(sequence.next_topic(self.topics[1]), self.topics[0])
+
+
+class CourseDetailCacheTests(TestCase):
+    """Visitors who are not enrolled get the public fragments from the cache."""
+
+    def setUp(self):
+        cache.clear()
+        self.course = create_course()
+        create_course('Go', self.course.category)
+        section = Section.objects.create(course=self.course, title='Basics')
+        Topic.objects.create(section=section, title='Intro')
+        self.user = create_learner()
+        Enrollment.objects.create(user=self.user, course=self.course)
+        self.url = reverse('course_detail', args=[self.course.id])
+
+    def test_warm_page_only_loads_the_course(self):
+        first = self.client.get(self.url).content.decode()
+        with self.assertNumQueries(1):
+            second = self.client.get(self.url).content.decode()
+        self.assertEqual(first, second)
+        self.assertIn('Intro', second)
+
+        Review.objects.create(course=self.course, user=self.user, rating=5, comment='Great start')
+        self.assertIn('Great start', self.client.get(self.url).content.decode())
+        Topic.objects.create(section=Section.objects.get(course=self.course), title='Loops')
+        self.assertIn('Loops', self.client.get(self.url).content.decode())
+
+
+class StudyPageQueryTests(SharedCacheMixin, TestCase):
+    """The study page costs the same few queries for a course of any size."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = create_learner()
+        self.client.force_login(self.user)
+
+    def add_course(self, section_count):
+        course = create_course(course_type=Course.LOCKED)
+        for topic in create_curriculum(course, sections=section_count, topics=3, content_type='quiz'):
+            Quiz.objects.create(topic=topic, name=topic.title.replace('Topic', 'Quiz'))
+        Enrollment.objects.create(user=self.user, course=course)
+        return course
+
+    def test_fifty_sections(self):
+        course = self.add_course(50)
+        url = reverse('study_course', args=[course.id])
+        self.client.get(url)  # Warms the outline and progress caches
 
-# Create your tests here.
+        # Session, user, enrollment with course and progress, the active topic with its quiz
+        with self.assertNumQueries(4):
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['curriculum']), 50)
+        self.assertEqual(response.context['quiz'].name, 'Quiz 0.0')
@@ -12,6 +12,7 @@ urlpatterns = [
     path('about', about, name='about'),
     # course list and detail views
     path('courses/', course_list, name='course_list'),
+    path('courses/autocomplete/', course_autocomplete, name='course_autocomplete'),
     path('course/<int:course_id>/', course_detail, name='course_detail'),
     path('course/study/<int:course_id>/', study, name='study_course'),
     # quiz tmp views 
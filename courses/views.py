@@ -12,11 +12,18 @@ from django.db.models import Q, Count, Avg
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
+from django.urls import reverse
 from django.utils import timezone
 
 from .models import Course, Chategory, Section, Topic
 from subscribtion.models import Enrollment, CourseProgress, SectionProgress, TopicProgress
-from utils import create_course_progress
+from subscribtion import activity
+from subscribtion.provisioning import ensure_course_progress
+from subscribtion.topic_store import store_for
+from subscribtion.completion import complete_topic
+from . import autocomplete, catalog, detail_cache, facets
+from .outline import get_outline
+from subscribtion.overlay import ProgressOverlay, get_overlay
 
 # Removed invalid line causing syntax errors
 from django.contrib import messages
@@ -34,81 +41,40 @@ def about(request):
 
 def course_list(request):
     """
-    View for listing all courses with filtering and search functionality
+    View for listing all courses with filtering and search functionality.
+    The page and the viewer's enrollment state come from a fixed number of queries.
     """
-    # Get all courses initially
-    courses = Course.objects.all().order_by('-created_at')
-    
-    # Search functionality
+    filters = catalog.catalog_filters(request.GET)
+    courses = catalog.filter_courses(filters)
     search_query = request.GET.get('search', '')
-    if search_query:
-        courses = courses.filter(
-            Q(title__icontains=search_query) | 
-            Q(description__icontains=search_query)
-        )
-    
-    # Category filter
     category_id = request.GET.get('category')
-    if category_id:
-        courses = courses.filter(category_id=category_id)
-    
-    # Course type filter
     course_type = request.GET.get('course_type')
-    if course_type in [Course.LOCKED, Course.MANAGED, Course.UNLOCKED]:
-        courses = courses.filter(course_type=course_type)
-    
-    # Course level filter
     course_level = request.GET.get('course_level')
-    if course_level in [Course.BEGINNER, Course.INTERMEDIATE, Course.ADVANCED, Course.GENERAL]:
-        courses = courses.filter(course_level=course_level)
-    
-    # Price range filter
     min_price = request.GET.get('min_price')
     max_price = request.GET.get('max_price')
-    
-    if min_price:
-        courses = courses.filter(price__gte=min_price)
-    if max_price:
-        courses = courses.filter(price__lte=max_price)
-    
-    # Get all categories for filter dropdown
-    categories = Chategory.objects.all()
-    
-    # Pagination
-    paginator = Paginator(courses, 12)  # Show 12 courses per page
-    page = request.GET.get('page')
-    
-    try:
-        courses_paginated = paginator.page(page)
-    except PageNotAnInteger:
-        # If page is not an integer, deliver first page.
-        courses_paginated = paginator.page(1)
-    except EmptyPage:
-        # If page is out of range, deliver last page of results.
-        courses_paginated = paginator.page(paginator.num_pages)
-    
-    # For logged in users, add enrollment status
-    if request.user.is_authenticated:
-        enrolled_courses = request.user.enrolled_courses.values_list('course_id', flat=True)
-        
-        # Add additional data for the template to use
-        for course in courses_paginated:
-            course.is_enrolled = course.id in enrolled_courses
-            
-            # If enrolled, get progress information
-            if course.is_enrolled:
-                enrollment = Enrollment.objects.get(user=request.user, course=course)
-                try:
-                    course.progress = enrollment.progress.progress_percentage
-                    course.completed = enrollment.progress.completed
-                except CourseProgress.DoesNotExist:
-                    course.progress = 0
-                    course.completed = False
-                
-                course.enrollment_status = enrollment.enrolement_status
+
+    # Filter dropdowns, with the number of courses each choice would list
+    counts = facets.facet_counts(filters)
+    categories = list(Chategory.objects.all())
+    for category in categories:
+        category.facet_count = counts['category'].get(category.id, 0)
+    course_type_facets = [(value, name, counts['course_type'].get(value, 0)) for value, name in Course.COURSE_TYPE_CHOICES]
+    course_level_facets = [(value, name, counts['course_level'].get(value, 0)) for value, name in Course.COURSE_LEVEL_CHOICES]
+    price_facets = [(key, label, counts['price'].get(key, 0)) for key, label, _, _ in facets.PRICE_BUCKETS]
+
+    # 12 courses per page, with enrollment state annotated for logged in users.
+    # Browsing pages with a cursor, search results are ranked and keep page numbers.
+    cursor_pagination = catalog.uses_cursor(filters) and 'page' not in request.GET
+    if cursor_pagination:
+        courses_paginated = catalog.cursor_page(courses, request.GET.get('cursor'), request.user)
+    else:
+        courses_paginated = catalog.catalog_page(courses, request.GET.get('page'), request.user)
+    if search_query:
+        catalog.attach_highlights(courses_paginated, search_query)
     
     context = {
         'courses': courses_paginated,
+        'cursor_pagination': cursor_pagination,
         'categories': categories,
         'search_query': search_query,
         'selected_category': category_id,
@@ -118,10 +84,31 @@ def course_list(request):
         'max_price': max_price,
         'course_type_choices': Course.COURSE_TYPE_CHOICES,
         'course_level_choices': Course.COURSE_LEVEL_CHOICES,
+        'course_type_facets': course_type_facets,
+        'course_level_facets': course_level_facets,
+        'price_facets': price_facets,
+        'sort_choices': catalog.SORT_CHOICES,
+        'selected_sort': filters['sort'],
     }
     
     return render(request, 'course_list.html', context)
 
+def course_autocomplete(request):
+    """
+    Search-as-you-type suggestions for the catalog, courses and categories
+    whose title has a word starting with ?q=. Served from the in-process
+    prefix index, without database queries.
+    """
+    query = request.GET.get('q', '')
+    results = []
+    for kind, item_id, label in autocomplete.index.lookup(query):
+        if kind == autocomplete.COURSE:
+            url = reverse('course_detail', args=[item_id])
+        else:
+            url = f"{reverse('course_list')}?category={item_id}"
+        results.append({'type': kind, 'id': item_id, 'label': label, 'url': url})
+    return JsonResponse({'query': query, 'results': results})
+
 # Update the course_detail view in courses/views.py to include related courses and reviews
 
 # In courses/views.py
@@ -131,8 +118,8 @@ def course_detail(request, course_id):
     View for showing detailed information about a specific course
     Enhanced with related courses and reviews
     """
-    course = get_object_or_404(Course, id=course_id)
-    sections = Section.objects.filter(course=course).order_by('created_at')
+    course = get_object_or_404(Course.objects.select_related('category'), id=course_id)
+    sections = get_outline(course)
     
     # --- THIS CALCULATION IS NOW HANDLED MORE INTELLIGENTLY BELOW ---
     # total_topics_count = Topic.objects.filter(section__course=course).count()
@@ -151,12 +138,11 @@ def course_detail(request, course_id):
         category=course.category
     ).exclude(id=course.id).order_by('-created_at')[:4]
     
-    reviews = Review.objects.filter(course=course)
-    avg_rating = reviews.aggregate(Avg('rating'))['rating__avg'] if reviews else None
-    
-    star_counts = {}
-    for i in range(1, 6):
-        star_counts[i] = reviews.filter(rating=i).count()
+    # Aggregates are stored on the course, see courses.ratings. The review list and
+    # related courses stay lazy, the template only evaluates them on a fragment cache miss
+    reviews = Review.objects.filter(course=course).select_related('user__his_profile')
+    avg_rating = course.average_rating if course.review_count else None
+    star_counts = course.rating_histogram
     
     context = {
         'course': course,
@@ -169,8 +155,11 @@ def course_detail(request, course_id):
         'reviews': reviews,
         'avg_rating': avg_rating,
         'star_counts': star_counts,
-        'total_reviews': reviews.count(),
+        'total_reviews': course.review_count,
         'can_review': False,
+        'fragment_timeout': detail_cache.FRAGMENT_TIMEOUT,
+        'detail_version': detail_cache.version(course.id),
+        'catalog_version': facets.version(),
     }
     
     if request.user.is_authenticated:
@@ -186,97 +175,50 @@ def course_detail(request, course_id):
             except Review.DoesNotExist:
                 pass
             
-            try:
-                course_progress = CourseProgress.objects.get(enrollment_model=enrollment)
-                context['course_progress'] = course_progress
-                
-                section_progress_dict = {
-                    sp.section_id: {
-                        'progress': sp.progress_percentage,
-                        'completed': sp.completed,
-                        'last_accessed': sp.last_accessed,
-                        'is_active': sp.is_active
-                    } for sp in SectionProgress.objects.filter(course_progress=course_progress)
-                }
-                context['section_progress'] = section_progress_dict
-                
-                topic_progress_dict = {
-                    tp.topic_id: {
-                        'completed': tp.completed,
-                        'last_accessed': tp.last_accessed,
-                        'is_active': tp.is_active
-                    } for tp in TopicProgress.objects.filter(section_progress__course_progress=course_progress)
-                }
-                context['topic_progress'] = topic_progress_dict
-                
-                # --- START OF THE FIX: INTELLIGENT PROGRESS CALCULATION ---
-                
-                # First, check if the course has any required topics
-                required_topics = Topic.objects.filter(section__course=course, is_required=True)
-                
-                if required_topics.exists():
-                    # If required topics exist, they are the ONLY basis for progress.
-                    total_progress_topics = required_topics.count()
-                    
-                    # Count how many of THESE required topics the user has completed.
-                    completed_progress_topics = TopicProgress.objects.filter(
-                        section_progress__course_progress=course_progress,
-                        topic__in=required_topics, # The key filter
-                        completed=True
-                    ).count()
-                    
-                else:
-                    # FALLBACK: If no topics are marked as required, calculate based on ALL topics.
-                    total_progress_topics = Topic.objects.filter(section__course=course).count()
-                    completed_progress_topics = TopicProgress.objects.filter(
-                        section_progress__course_progress=course_progress,
-                        completed=True
-                    ).count()
-
-                # Add the accurate counts and percentage to the context
-                context['total_progress_topics'] = total_progress_topics
-                context['completed_progress_topics'] = completed_progress_topics
-                
-                if total_progress_topics > 0:
-                    context['progress_percentage'] = (completed_progress_topics / total_progress_topics) * 100
-                else:
-                    # If course has no topics to track, check if it's marked complete
-                    context['progress_percentage'] = 100 if course_progress.completed else 0
+            # Only provisions when the enrollment predates the post_save receiver,
+            # a topic opened since the last activity flush is the resume pointer
+            course_progress = activity.merge_course(ensure_course_progress(enrollment))
+            context['course_progress'] = course_progress
+            
+            # The learner's progress merged onto the outline, cached per enrollment
+            context['curriculum'] = list(get_overlay(course_progress, sections).curriculum())
+            
+            # --- START OF THE FIX: INTELLIGENT PROGRESS CALCULATION ---
+            
+            # If the course has required topics they are the ONLY basis for progress,
+            # otherwise all topics are. Both are stored counters on the progress row.
+            if course_progress.required_topics_count:
+                total_progress_topics = course_progress.required_topics_count
+                completed_progress_topics = course_progress.completed_required_topics_count
+            else:
+                total_progress_topics = course_progress.total_topics_count
+                completed_progress_topics = course_progress.completed_topics_count
 
-                # --- END OF THE FIX ---
-                
-            except CourseProgress.DoesNotExist:
-                context['course_progress'] = None
-                create_course_progress(enrollment)
-                return redirect('course_detail', course_id=course_id)
+            # Add the accurate counts and percentage to the context
+            context['total_progress_topics'] = total_progress_topics
+            context['completed_progress_topics'] = completed_progress_topics
+            
+            if total_progress_topics > 0:
+                context['progress_percentage'] = (completed_progress_topics / total_progress_topics) * 100
+            else:
+                # If course has no topics to track, check if it's marked complete
+                context['progress_percentage'] = 100 if course_progress.completed else 0
+
+            # --- END OF THE FIX ---
         
         except Enrollment.DoesNotExist:
             context['enrollment'] = None
             context['is_enrolled'] = False
     
-    if request.user.is_authenticated and context['is_enrolled']:
-        if 'course_progress' in context and context['course_progress']:
-            last_section_progress = SectionProgress.objects.filter(
-                course_progress=context['course_progress'],
-                is_active=True
-            ).order_by('-last_accessed').first()
-            
-            if last_section_progress:
-                if last_section_progress.completed:
-                    next_sections = SectionProgress.objects.filter(
-                        course_progress=context['course_progress'],
-                        is_active=True,
-                        completed=False
-                    ).order_by('section__created_at')
-                    context['next_section'] = next_sections.first().section if next_sections.exists() else None
-                else:
-                    context['next_section'] = last_section_progress.section
-            else:
-                first_section_progress = SectionProgress.objects.filter(
-                    course_progress=context['course_progress'],
-                    is_active=True
-                ).order_by('section__created_at').first()
-                context['next_section'] = first_section_progress.section if first_section_progress else None
+    if context['is_enrolled']:
+        # Resume in the section of the resume pointer, or the first open one before there is one
+        resume_section_id = context['course_progress'].resume_section_id
+        resume = next((entry for entry in context['curriculum'] if entry.section.id == resume_section_id), None)
+        if resume is None:
+            resume = next((entry for entry in context['curriculum'] if entry.is_active and not entry.completed), None)
+        context['next_section'] = resume.section if resume else None
+    else:
+        context['curriculum'] = list(ProgressOverlay.blank(sections).curriculum())
     
     return render(request, 'course_detail.html', context)
 
@@ -286,7 +228,7 @@ def topic_view(request, topic_id):
     View function for displaying a topic's content and tracking progress.
     """
     # Get the topic
-    topic = get_object_or_404(Topic, id=topic_id)
+    topic = get_object_or_404(Topic.objects.select_related('section__course'), id=topic_id)
     section = topic.section
     course = section.course
     
@@ -297,19 +239,15 @@ def topic_view(request, topic_id):
         messages.error(request, "You are not enrolled in this course.")
         return redirect('course_detail', course_id=course.id)
     
-    # Get the topic progress
+    # Get the topic progress, whatever the progress storage mode
     try:
         course_progress = CourseProgress.objects.get(enrollment_model=enrollment)
-        section_progress = SectionProgress.objects.get(course_progress=course_progress, section=section)
-        topic_progress, created = TopicProgress.objects.get_or_create(
-            section_progress=section_progress,
-            topic=topic,
-            defaults={
-                'completed': False,
-                'is_active': True
-            }
-        )
-    except (CourseProgress.DoesNotExist, SectionProgress.DoesNotExist):
+    except CourseProgress.DoesNotExist:
+        messages.error(request, "Error loading progress information. Please contact support.")
+        return redirect('course_detail', course_id=course.id)
+    store = store_for(course_progress)
+    topic_progress = store.load([topic.id]).get(topic.id)
+    if topic_progress is None:
         messages.error(request, "Error loading progress information. Please contact support.")
         return redirect('course_detail', course_id=course.id)
     
@@ -318,29 +256,17 @@ def topic_view(request, topic_id):
         messages.error(request, "This topic is not yet available. Please complete previous topics first.")
         return redirect('course_detail', course_id=course.id)
     
-    # Update last accessed timestamp
-    topic_progress.save()  # This updates the last_accessed field via auto_now
-    
-    # Get next and previous topics for navigation
-    prev_topic = Topic.objects.filter(
-        section=section,
-        created_at__lt=topic.created_at
-    ).order_by('-created_at').first()
-    
-    next_topic = Topic.objects.filter(
-        section=section,
-        created_at__gt=topic.created_at
-    ).order_by('created_at').first()
+    # Buffer the last accessed timestamp, sparse enrollments still write the row
+    # of a topic opened for the first time. Continue here next time.
+    if topic_progress.pk is None:
+        store.touch(topic_progress)
+    activity.record_access(course_progress, topic.id, section.id, resume=True)
     
-    # If no next topic in this section, check next section
-    if not next_topic:
-        next_section = Section.objects.filter(
-            course=course,
-            created_at__gt=section.created_at
-        ).order_by('created_at').first()
-        
-        if next_section:
-            next_topic = Topic.objects.filter(section=next_section).order_by('created_at').first()
+    # Get next and previous topics for navigation from the cached course outline,
+    # these cross section boundaries without extra lookups
+    outline = get_outline(course)
+    prev_topic = outline.previous_topic(topic.id)
+    next_topic = outline.next_topic(topic.id)
     
     # Prepare context
     context = {
@@ -355,6 +281,7 @@ def topic_view(request, topic_id):
     
     # Return appropriate template based on content type
     if topic.content_type == 'video':
+        context['watch_position'] = activity.watch_position(course_progress, topic.id)
         return render(request, 'topic_video.html', context)
     elif topic.content_type == 'article':
         return render(request, 'topic_article.html', context)
@@ -372,49 +299,62 @@ def study(request, course_id):
     Main view for studying a course.
     This version generates a secure, time-limited token for video playback.
     """
-    course = get_object_or_404(Course, id=course_id)
-    
+    # The course and the progress row come along with the enrollment, the outline
+    # and the progress overlay come from the cache, so a warm page costs a fixed
+    # handful of queries whatever the size of the course
     try:
-        enrollment = Enrollment.objects.get(user=request.user, course=course)
+        enrollment = Enrollment.objects.select_related('course', 'progress').get(user=request.user, course_id=course_id)
         if enrollment.completed_at:
             messages.info(request, "You have already completed this course.")
     except Enrollment.DoesNotExist:
+        get_object_or_404(Course, id=course_id)
         messages.error(request, "You need to enroll in this course first.")
         return redirect('course_detail', course_id=course_id)
+    course = enrollment.course
     
     try:
-        course_progress = CourseProgress.objects.get(enrollment_model=enrollment)
+        course_progress = enrollment.progress
     except CourseProgress.DoesNotExist:
-        course_progress = create_course_progress(enrollment)
+        course_progress = ensure_course_progress(enrollment)
     
-    sections = Section.objects.filter(course=course).order_by('created_at')
+    sections = get_outline(course)
     
-    section_progress_dict = {sp.section_id: sp for sp in SectionProgress.objects.filter(course_progress=course_progress)}
-    topic_progress_dict = {tp.topic_id: tp for tp in TopicProgress.objects.filter(section_progress__course_progress=course_progress)}
+    progress = get_overlay(course_progress, sections)
     
     active_topic = None
     requested_topic_id = request.GET.get('topic_id')
     if requested_topic_id:
         try:
-            active_topic = Topic.objects.get(id=requested_topic_id, section__course=course)
-            topic_progress = topic_progress_dict.get(int(requested_topic_id))
-            if course.course_type == 'locked' and not (topic_progress and topic_progress.is_active):
-                 messages.error(request, "This topic is not yet available.")
-                 active_topic = None
-        except (Topic.DoesNotExist, ValueError):
+            active_topic = sections.topic(int(requested_topic_id))
+        except ValueError:
+            pass
+        if active_topic is None:
             messages.error(request, "Topic not found.")
+        elif course.course_type == 'locked' and not progress.topic_state(active_topic.id).is_active:
+             messages.error(request, "This topic is not yet available.")
+             active_topic = None
             
     if not active_topic:
-        for section in sections:
-            if section_progress_dict.get(section.id) and section_progress_dict.get(section.id).is_active:
-                for topic in section.topics.all().order_by('created_at'):
-                    if topic_progress_dict.get(topic.id) and topic_progress_dict.get(topic.id).is_active:
-                        active_topic = topic
-                        break
-                if active_topic:
-                    break
+        # Continue where the learner left off, enrollments without a pointer yet
+        # start at the first active topic
+        activity.merge_course(course_progress)
+        resume = progress.topic_state(course_progress.resume_topic_id)
+        if resume and (resume.is_active or course.course_type != 'locked'):
+            active_topic = resume.topic
+        else:
+            active_topic = progress.first_active_topic()
+
+    # The outline only has the sidebar fields, load the content of the topic shown
+    # and, when the outline says it has one, its quiz
+    has_quiz = bool(active_topic and active_topic.has_quiz)
+    if active_topic:
+        # An opened topic becomes the resume pointer, buffered with the access
+        activity.record_access(course_progress, active_topic.id, active_topic.section_id, resume=bool(requested_topic_id))
+        topics = Topic.objects.select_related('quizz') if has_quiz else Topic.objects.all()
+        active_topic = topics.get(id=active_topic.id)
 
     video_token = None
+    watch_position = 0
     if active_topic and active_topic.content_type == 'video':
         token = secrets.token_urlsafe(16)
         request.session['video_token_data'] = {
@@ -422,18 +362,21 @@ def study(request, course_id):
             'expires': time.time() + 10  # Expires in 10 seconds
         }
         video_token = token
+        # The player continues where the last heartbeat left it
+        watch_position = activity.watch_position(course_progress, active_topic.id)
 
     context = {
         'course': course,
         'enrollment': enrollment,
         'sections': sections,
-        'section_progress': section_progress_dict,
-        'topic_progress': topic_progress_dict,
+        'curriculum': list(progress.curriculum()),
         'active_topic': active_topic,
+        'active_topic_state': progress.topic_state(active_topic.id) if active_topic else None,
         'course_progress': course_progress,
         'video_token': video_token,
-        'has_quiz': hasattr(active_topic, 'quizz') if active_topic else False,
-        'quiz': getattr(active_topic, 'quizz', None) if active_topic else None,
+        'watch_position': watch_position,
+        'has_quiz': has_quiz,
+        'quiz': getattr(active_topic, 'quizz', None) if has_quiz else None,
     }
     
     return render(request, 'study.html', context)
@@ -444,7 +387,6 @@ def study(request, course_id):
 
 
 from django.views.decorators.http import require_GET, require_POST
-from utils import activate_next_topic
 @login_required
 @require_POST
 def clear_quiz_redirect(request):
@@ -652,67 +594,18 @@ def quiz_results(request, attempt_id):
         if quiz_attempt.is_passed:
             try:
                 enrollment = Enrollment.objects.get(user=request.user, course=course)
-                course_progress = CourseProgress.objects.get(enrollment_model=enrollment)
-                section_progress = SectionProgress.objects.get(course_progress=course_progress, section=topic.section)
-                topic_progress = TopicProgress.objects.get(section_progress=section_progress, topic=topic)
                 
-                # Mark the quiz's topic as complete if not already
-                if not topic_progress.completed:
-                    topic_progress.completed = True
-                    topic_progress.save()
+                # Mark the quiz's topic as complete if not already. The engine keeps
+                # the stored counters in sync, unlocks the next topic and finalizes
+                # the course when the last required content is done.
+                completion = complete_topic(enrollment, topic, enforce_lock=False)
+                if completion.completed_topic_ids:
                     messages.success(request, f"Congratulations! You passed the quiz and completed the topic '{topic.title}'.")
-                    
-                    # Call the utility function to activate the next topic
-                    from utils import activate_next_topic
-                    activate_next_topic(topic_progress)
-                
-                # --- START OF THE CRITICAL FIX ---
-                # After passing the quiz, we must perform the SAME final course completion check
-                # that exists in the `mark_topic_as_completed` view. This logic was missing.
-
-                course_completed = False
-                # Only check for completion if the enrollment isn't already finalized
-                if not enrollment.completed_at:
-                    required_sections = Section.objects.filter(course=course, is_required=True)
-                    if required_sections.exists():
-                        completed_required_sections_count = SectionProgress.objects.filter(
-                            course_progress=course_progress, section__in=required_sections, completed=True).count()
-                        if completed_required_sections_count >= required_sections.count():
-                            course_completed = True
-                    else:
-                        all_sections_count = Section.objects.filter(course=course).count()
-                        completed_sections_count = SectionProgress.objects.filter(
-                            course_progress=course_progress, completed=True).count()
-                        if all_sections_count > 0 and completed_sections_count >= all_sections_count:
-                            course_completed = True
-
-                # If the course is now complete, finalize everything.
-                if course_completed:
-                    course_progress.completed = True
-                    course_progress.progress_percentage = 100
-                    # Only update timestamp and show message once
-                    if not enrollment.completed_at:
-                        enrollment.completed_at = timezone.now()
-                        enrollment.save()
-                        messages.success(request, f"Congratulations! You have completed the course '{course.title}'!")
-                else:
-                    # If not complete, just recalculate the percentage
-                    all_required_topics = Topic.objects.filter(section__course=course, is_required=True)
-                    if all_required_topics.exists():
-                        total_count = all_required_topics.count()
-                        completed_count = TopicProgress.objects.filter(section_progress__course_progress=course_progress, topic__in=all_required_topics, completed=True).count()
-                    else:
-                        total_count = Topic.objects.filter(section__course=course).count()
-                        completed_count = TopicProgress.objects.filter(section_progress__course_progress=course_progress, completed=True).count()
-                    course_progress.progress_percentage = (completed_count / total_count) * 100 if total_count > 0 else 100
                 
-                # Save the final, correct state of the course progress
-                course_progress.save()
-
-                # --- END OF THE CRITICAL FIX ---
+                if completion.course_just_completed:
+                    messages.success(request, f"Congratulations! You have completed the course '{course.title}'!")
 
-            except (Enrollment.DoesNotExist, CourseProgress.DoesNotExist, 
-                   SectionProgress.DoesNotExist, TopicProgress.DoesNotExist):
+            except Enrollment.DoesNotExist:
                 messages.warning(request, "Quiz passed, but topic progress could not be updated.")
     
     # This part remains the same
@@ -0,0 +1,118 @@
+"""
+Cache helper for hot, expensive values: stale-while-revalidate plus single flight.
+
+get_or_compute() stores the value together with the moment it goes stale, and
+keeps it in the cache for `stale_ttl` more seconds. A stale value is served
+while the one caller that wins a short cross-process lock (cache.add) computes
+the next one. A missing value is computed once per process however many
+threads ask for it at the same time, and other processes wait briefly for the
+lock holder before computing it themselves.
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.core.cache import cache
+
+# Seconds a value stays servable after it went stale
+DEFAULT_STALE_TTL = 60
+# Seconds the cross-process recompute lock lives, and waiters wait for it
+LOCK_TIMEOUT = 10
+LOCK_POLL_INTERVAL = 0.05
+
+# Process-wide hit / miss / stale counters per key prefix (the text before the first ':')
+cache_stats = defaultdict(Counter)
+
+_stats_lock = threading.Lock()
+_flights_lock = threading.Lock()
+_flights = {}
+
+
+class _Flight:
+    """One in-process computation of a key, shared by every thread that missed it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.failed = False
+
+
+def _record(key, outcome):
+    with _stats_lock:
+        cache_stats[key.split(':', 1)[0]][outcome] += 1
+
+
+def _lock_key(key):
+    return f'{key}:refresh-lock'
+
+
+def _store(key, compute, timeout, stale_ttl):
+    value = compute()
+    cache.set(key, (value, time.time() + timeout), timeout + stale_ttl)
+    return value
+
+
+def _compute_once(key, compute, timeout, stale_ttl):
+    """Compute a missing value, or wait for the process already computing it."""
+    lock_key = _lock_key(key)
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            return _store(key, compute, timeout, stale_ttl)
+        finally:
+            cache.delete(lock_key)
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        envelope = cache.get(key)
+        if envelope is not None:
+            return envelope[0]
+        if cache.get(lock_key) is None:
+            break
+    # The lock holder gave up or died, compute it ourselves
+    return _store(key, compute, timeout, stale_ttl)
+
+
+def _single_flight(key, compute, timeout, stale_ttl):
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    if not leader:
+        if flight.done.wait(LOCK_TIMEOUT) and not flight.failed:
+            return flight.value
+        return _store(key, compute, timeout, stale_ttl)
+    try:
+        flight.value = _compute_once(key, compute, timeout, stale_ttl)
+        return flight.value
+    except BaseException:
+        flight.failed = True
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def get_or_compute(key, compute, timeout, stale_ttl=DEFAULT_STALE_TTL):
+    """
+    The cached value of `key`, calling `compute()` when it is missing or stale.
+    Values are fresh for `timeout` seconds, then served stale for up to
+    `stale_ttl` seconds while a single caller refreshes them.
+    """
+    envelope = cache.get(key)
+    if envelope is not None:
+        value, fresh_until = envelope
+        if time.time() < fresh_until:
+            _record(key, 'hit')
+            return value
+        _record(key, 'stale')
+        lock_key = _lock_key(key)
+        if cache.add(lock_key, 1, LOCK_TIMEOUT):
+            try:
+                return _store(key, compute, timeout, stale_ttl)
+            finally:
+                cache.delete(lock_key)
+        return value
+    _record(key, 'miss')
+    return _single_flight(key, compute, timeout, stale_ttl)
@@ -0,0 +1,151 @@
+"""
+HTTP Range requests (RFC 9110) for files served through Django views.
+
+Video players seek by requesting byte ranges. ranged_file_response() answers
+a satisfiable Range header with 206 Partial Content, several ranges with a
+multipart/byteranges body, and ranges wholly past the end of the file with
+416. Range headers it cannot parse, or with more than MAX_RANGES ranges, are
+ignored and the whole file is sent, as the RFC allows. An If-Range validator
+that no longer matches the file (its ETag or Last-Modified) also gets the
+whole file. Bodies are streamed from the requested offset in chunks of
+CHUNK_SIZE bytes, so a seek never reads the start of the file.
+"""
+import os
+import re
+import secrets
+
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+# Bytes read from the file per chunk of a streamed body
+CHUNK_SIZE = 64 * 1024
+# More ranges than this in one request are ignored, the whole file is sent
+MAX_RANGES = 16
+
+_RANGE_SPEC = re.compile(r'^(\d*)-(\d*)$')
+
+
+def parse_range_header(header, size):
+    """
+    The byte ranges of a Range header for a file of `size` bytes, as sorted,
+    merged (start, end) pairs with inclusive ends. None when the header is
+    missing or invalid and should be ignored, [] when no range is satisfiable.
+    """
+    if not header:
+        return None
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+    specs = [spec.strip() for spec in specs.split(',') if spec.strip()]
+    if not specs or len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        match = _RANGE_SPEC.match(spec)
+        if not match or match.groups() == ('', ''):
+            return None
+        first, last = match.groups()
+        if not first:
+            # Suffix range: the last `last` bytes
+            if int(last) and size:
+                ranges.append((max(0, size - int(last)), size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start < size:
+            ranges.append((start, min(int(last), size - 1) if last else size - 1))
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _etag(stat):
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _if_range_matches(request, stat):
+    """Whether the If-Range validator, if any, still describes the file."""
+    validator = request.META.get('HTTP_IF_RANGE')
+    if not validator:
+        return True
+    if validator.startswith('"'):
+        # Only strong entity tags match, weak ones (W/"...") never do
+        return validator == _etag(stat)
+    return parse_http_date_safe(validator) == int(stat.st_mtime)
+
+
+def _read(file, start, end):
+    file.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        chunk = file.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            return
+        remaining -= len(chunk)
+        yield chunk
+
+
+def _stream_range(path, start, end):
+    with open(path, 'rb') as file:
+        yield from _read(file, start, end)
+
+
+def _part_head(boundary, content_type, start, end, size):
+    return (
+        f'--{boundary}\r\n'
+        f'Content-Type: {content_type}\r\n'
+        f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+    ).encode('ascii')
+
+
+def _stream_parts(path, parts, closing):
+    with open(path, 'rb') as file:
+        for head, (start, end) in parts:
+            yield head
+            yield from _read(file, start, end)
+    yield closing
+
+
+def ranged_file_response(request, path, content_type):
+    """A response serving the file at `path`, or the byte ranges of it the request asks for."""
+    stat = os.stat(path)
+    size = stat.st_size
+    ranges = None
+    if request.method in ('GET', 'HEAD') and _if_range_matches(request, stat):
+        ranges = parse_range_header(request.META.get('HTTP_RANGE'), size)
+
+    if ranges is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    elif not ranges:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(_stream_range(path, start, end), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    else:
+        boundary = secrets.token_hex(16)
+        parts = [
+            ((b'\r\n' if index else b'') + _part_head(boundary, content_type, start, end, size), (start, end))
+            for index, (start, end) in enumerate(ranges)
+        ]
+        closing = f'\r\n--{boundary}--\r\n'.encode('ascii')
+        length = sum(len(head) + end - start + 1 for head, (start, end) in parts) + len(closing)
+        response = StreamingHttpResponse(
+            _stream_parts(path, parts, closing), status=206,
+            content_type=f'multipart/byteranges; boundary={boundary}',
+        )
+        response['Content-Length'] = length
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = _etag(stat)
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
@@ -155,6 +155,19 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Storage of per-topic progress for new enrollments: 'rows' (one TopicProgress
+# row per topic), 'sparse' (rows created when a topic is first opened or
+# unlocked) or 'bitmap' (two bitsets on the CourseProgress row)
+PROGRESS_STORAGE = os.getenv('PROGRESS_STORAGE', 'rows')
+
+# Share of a video (0-1) a learner must have reached for the player heartbeat
+# to complete its topic
+VIDEO_COMPLETION_THRESHOLD = float(os.getenv('VIDEO_COMPLETION_THRESHOLD', '0.9'))
+
+# Dotted path of a courses.search.SearchBackend, empty picks FTS5 on SQLite
+# and LIKE matching on other databases
+COURSE_SEARCH_BACKEND = os.getenv('COURSE_SEARCH_BACKEND', '')
+
 # Authentication
 AUTH_USER_MODEL = "accounts.User"
 
@@ -201,8 +214,34 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# Process-local cache unless CACHE_URL names a Redis server. Web and Celery
+# worker processes must share the cache for the activity buffer
+# (subscribtion.activity) to be flushed, with a local cache accesses are
+# written directly instead, see the subscribtion.W001 deploy check.
+CACHE_URL = os.getenv('CACHE_URL')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+
 # Celery Beat Configuration
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    # Requeue curriculum propagation runs lost by the broker or a dead worker
+    'resume-progress-syncs': {
+        'task': 'subscribtion.tasks.resume_progress_syncs',
+        'schedule': 300.0,
+    },
+    # Write the buffered last accessed timestamps (subscribtion.activity), needs
+    # a cache shared by web and worker processes
+    'flush-activity': {
+        'task': 'subscribtion.tasks.flush_activity',
+        'schedule': 60.0,
+    },
+}
 
 # ASGI configuration
 ASGI_APPLICATION = 'learning_platform.asgi.application'
@@ -0,0 +1,57 @@
+"""
+Fixture builders shared by the tests of every app: a course in a category,
+its curriculum of sections and topics, and learners. SharedCacheMixin runs a
+test case against a cache shared between cache instances, as Redis is in
+production.
+"""
+import shutil
+import tempfile
+
+from django.test import override_settings
+
+from accounts.models import User
+from courses.models import Chategory, Course, Section, Topic
+
+
+def create_course(title='Python', category=None, **fields):
+    """A free course, in a new 'Programming' category unless one is given."""
+    if category is None:
+        category = Chategory.objects.create(name='Programming', description='')
+    fields.setdefault('description', '')
+    fields.setdefault('image', 'courses/python.png')
+    fields.setdefault('price', 0)
+    return Course.objects.create(title=title, category=category, **fields)
+
+
+def create_curriculum(course, sections=1, topics=2, **topic_fields):
+    """
+    `sections` sections of `topics` topics each, titled 'Section i' and
+    'Topic i.j'. Returns the topics in course order.
+    """
+    created = []
+    for i in range(sections):
+        section = Section.objects.create(course=course, title=f'Section {i}')
+        created += [Topic.objects.create(section=section, title=f'Topic {i}.{j}', **topic_fields) for j in range(topics)]
+    return created
+
+
+def create_learner(username='learner'):
+    return User.objects.create_user(email=f'{username}@example.com', password='pass', username=username)
+
+
+class SharedCacheMixin:
+    """
+    Run the tests of a case with a file cache, which cache instances share
+    like the web and worker processes share Redis. The local memory default
+    is private to each instance, it turns the activity buffer off.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        location = tempfile.mkdtemp(prefix='learning-platform-cache-')
+        cls.addClassCleanup(shutil.rmtree, location, ignore_errors=True)
+        cls.enterClassContext(override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': location,
+        }}))
+        super().setUpClass()
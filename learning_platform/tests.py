@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils.http import http_date
+
+from courses.models import Topic
+from learning_platform import caching
+from learning_platform.ranges import parse_range_header
+from learning_platform.testing import create_course, create_curriculum, create_learner
+from subscribtion.models import Enrollment
+
+
+class GetOrComputeTests(SimpleTestCase):
+    """Expired hot keys are recomputed once, stale values are served meanwhile."""
+
+    def setUp(self):
+        cache.clear()
+        caching.cache_stats.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        time.sleep(0.05)
+        return self.calls
+
+    def test_concurrent_misses_compute_once(self):
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(caching.get_or_compute('hot:key', self.compute, 60)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual((self.calls, results), (1, [1] * 8))
+        self.assertEqual(caching.get_or_compute('hot:key', self.compute, 60), 1)
+        stats = caching.cache_stats['hot']
+        self.assertEqual(stats['miss'] + stats['hit'], 9)
+
+    def test_stale_value_is_served_while_another_worker_refreshes(self):
+        caching.get_or_compute('hot:key', self.compute, 0)
+
+        cache.add('hot:key:refresh-lock', 1)  # Another worker is refreshing
+        self.assertEqual(caching.get_or_compute('hot:key', self.compute, 0), 1)
+        cache.delete('hot:key:refresh-lock')
+        self.assertEqual(caching.get_or_compute('hot:key', self.compute, 60), 2)
+        self.assertEqual(caching.cache_stats['hot'], {'miss': 1, 'stale': 2})
+
+
+class ProtectedMediaRangeTests(TestCase):
+    """Videos are served in byte ranges, as players request them when seeking."""
+
+    VIDEO = 'topics/videos/2025-04-03_05-49-19.mp4'
+
+    def setUp(self):
+        course = create_course()
+        create_curriculum(course, topics=1, content_type='video', VIDEO_CINTETN_FILE=self.VIDEO)
+        user = create_learner()
+        Enrollment.objects.create(user=user, course=course)
+        self.client.force_login(user)
+        session = self.client.session
+        session['video_token_data'] = {'token': 'secret', 'expires': time.time() + 60}
+        session.save()
+
+        self.path = os.path.join(settings.MEDIA_ROOT, self.VIDEO)
+        with open(self.path, 'rb') as video:
+            self.data = video.read()
+        self.size = len(self.data)
+
+    def get(self, **headers):
+        url = reverse('protected_media', kwargs={'path': self.VIDEO})
+        return self.client.get(url, {'token': 'secret'}, headers=headers)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_parse_range_header(self):
+        self.assertIsNone(parse_range_header('', 100))
+        self.assertIsNone(parse_range_header('bytes=5-1', 100))
+        self.assertIsNone(parse_range_header('items=0-1', 100))
+        self.assertEqual(parse_range_header('bytes=0-9, 5-19, 50-', 100), [(0, 19), (50, 99)])
+        self.assertEqual(parse_range_header('bytes=-10', 100), [(90, 99)])
+        self.assertEqual(parse_range_header('bytes=100-, -0', 100), [])
+
+    def test_whole_file_without_range(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(self.body(response), self.data)
+        self.assertEqual(self.get(Range='bytes=oops').status_code, 200)
+
+    def test_single_range(self):
+        for header, start, end in [
+            ('bytes=100-199', 100, 199), ('bytes=-500', self.size - 500, self.size - 1),
+            (f'bytes={self.size - 10}-{self.size + 10}', self.size - 10, self.size - 1),
+        ]:
+            response = self.get(Range=header)
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{self.size}')
+            self.assertEqual(int(response['Content-Length']), end - start + 1)
+            self.assertEqual(self.body(response), self.data[start:end + 1])
+
+    def test_multiple_ranges(self):
+        response = self.get(Range='bytes=0-9,1000-1099')
+        self.assertEqual(response.status_code, 206)
+        boundary = response['Content-Type'].split('boundary=')[1]
+        body = self.body(response)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        parts = body.split(f'--{boundary}'.encode())
+        self.assertEqual(parts[-1], b'--\r\n')
+        self.assertEqual(
+            [part.split(b'\r\n\r\n', 1)[1].removesuffix(b'\r\n') for part in parts[1:-1]],
+            [self.data[:10], self.data[1000:1100]],
+        )
+        self.assertIn(f'Content-Range: bytes 1000-1099/{self.size}'.encode(), parts[2])
+
+    def test_unsatisfiable_range(self):
+        response = self.get(Range=f'bytes={self.size}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{self.size}')
+
+    def test_if_range(self):
+        etag = self.get()['ETag']
+        self.assertEqual(self.get(Range='bytes=0-9', If_Range=etag).status_code, 206)
+        modified = http_date(os.stat(self.path).st_mtime)
+        self.assertEqual(self.get(Range='bytes=0-9', If_Range=modified).status_code, 206)
+        response = self.get(Range='bytes=0-9', If_Range='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.data)
+
+    def test_missing_or_escaping_file_is_not_found(self):
+        Topic.objects.update(VIDEO_CINTETN_FILE='topics/videos/missing.mp4')
+        for path in ('topics/videos/missing.mp4', 'topics/videos/../../../missing.mp4'):
+            url = reverse('protected_media', kwargs={'path': path})
+            response = self.client.get(url, {'token': 'secret'})
+            self.assertEqual(response.status_code, 404)
+            self.assertNotIn(b'No such file', response.content)
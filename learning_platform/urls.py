@@ -11,6 +11,8 @@ urlpatterns = [
     path('accounts/', include('accounts.urls')),  # Template-based auth
     
     path('api/v1/auth/', include('accounts.api_urls')),  # API-based auth
+    path('api/v1/progress/', include('subscribtion.api_urls')),  # progress sync
+    path('api/v1/courses/', include('courses.api_urls')),  # catalog
 
     # apps
     path('', include('courses.urls')),
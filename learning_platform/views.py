@@ -1,10 +1,13 @@
-from django.http import HttpResponse, FileResponse, HttpResponseForbidden
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils._os import safe_join
 from django.views.static import serve
 from django.conf import settings
-import os
 import time
 import secrets
 
+from .ranges import ranged_file_response
+
 def protected_media_view(request, path):
     """
     This is the FINAL, CORRECTED version. It fixes the video loading bug by
@@ -51,22 +54,23 @@ def protected_media_view(request, path):
         video_filename = path_parts[-1]
         
         from courses.models import Topic
+        topic = Topic.objects.filter(VIDEO_CINTETN_FILE__contains=video_filename).first()
+        if not topic:
+            return HttpResponse('Content not found.', status=404)
+
+        from subscribtion.models import Enrollment
+        is_enrolled = Enrollment.objects.filter(user=request.user, course=topic.section.course).exists()
+        if not (is_enrolled or request.user.is_staff):
+            return HttpResponse('Not enrolled in this course.', status=403)
+
         try:
-            topic = Topic.objects.filter(VIDEO_CINTETN_FILE__contains=video_filename).first()
-            if topic:
-                from subscribtion.models import Enrollment
-                is_enrolled = Enrollment.objects.filter(user=request.user, course=topic.section.course).exists()
-                if is_enrolled or request.user.is_staff:
-                    response = FileResponse(open(os.path.join(settings.MEDIA_ROOT, path), 'rb'), content_type='video/mp4')
-                    response['Accept-Ranges'] = 'bytes' # For seeking
-                    response['Content-Disposition'] = 'inline'
-                    return response
-                else:
-                    return HttpResponse('Not enrolled in this course.', status=403)
-            else:
-                return HttpResponse('Content not found.', status=404)
-        except Exception as e:
-            return HttpResponse(f'An error occurred: {str(e)}', status=500)
+            # Seeking players ask for byte ranges, answered with 206 Partial Content
+            response = ranged_file_response(request, safe_join(settings.MEDIA_ROOT, path), 'video/mp4')
+        except (SuspiciousFileOperation, FileNotFoundError, IsADirectoryError):
+            # A path escaping MEDIA_ROOT gets the same answer as a missing file
+            raise Http404('Content not found.')
+        response['Content-Disposition'] = 'inline'
+        return response
     
     # Default deny
     return HttpResponse('Access denied.', status=403)
\ No newline at end of file
@@ -4,6 +4,7 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import user_passes_test
 from django.contrib import messages
 from courses.models import Course, Section, Topic, Quiz, Question, Answer
+from courses.outline import get_outline
 from .forms import *
 
 # Helper to check if user is an admin
@@ -42,7 +43,7 @@ def manage_course(request, pk):
     It handles both updating the course and listing its sections.
     """
     course = get_object_or_404(Course, pk=pk)
-    sections = Section.objects.filter(course=course).order_by('created_at')
+    sections = get_outline(course)
     
     if request.method == 'POST':
         form = CourseForm(request.POST, request.FILES, instance=course)
@@ -83,7 +84,7 @@ def section_create(request, course_pk):
             section = form.save(commit=False)
             section.course = course
             section.save()
-            messages.success(request, f'Section "{section.title}" created.')
+            messages.success(request, f'Section "{section.title}" created. Enrolled students are updated in the background.')
             return redirect('management:manage_course', pk=course.pk)
     else:
         print('2')
@@ -123,7 +124,7 @@ def section_delete(request, pk):
     if request.method == 'POST':
         section_title = section.title
         section.delete()
-        messages.success(request, f'Section "{section_title}" was deleted.')
+        messages.success(request, f'Section "{section_title}" was deleted. Enrolled students are updated in the background.')
         return redirect('management:manage_course', pk=course_pk)
     return render(request, 'management/confirm_delete.html', {'object': section, 'type': 'Section', 'parent_pk': course_pk, 'parent_url_name': 'manage_course'})
 
@@ -138,7 +139,7 @@ def topic_create(request, section_pk):
             topic = form.save(commit=False)
             topic.section = section
             topic.save()
-            messages.success(request, f'Topic "{topic.title}" created.')
+            messages.success(request, f'Topic "{topic.title}" created. Enrolled students are updated in the background.')
             return redirect('management:manage_section', pk=section.pk)
     else:
         form = TopicForm()
@@ -164,7 +165,7 @@ def topic_delete(request, pk):
     if request.method == 'POST':
         topic_title = topic.title
         topic.delete()
-        messages.success(request, f'Topic "{topic_title}" was deleted.')
+        messages.success(request, f'Topic "{topic_title}" was deleted. Enrolled students are updated in the background.')
         return redirect('management:manage_section', pk=section_pk)
     return render(request, 'management/confirm_delete.html', {'object': topic, 'type': 'Topic', 'parent_pk': section_pk, 'parent_url_name': 'manage_section'})
 
@@ -0,0 +1,364 @@
+"""
+Write-behind buffer of "last accessed" timestamps.
+
+Opening a topic used to save its TopicProgress (and, in bitmap mode, the
+CourseProgress row) only to bump an auto_now field. record_access() keeps
+every timestamp in a cache entry of its own instead, one per (kind, id) item
+written with one set_many(), so concurrent requests of an enrollment (a topic
+opened while a video heartbeat arrives) never overwrite each other's items.
+The first write of an item lists it under the enrollment and the first item
+of an enrollment queues it, both in logs numbered by cache.incr() and
+guarded by cache.add(). flush(), run by Celery beat
+(subscribtion.tasks.flush_activity), drains the log and writes the buffered
+timestamps back with a few bulk UPDATEs. Readers that show last accessed
+times merge the buffered values with merge_course() and merge_states().
+
+Opening a topic also makes it the resume pointer of the enrollment, where
+"continue learning" links lead. record_access(resume=True) buffers it with
+the access and merge_course() shows it before the flush. A buffered pointer
+is only written when it is newer than the stored last_accessed, so it never
+overrides a pointer the completion engine moved after the access.
+
+Video players post a heartbeat every few seconds, record_position() keeps the
+latest position per topic in the same buffer, so however many heartbeats an
+enrollment sends between two flushes it costs one WatchPosition upsert.
+
+Buffers and logs belong to a generation. Each flush() starts a new one for
+the writers and drains the generations closed by an earlier flush, so a
+buffer is only read once no request has written to it for a whole flush
+interval, and nothing written while a flush runs can be read and then
+dropped. Buffered values therefore reach the database one to two flush
+intervals after the access.
+
+The buffer lives in the default cache, which web and worker processes must
+share (settings.CACHES, Redis in production). A cache local to each process
+(local memory or dummy) could never be flushed by the worker, so with one
+is_buffered() is false and every access is written right away; the
+subscribtion.W001 system check warns about it.
+"""
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils import timezone
+
+from courses.models import Topic
+from .models import CourseProgress, SectionProgress, TopicProgress, WatchPosition
+
+# Queue entries read per cache.get_many() while flushing
+FLUSH_BATCH_SIZE = 500
+# Buffered timestamps outlive a few missed flushes, not a stopped beat
+BUFFER_TIMEOUT = 60 * 60 * 24
+
+GENERATION_KEY = 'activity:generation'
+FLUSHED_KEY = 'activity:flushed'
+
+# Backends that keep their entries inside one process
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+COURSE = 'course'
+SECTION = 'section'
+TOPIC = 'topic'
+POSITION = 'position'
+RESUME = 'resume'
+
+
+def _value_key(generation, course_progress_id, item):
+    kind, item_id = item
+    return f'activity:{generation}:{course_progress_id}:{kind}:{item_id}'
+
+
+def _listed_key(value_key):
+    return f'{value_key}:listed'
+
+
+def _items_key(generation, course_progress_id):
+    return f'activity:{generation}:{course_progress_id}:items'
+
+
+def _item_key(generation, course_progress_id, number):
+    return f'activity:{generation}:{course_progress_id}:item:{number}'
+
+
+def _queued_key(generation, course_progress_id):
+    return f'activity:{generation}:{course_progress_id}:queued'
+
+
+def _sequence_key(generation):
+    return f'activity:{generation}:sequence'
+
+
+def _entry_key(generation, number):
+    return f'activity:{generation}:queue:{number}'
+
+
+def _incr(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        return cache.incr(key)
+
+
+def _generation():
+    """The generation writers buffer into."""
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, 1, None)
+        generation = cache.get(GENERATION_KEY, 1)
+    return generation
+
+
+def _latest(value, other):
+    """The later of two buffered values, timestamps or tuples ending with one."""
+    if value is None:
+        return other
+    stamp = value[-1] if isinstance(value, tuple) else value
+    other_stamp = other[-1] if isinstance(other, tuple) else other
+    return other if other_stamp >= stamp else value
+
+
+def _read(buffers):
+    """
+    The items of (generation, course_progress_id) buffers, as
+    {(generation, course_progress_id): {(kind, id): value}}, and every cache
+    key holding them. Three get_many() calls whatever the number of buffers.
+    """
+    counts = cache.get_many([_items_key(*buffer) for buffer in buffers])
+    listing = {
+        _item_key(generation, course_progress_id, number): (generation, course_progress_id)
+        for generation, course_progress_id in buffers
+        for number in range(1, counts.get(_items_key(generation, course_progress_id), 0) + 1)
+    }
+    items = cache.get_many(list(listing))
+    value_keys = {_value_key(*listing[key], item): (listing[key], item) for key, item in items.items()}
+    values = cache.get_many(list(value_keys))
+
+    read = {}
+    for key, value in values.items():
+        buffer, item = value_keys[key]
+        read.setdefault(buffer, {})[item] = value
+    keys = list(counts) + list(listing) + list(value_keys) + [_listed_key(key) for key in value_keys]
+    return read, keys
+
+
+def pending(course_progress_id):
+    """The buffered values of an enrollment not written yet, {(kind, id): value}."""
+    state = cache.get_many([GENERATION_KEY, FLUSHED_KEY])
+    current = state.get(GENERATION_KEY, 1)
+    flushed = min(state.get(FLUSHED_KEY, 0), current - 1)
+    generations = range(flushed + 1, current + 1)
+    read, _ = _read([(generation, course_progress_id) for generation in generations])
+    merged = {}
+    for generation in generations:
+        for item, value in read.get((generation, course_progress_id), {}).items():
+            merged[item] = _latest(merged.get(item), value)
+    return merged
+
+
+def is_buffered():
+    """Whether accesses are buffered, only when the default cache is shared between processes."""
+    return not isinstance(caches['default'], PROCESS_LOCAL_BACKENDS)
+
+
+def _buffer(course_progress, values):
+    if not is_buffered():
+        _write({course_progress.pk: values})
+        return
+    generation = _generation()
+    value_keys = {item: _value_key(generation, course_progress.pk, item) for item in values}
+    cache.set_many({value_keys[item]: value for item, value in values.items()}, BUFFER_TIMEOUT)
+
+    # List the items new to this generation, add() elects one writer per item
+    listed = cache.get_many([_listed_key(key) for key in value_keys.values()])
+    new_items = [
+        item for item, key in value_keys.items()
+        if _listed_key(key) not in listed and cache.add(_listed_key(key), 1, BUFFER_TIMEOUT)
+    ]
+    for item in new_items:
+        number = _incr(_items_key(generation, course_progress.pk))
+        cache.set(_item_key(generation, course_progress.pk, number), item, BUFFER_TIMEOUT)
+    if new_items and cache.add(_queued_key(generation, course_progress.pk), 1, BUFFER_TIMEOUT):
+        number = _incr(_sequence_key(generation))
+        cache.set(_entry_key(generation, number), course_progress.pk, BUFFER_TIMEOUT)
+
+
+def _accessed(course_progress, topic_id, section_id, when):
+    return {(COURSE, course_progress.pk): when, (SECTION, section_id): when, (TOPIC, topic_id): when}
+
+
+def record_access(course_progress, topic_id, section_id, when=None, resume=False):
+    """
+    Buffer that a learner opened a topic, written by the flush after next.
+    With `resume` the topic also becomes the resume pointer.
+    """
+    when = when or timezone.now()
+    values = _accessed(course_progress, topic_id, section_id, when)
+    if resume:
+        values[(RESUME, course_progress.pk)] = (topic_id, section_id, when)
+    _buffer(course_progress, values)
+
+
+def record_position(course_progress, topic_id, section_id, position, duration, when=None):
+    """Buffer a video heartbeat, it also counts as an access of the topic."""
+    when = when or timezone.now()
+    values = _accessed(course_progress, topic_id, section_id, when)
+    values[(POSITION, topic_id)] = (position, duration, when)
+    _buffer(course_progress, values)
+
+
+def watch_position(course_progress, topic_id):
+    """Seconds into the video of `topic_id` where the learner stopped, buffered or stored."""
+    buffered = pending(course_progress.pk).get((POSITION, topic_id))
+    if buffered is not None:
+        return buffered[0]
+    stored = (
+        WatchPosition.objects.filter(course_progress=course_progress, topic_id=topic_id)
+        .values_list('position', flat=True).first()
+    )
+    return stored or 0
+
+
+def _later(stored, buffered):
+    return buffered if buffered is not None and (stored is None or stored < buffered) else stored
+
+
+def _resumes(stored_last_accessed, when):
+    """Whether a pointer buffered at `when` is newer than the stored one."""
+    return stored_last_accessed is None or when >= stored_last_accessed
+
+
+def merge_course(course_progress):
+    """Set the buffered last_accessed and resume pointer on a CourseProgress."""
+    buffered = pending(course_progress.pk)
+    resume = buffered.get((RESUME, course_progress.pk))
+    if resume is not None and _resumes(course_progress.last_accessed, resume[2]):
+        course_progress.resume_topic_id, course_progress.resume_section_id = resume[:2]
+    course_progress.last_accessed = _later(course_progress.last_accessed, buffered.get((COURSE, course_progress.pk)))
+    return course_progress
+
+
+def merge_states(course_progress, states):
+    """Set the buffered last_accessed on topic states (CourseProgress.topic_states() values)."""
+    buffered = pending(course_progress.pk)
+    if not buffered:
+        return states
+    for topic_id, state in states.items():
+        state.last_accessed = _later(state.last_accessed, buffered.get((TOPIC, topic_id)))
+    return states
+
+
+@transaction.atomic
+def _write(buffers):
+    """
+    Bulk write {course_progress_id: buffered timestamps}.
+
+    The CourseProgress rows are locked like the completion engine locks them,
+    so a resume pointer the engine moves while the flush runs is either seen
+    by the _resumes() check or written after the flush, never overwritten.
+    """
+    course_stamps, section_stamps, topic_stamps, positions, resumes = {}, {}, {}, [], {}
+    for course_progress_id, buffered in buffers.items():
+        for (kind, item_id), value in buffered.items():
+            if kind == COURSE:
+                course_stamps[course_progress_id] = value
+            elif kind == SECTION:
+                section_stamps[(course_progress_id, item_id)] = value
+            elif kind == TOPIC:
+                topic_stamps[(course_progress_id, item_id)] = value
+            elif kind == RESUME:
+                resumes[course_progress_id] = value
+            else:
+                position, duration, when = value
+                positions.append(WatchPosition(
+                    course_progress_id=course_progress_id, topic_id=item_id,
+                    position=position, duration=duration, updated_at=when,
+                ))
+
+    # Skip positions and resume pointers of topics deleted since the access, a
+    # moved topic resumes in its current section
+    topic_sections = dict(
+        Topic.objects.filter(
+            pk__in={watched.topic_id for watched in positions} | {resume[0] for resume in resumes.values()},
+        ).values_list('pk', 'section_id')
+    ) if positions or resumes else {}
+
+    course_rows = list(
+        CourseProgress.objects.select_for_update().filter(pk__in=course_stamps).order_by('pk')
+        .only('id', 'last_accessed', 'resume_topic', 'resume_section')
+    )
+    for course_progress in course_rows:
+        resume = resumes.get(course_progress.pk)
+        if resume is not None and resume[0] in topic_sections and _resumes(course_progress.last_accessed, resume[2]):
+            course_progress.resume_topic_id, course_progress.resume_section_id = resume[0], topic_sections[resume[0]]
+        course_progress.last_accessed = max(course_progress.last_accessed, course_stamps[course_progress.pk])
+    CourseProgress.objects.bulk_update(
+        course_rows, ['last_accessed', 'resume_topic', 'resume_section'], batch_size=FLUSH_BATCH_SIZE,
+    )
+
+    section_rows = []
+    for section_progress in (
+        SectionProgress.objects.filter(course_progress_id__in=course_stamps, section_id__in={key[1] for key in section_stamps})
+        .only('id', 'course_progress_id', 'section_id', 'last_accessed')
+    ):
+        when = section_stamps.get((section_progress.course_progress_id, section_progress.section_id))
+        if when is not None and section_progress.last_accessed < when:
+            section_progress.last_accessed = when
+            section_rows.append(section_progress)
+    SectionProgress.objects.bulk_update(section_rows, ['last_accessed'], batch_size=FLUSH_BATCH_SIZE)
+
+    # Bitmap enrollments have no topic rows, their topics read the CourseProgress timestamp
+    topic_rows = []
+    for topic_progress_id, course_progress_id, topic_id, stored in (
+        TopicProgress.objects.filter(
+            section_progress__course_progress_id__in=course_stamps, topic_id__in={key[1] for key in topic_stamps},
+        ).values_list('id', 'section_progress__course_progress_id', 'topic_id', 'last_accessed')
+    ):
+        when = topic_stamps.get((course_progress_id, topic_id))
+        if when is not None and stored < when:
+            topic_rows.append(TopicProgress(pk=topic_progress_id, last_accessed=when))
+    TopicProgress.objects.bulk_update(topic_rows, ['last_accessed'], batch_size=FLUSH_BATCH_SIZE)
+
+    # Skip positions of enrollments deleted since the heartbeat
+    kept = {course_progress.pk for course_progress in course_rows}
+    WatchPosition.objects.bulk_create(
+        [watched for watched in positions if watched.course_progress_id in kept and watched.topic_id in topic_sections],
+        update_conflicts=True, unique_fields=['course_progress', 'topic'],
+        update_fields=['position', 'duration', 'updated_at'], batch_size=FLUSH_BATCH_SIZE,
+    )
+    return len(course_rows)
+
+
+def _drain(generation):
+    """Write the buffers of a closed generation and drop its keys."""
+    last = cache.get(_sequence_key(generation)) or 0
+    written = 0
+    for first in range(1, last + 1, FLUSH_BATCH_SIZE):
+        numbers = range(first, min(last, first + FLUSH_BATCH_SIZE - 1) + 1)
+        entries = cache.get_many([_entry_key(generation, number) for number in numbers])
+        course_progress_ids = set(entries.values())
+        read, keys = _read([(generation, course_progress_id) for course_progress_id in course_progress_ids])
+        written += _write({course_progress_id: values for (_, course_progress_id), values in read.items()})
+        cache.delete_many(
+            list(entries) + keys
+            + [_queued_key(generation, course_progress_id) for course_progress_id in course_progress_ids]
+        )
+    cache.delete(_sequence_key(generation))
+    return written
+
+
+def flush():
+    """
+    Close the current generation and write the ones closed by an earlier
+    flush. Returns the number of enrollments written.
+    """
+    current = _generation()
+    _incr(GENERATION_KEY)
+    flushed = cache.get(FLUSHED_KEY) or 0
+    if flushed >= current:
+        flushed = 0  # The generation counter was evicted and started over
+    written = 0
+    for generation in range(flushed + 1, current):
+        written += _drain(generation)
+        cache.set(FLUSHED_KEY, generation, None)
+    return written
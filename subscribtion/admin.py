@@ -1,5 +1,20 @@
 from django.contrib import admin
-from .models import Enrollment, CourseProgress, SectionProgress, TopicProgress
+from .models import Enrollment, CourseProgress, SectionProgress, TopicProgress, ProgressSync, WatchPosition
+from .progress import COURSE_COUNTER_FIELDS, SECTION_COUNTER_FIELDS, recount_course_progress
+
+
+class RecountProgressMixin:
+    """
+    Topic and section states edited here bypass the completion engine, the
+    enrollment is recounted once the change and its inlines are saved. The
+    recount also bumps progress_version, so the cached overlay is rebuilt.
+    """
+    def course_progress(self, obj):
+        raise NotImplementedError
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        recount_course_progress(self.course_progress(form.instance))
 
 class TopicProgressInline(admin.TabularInline):
     model = TopicProgress
@@ -10,7 +25,7 @@ class TopicProgressInline(admin.TabularInline):
 class SectionProgressInline(admin.TabularInline):
     model = SectionProgress
     extra = 0
-    readonly_fields = ('last_accessed',)
+    readonly_fields = ('progress_percentage', 'completed', 'last_accessed')
     fields = ('section', 'progress_percentage', 'completed', 'last_accessed')
     show_change_link = True
 
@@ -18,7 +33,7 @@ class CourseProgressInline(admin.StackedInline):
     model = CourseProgress
     can_delete = False
     extra = 0
-    readonly_fields = ('last_accessed',)
+    readonly_fields = ('progress_percentage', 'completed', 'last_accessed')
     fields = ('progress_percentage', 'completed', 'last_accessed')
     show_change_link = True
     
@@ -41,12 +56,18 @@ class EnrollmentAdmin(admin.ModelAdmin):
         return super().get_queryset(request).select_related('user', 'course')
 
 @admin.register(CourseProgress)
-class CourseProgressAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'course', 'progress_percentage', 'completed', 'last_accessed')
-    list_filter = ('completed', 'last_accessed')
+class CourseProgressAdmin(RecountProgressMixin, admin.ModelAdmin):
+    list_display = ('id', 'user', 'course', 'progress_percentage', 'completed', 'storage_mode', 'last_accessed')
+    list_filter = ('completed', 'storage_mode', 'last_accessed')
     search_fields = ('enrollment_model__user__username', 'enrollment_model__course__title')
-    readonly_fields = ('last_accessed', 'enrollment_model')
+    # Counters, flag and percentage are derived from the topic states
+    readonly_fields = ('last_accessed', 'enrollment_model', 'storage_mode', 'progress_percentage', 'completed',
+                       *COURSE_COUNTER_FIELDS)
+    exclude = ('completed_bits', 'active_bits', 'bits_version', 'progress_version')
     inlines = [SectionProgressInline]
+
+    def course_progress(self, obj):
+        return obj
     
     def user(self, obj):
         return obj.enrollment_model.user
@@ -62,12 +83,15 @@ class CourseProgressAdmin(admin.ModelAdmin):
         return super().get_queryset(request).select_related('enrollment_model__user', 'enrollment_model__course')
 
 @admin.register(SectionProgress)
-class SectionProgressAdmin(admin.ModelAdmin):
+class SectionProgressAdmin(RecountProgressMixin, admin.ModelAdmin):
     list_display = ('id', 'section', 'user', 'course', 'progress_percentage', 'completed', 'last_accessed')
     list_filter = ('completed', 'last_accessed', 'section')
     search_fields = ('section__title', 'course_progress__enrollment_model__user__username')
-    readonly_fields = ('last_accessed',)
+    readonly_fields = ('last_accessed', 'progress_percentage', 'completed', *SECTION_COUNTER_FIELDS)
     inlines = [TopicProgressInline]
+
+    def course_progress(self, obj):
+        return obj.course_progress
     
     def user(self, obj):
         return obj.course_progress.enrollment_model.user
@@ -87,11 +111,14 @@ class SectionProgressAdmin(admin.ModelAdmin):
         )
 
 @admin.register(TopicProgress)
-class TopicProgressAdmin(admin.ModelAdmin):
+class TopicProgressAdmin(RecountProgressMixin, admin.ModelAdmin):
     list_display = ('id', 'topic', 'section', 'user', 'course', 'completed', 'last_accessed')
     list_filter = ('completed', 'last_accessed', 'topic__content_type')
     search_fields = ('topic__title', 'section_progress__section__title')
     readonly_fields = ('last_accessed',)
+
+    def course_progress(self, obj):
+        return obj.section_progress.course_progress
     
     def section(self, obj):
         return obj.section_progress.section
@@ -114,4 +141,18 @@ class TopicProgressAdmin(admin.ModelAdmin):
             'section_progress__section',
             'section_progress__course_progress__enrollment_model__user',
             'section_progress__course_progress__enrollment_model__course'
-        )
\ No newline at end of file
+        )
+
+@admin.register(ProgressSync)
+class ProgressSyncAdmin(admin.ModelAdmin):
+    list_display = ('id', 'course', 'status', 'processed', 'total', 'created_at', 'updated_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('course__title', 'task_id')
+    readonly_fields = ('course', 'status', 'task_id', 'last_enrollment_id', 'processed', 'total', 'error', 'created_at', 'updated_at')
+
+@admin.register(WatchPosition)
+class WatchPositionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'topic', 'course_progress', 'position', 'duration', 'updated_at')
+    search_fields = ('topic__title', 'course_progress__enrollment_model__user__username')
+    readonly_fields = ('course_progress', 'topic', 'position', 'duration', 'updated_at')
+    list_select_related = ('topic', 'course_progress__enrollment_model__user', 'course_progress__enrollment_model__course')
@@ -0,0 +1,8 @@
+from django.urls import path
+from .api_views import CompletionBatchView, WatchHeartbeatView
+
+urlpatterns = [
+    # Progress sync
+    path('courses/<int:course_id>/completions/', CompletionBatchView.as_view(), name='api-completion-batch'),
+    path('courses/<int:course_id>/topics/<int:topic_id>/heartbeat/', WatchHeartbeatView.as_view(), name='api-watch-heartbeat'),
+]
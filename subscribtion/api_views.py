@@ -0,0 +1,89 @@
+# subscribtion/api_views.py
+from rest_framework import status, permissions
+from rest_framework.authentication import SessionAuthentication
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from django.conf import settings
+
+from courses.models import Course
+from courses.outline import get_outline
+from . import activity
+from .completion import complete_topic, complete_topics, progress_snapshot
+from .models import CourseProgress, Enrollment
+from .overlay import get_overlay
+from .provisioning import ensure_course_progress
+from .serializers import CompletionBatchSerializer, WatchHeartbeatSerializer
+
+
+class CompletionBatchView(APIView):
+    """
+    API endpoint for replaying many topic completions of one enrollment at once
+    (offline / mobile sync). The completions are applied in course-sequence
+    order in a single transaction and the final progress snapshot is returned.
+    """
+    authentication_classes = [JWTAuthentication, SessionAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, course_id):
+        try:
+            enrollment = Enrollment.objects.get(user=request.user, course_id=course_id)
+        except Enrollment.DoesNotExist:
+            return Response({"detail": "You are not enrolled in this course."}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = CompletionBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        completion = complete_topics(enrollment, serializer.topic_ids(), timestamps=serializer.timestamps())
+        return Response({
+            "completed_topic_ids": completion.completed_topic_ids,
+            "rejected_topic_ids": completion.rejected_topic_ids,
+            "activated_topic_ids": completion.activated_topic_ids,
+            "course_just_completed": completion.course_just_completed,
+            "progress": progress_snapshot(completion.course_progress),
+        }, status=status.HTTP_200_OK)
+
+
+class WatchHeartbeatView(APIView):
+    """
+    Heartbeat of the video player, posted every few seconds while a video
+    topic plays. The position is buffered in the cache and written by the
+    flush_activity task, only the latest one per enrollment and topic. Once
+    the learner is past VIDEO_COMPLETION_THRESHOLD of the video the topic is
+    completed, until then a heartbeat costs the enrollment query alone.
+    """
+    authentication_classes = [JWTAuthentication, SessionAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, course_id, topic_id):
+        try:
+            enrollment = Enrollment.objects.select_related('course', 'progress').get(user=request.user, course_id=course_id)
+        except Enrollment.DoesNotExist:
+            return Response({"detail": "You are not enrolled in this course."}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            course_progress = enrollment.progress
+        except CourseProgress.DoesNotExist:
+            course_progress = ensure_course_progress(enrollment)
+
+        outline = get_outline(enrollment.course)
+        topic = outline.topic(topic_id)
+        if topic is None or topic.content_type != 'video':
+            return Response({"detail": "Video topic not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = WatchHeartbeatSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        position, duration = serializer.validated_data['position'], serializer.validated_data['duration']
+        activity.record_position(course_progress, topic.id, topic.section_id, position, duration)
+
+        state = get_overlay(course_progress, outline).topic_state(topic.id)
+        completed = state.completed
+        watched = position / duration if duration else 0
+        if (
+            not completed and watched >= settings.VIDEO_COMPLETION_THRESHOLD
+            and (state.is_active or enrollment.course.course_type != Course.LOCKED)
+        ):
+            completed = bool(complete_topic(enrollment, topic.id).completed_topic_ids)
+        return Response({"position": position, "completed": completed}, status=status.HTTP_200_OK)
@@ -9,4 +9,7 @@ class SubscribtionConfig(AppConfig):
         This ensures our signal handlers are registered properly.
         """
         # Import signals to register them
-        import subscribtion.signals
\ No newline at end of file
+        import subscribtion.signals
+        from django.core import checks
+        from .checks import check_activity_cache
+        checks.register(check_activity_cache, deploy=True)
\ No newline at end of file
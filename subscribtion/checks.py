@@ -0,0 +1,15 @@
+from django.core.checks import Warning
+
+from . import activity
+
+
+def check_activity_cache(app_configs, **kwargs):
+    """The activity buffer needs a cache the Celery worker shares with the web processes."""
+    if activity.is_buffered():
+        return []
+    return [Warning(
+        "The default cache is local to each process, so last accessed times and video "
+        "positions are written on every request instead of being buffered.",
+        hint="Set CACHE_URL to a Redis server shared by the web and worker processes.",
+        id='subscribtion.W001',
+    )]
@@ -0,0 +1,391 @@
+"""
+Topic completion engine.
+
+Every path that completes topics (the mark-completed view, passed quizzes,
+the debug views) goes through complete_topics(). It runs in one atomic block,
+locks only the CourseProgress row of the enrollment, evaluates counters,
+unlocking and course completion in memory, then writes the changed rows in bulk
+and returns a diff of what it changed.
+"""
+from collections import namedtuple
+
+from django.db import transaction
+from django.utils import timezone
+
+from courses import sequence
+from courses.models import Course, Topic, TopicSequence
+from . import activity
+from .models import CourseProgress, SectionProgress
+from .progress import SECTION_COUNTER_FIELDS, COURSE_COUNTER_FIELDS
+from .provisioning import ensure_course_progress
+from .topic_store import store_for
+
+CompletionResult = namedtuple('CompletionResult', [
+    'course_progress',
+    'completed_topic_ids',  # topics flipped to completed by this call
+    'rejected_topic_ids',  # topics not applied: still locked, or not part of the course
+    'completed_section_ids',  # sections that became complete in this call
+    'activated_topic_ids',  # topics unlocked by this call
+    'course_completed',
+    'course_just_completed',  # this call finished the course
+    'changes',  # list of {'model', 'id', 'created', 'fields': {name: [old, new]}}
+])
+
+
+class _Tracked:
+    """A progress row plus the original values of the fields we may change."""
+
+    def __init__(self, obj, fields, created=False):
+        self.obj = obj
+        self.created = created
+        self.original = {field: getattr(obj, field) for field in fields}
+
+    def changed_fields(self):
+        return {
+            field: [old, getattr(self.obj, field)]
+            for field, old in self.original.items()
+            if getattr(self.obj, field) != old
+        }
+
+
+TOPIC_FIELDS = ['completed', 'is_active']
+SECTION_FIELDS = SECTION_COUNTER_FIELDS + ['completed', 'is_active', 'progress_percentage']
+COURSE_FIELDS = COURSE_COUNTER_FIELDS + ['completed', 'progress_percentage']
+
+
+def complete_topic(enrollment, topic, enforce_lock=True):
+    """Complete a single topic, see complete_topics()."""
+    return complete_topics(enrollment, [topic], enforce_lock=enforce_lock)
+
+
+def complete_topics(enrollment, topics, enforce_lock=True, timestamps=None):
+    """
+    Mark `topics` (Topic instances or ids of one course) as completed for an
+    enrollment, in course-sequence order.
+
+    `timestamps` optionally maps topic ids to the moment the client completed
+    them (offline replays); they are stored as the rows' last_accessed and the
+    latest one becomes the enrollment's completed_at. Future values are clamped
+    to now.
+
+    In locked courses a topic is only accepted when it is unlocked, either
+    already or by an earlier topic of the same call, unless the course was
+    already finished, or `enforce_lock` is off (a passed quiz completes its
+    topic regardless). Completing a topic unlocks the next topic of the course
+    sequence, and finishing a section unlocks the first topic after it.
+    Topics that were completed before still re-run the unlock, so a retry
+    repairs a missed activation. The resume pointer of the enrollment moves to
+    the topic after the last accepted one.
+    """
+    topic_ids = {getattr(topic, 'pk', topic) for topic in topics}
+
+    with transaction.atomic():
+        course_progress = _lock_course_progress(enrollment)
+        course = course_progress.enrollment_model.course
+        enrollment = course_progress.enrollment_model
+        engine = _Engine(course, enrollment, course_progress, timestamps)
+        return engine.run(topic_ids, enforce_lock)
+
+
+def describe_changes(changes):
+    """One human readable line per changed row, used by the debug views."""
+    if not changes:
+        return ["No progress rows changed"]
+    lines = []
+    for change in changes:
+        action = 'created' if change['created'] else 'updated'
+        fields = ', '.join(f"{name}: {old} -> {new}" for name, (old, new) in change['fields'].items())
+        lines.append(f"{change['model']} id={change['id']} {action}: {fields}")
+    return lines
+
+
+def progress_snapshot(course_progress):
+    """
+    The whole progress state of an enrollment as plain data, built from the
+    stored counters with two queries. Used as the batch sync API response.
+    """
+    sections = (
+        SectionProgress.objects.filter(course_progress=course_progress)
+        .order_by('section__created_at', 'section_id')
+        .values('section_id', 'completed', 'is_active', 'progress_percentage',
+                'completed_topics_count', 'total_topics_count')
+    )
+    states = activity.merge_states(course_progress, store_for(course_progress).all_states())
+    topics = [
+        {'topic_id': topic_id, 'completed': state.completed, 'is_active': state.is_active, 'last_accessed': state.last_accessed}
+        for topic_id, state in states.items()
+    ]
+    return {
+        'course_id': course_progress.enrollment_model.course_id,
+        'completed': course_progress.completed,
+        'progress_percentage': float(course_progress.progress_percentage),
+        'completed_topics_count': course_progress.completed_topics_count,
+        'total_topics_count': course_progress.total_topics_count,
+        'completed_sections_count': course_progress.completed_sections_count,
+        'total_sections_count': course_progress.total_sections_count,
+        'completed_at': course_progress.enrollment_model.completed_at,
+        'sections': [
+            dict(row, progress_percentage=float(row['progress_percentage'])) for row in sections
+        ],
+        'topics': topics,
+    }
+
+
+def _lock_course_progress(enrollment):
+    """Lock the enrollment's CourseProgress row, provisioning the tree if it is missing."""
+    locked = (
+        CourseProgress.objects.select_for_update(of=('self',))
+        .select_related('enrollment_model__course')
+        .filter(enrollment_model_id=enrollment.pk)
+    )
+    course_progress = locked.first()
+    if course_progress is None:
+        ensure_course_progress(enrollment)
+        course_progress = locked.get()
+    return course_progress
+
+
+class _Engine:
+
+    def __init__(self, course, enrollment, course_progress, timestamps=None):
+        self.course = course
+        self.enrollment = enrollment
+        self.course_progress = _Tracked(course_progress, COURSE_FIELDS)
+        self.now = timezone.now()
+        self.timestamps = {
+            topic_id: min(stamp, self.now) for topic_id, stamp in (timestamps or {}).items()
+        }
+        self.finished_at = None  # the latest flip of this call
+        self.flipped = set()
+        self.resume = None  # (topic_id, section_id) the resume pointer moves to
+        self.sections = {}  # section_id -> _Tracked SectionProgress
+        self.topics = {}  # topic_id -> _Tracked TopicProgress / TopicState
+
+    # -- loading -------------------------------------------------------------
+
+    def _load_sequence(self, topic_ids):
+        rows = self._sequence_rows()
+        missing = topic_ids - {row[0] for row in rows}
+        if missing and Topic.objects.filter(pk__in=missing, section__course=self.course).exists():
+            # A topic saved without the signals (raw loads), rebuild once and retry
+            sequence.rebuild_course_sequence(self.course.pk)
+            rows = self._sequence_rows()
+        return rows
+
+    def _sequence_rows(self):
+        return list(
+            TopicSequence.objects.filter(course=self.course)
+            .order_by('position')
+            .values_list(
+                'topic_id', 'section_id', 'section_index', 'topic__is_required', 'section__is_required', 'position',
+                'course__sequence_version',
+            )
+        )
+
+    def _load_progress(self, topic_ids, section_ids):
+        course_progress = self.course_progress.obj
+        for section_progress in SectionProgress.objects.filter(course_progress=course_progress, section_id__in=section_ids):
+            self.sections.setdefault(section_progress.section_id, _Tracked(section_progress, SECTION_FIELDS))
+        for topic_id, state in self.store.load(topic_ids).items():
+            # Sparse enrollments resolve untouched topics to unsaved default rows
+            self.topics[topic_id] = _Tracked(state, TOPIC_FIELDS, created=state.pk is None)
+
+    def _section(self, section_id):
+        if section_id not in self.sections:
+            section_progress = SectionProgress(
+                course_progress=self.course_progress.obj,
+                section_id=section_id,
+                progress_percentage=0.0,
+                completed=False,
+                is_active=False,
+                total_topics_count=self.section_totals[section_id][0],
+                required_topics_count=self.section_totals[section_id][1],
+            )
+            self.sections[section_id] = _Tracked(section_progress, SECTION_FIELDS, created=True)
+        return self.sections[section_id]
+
+    def _topic(self, topic_id):
+        if topic_id not in self.topics:
+            self.topics[topic_id] = _Tracked(self.store.new(topic_id), TOPIC_FIELDS, created=True)
+        return self.topics[topic_id]
+
+    # -- evaluation ----------------------------------------------------------
+
+    def run(self, topic_ids, enforce_lock=True):
+        rows = self._load_sequence(topic_ids)
+        self.order = [row[0] for row in rows]
+        self.index = {topic_id: index for index, topic_id in enumerate(self.order)}
+        self.meta = {row[0]: row for row in rows}
+        self.store = store_for(
+            self.course_progress.obj, {row[0]: row[5] for row in rows}, rows[0][6] if rows else None,
+        )
+        self.section_totals = {}
+        for _, section_id, _, topic_required, _, _, _ in rows:
+            totals = self.section_totals.setdefault(section_id, [0, 0])
+            totals[0] += 1
+            totals[1] += 1 if topic_required else 0
+
+        requested = sorted((topic_id for topic_id in topic_ids if topic_id in self.index), key=self.index.get)
+        unknown = sorted(topic_id for topic_id in topic_ids if topic_id not in self.index)
+
+        # Every row this call can touch: the requested topics and what they may unlock
+        involved = set(requested)
+        for topic_id in requested:
+            involved.update(self._unlock_candidates(topic_id))
+        self._load_progress(involved, {self.meta[topic_id][1] for topic_id in involved})
+
+        locked = self.course.course_type == Course.LOCKED
+        finished = bool(self.enrollment.completed_at)
+        completed, rejected, completed_sections, activated = [], unknown, [], []
+
+        for topic_id in requested:
+            topic_progress = self._topic(topic_id).obj
+            if enforce_lock and locked and not topic_progress.is_active and not finished:
+                rejected.append(topic_id)
+                continue
+
+            if not topic_progress.completed:
+                self._flip(topic_id, completed_sections)
+                completed.append(topic_id)
+
+            if locked and not finished:
+                section_id = self.meta[topic_id][1]
+                for candidate in self._unlock_candidates(topic_id, self._section(section_id).obj.completed):
+                    if self._activate(candidate):
+                        activated.append(candidate)
+
+        accepted = [topic_id for topic_id in requested if topic_id not in rejected]
+        if accepted:
+            # Continue after the last topic of this call, or on it at the end of the course
+            index = min(self.index[accepted[-1]] + 1, len(self.order) - 1)
+            self.resume = (self.order[index], self.meta[self.order[index]][1])
+
+        course_just_completed = self._finish_course()
+        changes = self._write(course_just_completed)
+        return CompletionResult(
+            self.course_progress.obj, completed, rejected, completed_sections, activated,
+            self.course_progress.obj.completed, course_just_completed, changes,
+        )
+
+    def _unlock_candidates(self, topic_id, section_completed=True):
+        """The next topic of the sequence, and the first topic after the section once it is complete."""
+        index = self.index[topic_id]
+        candidates = []
+        if index + 1 < len(self.order):
+            candidates.append(self.order[index + 1])
+        if section_completed:
+            section_index = self.meta[topic_id][2]
+            for later in self.order[index + 1:]:
+                if self.meta[later][2] > section_index:
+                    candidates.append(later)
+                    break
+        return candidates
+
+    def _flip(self, topic_id, completed_sections):
+        _, section_id, _, topic_required, section_required, _, _ = self.meta[topic_id]
+        topic_progress = self._topic(topic_id).obj
+        topic_progress.completed = True
+        stamp = self.timestamps.get(topic_id, self.now)
+        topic_progress.last_accessed = stamp
+        self.flipped.add(topic_id)
+        self.finished_at = max(self.finished_at, stamp) if self.finished_at else stamp
+
+        section_progress = self._section(section_id).obj
+        section_progress.completed_topics_count += 1
+        section_progress.completed_required_topics_count += 1 if topic_required else 0
+        section_progress.progress_percentage = section_progress.calculate_percentage()
+
+        course_progress = self.course_progress.obj
+        course_progress.completed_topics_count += 1
+        course_progress.completed_required_topics_count += 1 if topic_required else 0
+
+        if section_progress.is_complete() and not section_progress.completed:
+            section_progress.completed = True
+            course_progress.completed_sections_count += 1
+            course_progress.completed_required_sections_count += 1 if section_required else 0
+            completed_sections.append(section_id)
+
+    def _activate(self, topic_id):
+        section_progress = self._section(self.meta[topic_id][1]).obj
+        section_progress.is_active = True
+        topic_progress = self._topic(topic_id).obj
+        if topic_progress.is_active:
+            return False
+        topic_progress.is_active = True
+        return True
+
+    def _finish_course(self):
+        course_progress = self.course_progress.obj
+        course_completed = course_progress.is_complete()
+        course_progress.completed = course_completed
+        course_progress.progress_percentage = 100 if course_completed else course_progress.calculate_percentage()
+        if course_completed and not self.enrollment.completed_at:
+            self.enrollment.completed_at = self.finished_at or self.now
+            return True
+        return False
+
+    # -- writing -------------------------------------------------------------
+
+    def _write(self, course_just_completed):
+        changes = []
+
+        new_sections = [tracked.obj for tracked in self.sections.values() if tracked.created]
+        if new_sections:
+            SectionProgress.objects.bulk_create(new_sections)
+            section_ids = dict(
+                SectionProgress.objects.filter(course_progress=self.course_progress.obj, section_id__in=[sp.section_id for sp in new_sections])
+                .values_list('section_id', 'id')
+            )
+            for section_progress in new_sections:
+                section_progress.pk = section_ids[section_progress.section_id]
+
+        dirty_sections = [tracked for tracked in self.sections.values() if not tracked.created and tracked.changed_fields()]
+        if dirty_sections:
+            self._touch(dirty_sections)
+            SectionProgress.objects.bulk_update([tracked.obj for tracked in dirty_sections], SECTION_FIELDS + ['last_accessed'])
+
+        # A topic row that was only looked at (a rejected completion) is not written
+        new_topics = [tracked.obj for tracked in self.topics.values() if tracked.created and tracked.changed_fields()]
+        dirty_topics = [tracked for tracked in self.topics.values() if not tracked.created and tracked.changed_fields()]
+        self._touch(dirty_topics)
+        bit_fields = []
+        if new_topics or dirty_topics:
+            bit_fields = self.store.save(
+                new_topics, [tracked.obj for tracked in dirty_topics],
+                lambda topic_id: self.sections[self.meta[topic_id][1]].obj.pk,
+            )
+
+        course_fields = list(self.course_progress.changed_fields()) + bit_fields
+        course_progress = self.course_progress.obj
+        if self.resume and self.resume != (course_progress.resume_topic_id, course_progress.resume_section_id):
+            course_progress.resume_topic_id, course_progress.resume_section_id = self.resume
+            course_fields += ['resume_topic', 'resume_section']
+        if new_sections or dirty_sections or new_topics or dirty_topics or course_fields:
+            # A new progress_version makes the cached overlay unreachable, the row is locked
+            course_progress.progress_version += 1
+            course_progress.save(update_fields=course_fields + ['last_accessed', 'progress_version'])
+        if course_just_completed:
+            self.enrollment.save(update_fields=['completed_at'])
+
+        for model_name, tracked_rows in (
+            ('SectionProgress', self.sections.values()),
+            (self.store.model_name, self.topics.values()),
+            ('CourseProgress', [self.course_progress]),
+        ):
+            for tracked in tracked_rows:
+                fields = tracked.changed_fields()
+                if fields:
+                    changes.append({
+                        'model': model_name,
+                        'id': tracked.obj.pk,
+                        'created': tracked.created,
+                        'fields': fields,
+                    })
+        return changes
+
+    def _touch(self, tracked_rows):
+        # bulk_update skips auto_now, set the timestamp ourselves. Flipped
+        # topics keep the completion time set in _flip().
+        for tracked in tracked_rows:
+            if getattr(tracked.obj, 'topic_id', None) not in self.flipped:
+                tracked.obj.last_accessed = self.now
@@ -0,0 +1,139 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from courses.models import Course
+from subscribtion.completion import describe_changes
+from subscribtion.models import Enrollment
+from subscribtion.provisioning import BULK_BATCH_SIZE
+from subscribtion.resync import CourseStructure, enrollment_chunks, resync_chunk
+
+
+def _init_worker():
+    # Spawned workers start without Django, forked ones must not share the parent's connections
+    django.setup()
+    connections.close_all()
+
+
+def recompute_course(course_id, chunk_size=BULK_BATCH_SIZE, dry_run=False):
+    """
+    Resync every enrollment of one course from its topic states, see
+    subscribtion.resync for everything that writes. Runs in a pool worker,
+    so it takes and returns plain values.
+    """
+    started = time.monotonic()
+    course = Course.objects.get(pk=course_id)
+    structure = CourseStructure(course)
+    enrollments, changes = 0, []
+    for course_progress_ids in enrollment_chunks(course, chunk_size=chunk_size, provision=not dry_run):
+        report = resync_chunk(structure, course_progress_ids, dry_run=dry_run)
+        enrollments += report.enrollments
+        changes.extend(report.changes)
+    return {
+        'course_id': course_id,
+        'enrollments': enrollments,
+        'changed_rows': len(changes),
+        'diff': describe_changes(changes) if dry_run and changes else [],
+        'seconds': time.monotonic() - started,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Resync every enrollment with its course structure, one course at a time, spread over a "
+        "process pool. Besides rebuilding the counters, completion flags and percentages of every "
+        "SectionProgress and CourseProgress from the topic states, this provisions enrollments "
+        "without progress, creates missing progress rows, activates the topics a locked course "
+        "would have unlocked and sets Enrollment.completed_at of finished enrollments. Run with "
+        "--dry-run first to review the changes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses',
+                            help='Only recompute this course id, can be repeated')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes, 1 runs everything in this process')
+        parser.add_argument('--chunk-size', type=int, default=BULK_BATCH_SIZE,
+                            help='Enrollments resynced per transaction')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Print the rows that would be created or changed without writing anything, '
+                                 'enrollments without progress are skipped')
+        parser.add_argument('--checkpoint',
+                            help='JSON file recording finished courses, a rerun skips them')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1 or options['chunk_size'] < 1:
+            raise CommandError("--workers and --chunk-size must be positive")
+        dry_run = options['dry_run']
+        checkpoint = options['checkpoint']
+        workers = options['workers']
+        if connection.vendor == 'sqlite' and not dry_run and workers > 1:
+            # SQLite allows a single writer, parallel chunks would only fail with "database is locked"
+            self.stdout.write("SQLite database: writing from a single process")
+            workers = 1
+
+        finished = self._load_checkpoint(checkpoint)
+        course_ids = Enrollment.objects.order_by('course_id').values_list('course_id', flat=True).distinct()
+        if options['courses']:
+            course_ids = course_ids.filter(course_id__in=options['courses'])
+        pending = [course_id for course_id in course_ids if course_id not in finished]
+        if finished:
+            self.stdout.write(f"Skipping {len(finished)} course(s) finished according to {checkpoint}")
+
+        started = time.monotonic()
+        enrollments = changed_rows = 0
+        for result in self._run(pending, workers, options['chunk_size'], dry_run):
+            enrollments += result['enrollments']
+            changed_rows += result['changed_rows']
+            rate = result['enrollments'] / result['seconds'] if result['seconds'] else 0
+            self.stdout.write(
+                f"Course {result['course_id']}: {result['enrollments']} enrollments, "
+                f"{result['changed_rows']} rows {'to change' if dry_run else 'changed'} ({rate:.0f} enrollments/s)"
+            )
+            for line in result['diff']:
+                self.stdout.write(f"  {line}")
+            if checkpoint and not dry_run:
+                finished.add(result['course_id'])
+                self._save_checkpoint(checkpoint, finished)
+
+        elapsed = time.monotonic() - started
+        rate = enrollments / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(pending)} course(s), {enrollments} enrollments, {changed_rows} rows "
+            f"{'to change' if dry_run else 'changed'} in {elapsed:.1f}s ({rate:.0f} enrollments/s)"
+        ))
+
+    def _run(self, course_ids, workers, chunk_size, dry_run):
+        """Yield the result of every course as it finishes."""
+        if workers == 1 or len(course_ids) < 2:
+            for course_id in course_ids:
+                yield recompute_course(course_id, chunk_size, dry_run)
+            return
+
+        # Children must open their own connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=min(workers, len(course_ids)), initializer=_init_worker) as pool:
+            futures = [pool.submit(recompute_course, course_id, chunk_size, dry_run) for course_id in course_ids]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def _load_checkpoint(self, path):
+        if not path or not os.path.exists(path):
+            return set()
+        try:
+            with open(path) as handle:
+                return set(json.load(handle)['finished_courses'])
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f"Unreadable checkpoint {path}: {exc}")
+
+    def _save_checkpoint(self, path, finished):
+        # Replace the file in one step so an interrupted run never leaves it half written
+        temporary = f"{path}.tmp"
+        with open(temporary, 'w') as handle:
+            json.dump({'finished_courses': sorted(finished)}, handle)
+        os.replace(temporary, path)
@@ -0,0 +1,128 @@
+# Generated by Django 5.1.7 on 2026-10-18 02:50
+
+from django.db import migrations, models
+
+
+def backfill_progress_counters(apps, schema_editor):
+    """Fill the new counters of existing progress rows from the TopicProgress ground truth."""
+    Section = apps.get_model('courses', 'Section')
+    Topic = apps.get_model('courses', 'Topic')
+    CourseProgress = apps.get_model('subscribtion', 'CourseProgress')
+    SectionProgress = apps.get_model('subscribtion', 'SectionProgress')
+    TopicProgress = apps.get_model('subscribtion', 'TopicProgress')
+
+    def is_complete(required, completed_required, total, completed):
+        if required:
+            return completed_required >= required
+        return total > 0 and completed >= total
+
+    for course_progress in CourseProgress.objects.select_related('enrollment_model'):
+        course_id = course_progress.enrollment_model.course_id
+        sections = dict(Section.objects.filter(course_id=course_id).values_list('id', 'is_required'))
+        totals = {section_id: [0, 0] for section_id in sections}
+        for section_id, is_required in Topic.objects.filter(section__course_id=course_id).values_list('section_id', 'is_required'):
+            totals[section_id][0] += 1
+            totals[section_id][1] += int(is_required)
+        done = {section_id: [0, 0] for section_id in sections}
+        rows = TopicProgress.objects.filter(
+            section_progress__course_progress=course_progress, completed=True
+        ).values_list('section_progress__section_id', 'topic__is_required')
+        for section_id, is_required in rows:
+            if section_id in done:
+                done[section_id][0] += 1
+                done[section_id][1] += int(is_required)
+
+        completed_sections = completed_required_sections = 0
+        for section_progress in SectionProgress.objects.filter(course_progress=course_progress):
+            section_id = section_progress.section_id
+            if section_id not in sections:
+                continue
+            section_progress.total_topics_count, section_progress.required_topics_count = totals[section_id]
+            section_progress.completed_topics_count, section_progress.completed_required_topics_count = done[section_id]
+            section_progress.save()
+            if is_complete(totals[section_id][1], done[section_id][1], totals[section_id][0], done[section_id][0]):
+                completed_sections += 1
+                completed_required_sections += int(sections[section_id])
+
+        CourseProgress.objects.filter(pk=course_progress.pk).update(
+            total_topics_count=sum(total for total, _ in totals.values()),
+            required_topics_count=sum(required for _, required in totals.values()),
+            completed_topics_count=sum(total for total, _ in done.values()),
+            completed_required_topics_count=sum(required for _, required in done.values()),
+            total_sections_count=len(sections),
+            required_sections_count=sum(1 for required in sections.values() if required),
+            completed_sections_count=completed_sections,
+            completed_required_sections_count=completed_required_sections,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribtion', '0003_certificate'),
+        ('courses', '0006_review'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='courseprogress',
+            name='completed_required_sections_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='completed_required_topics_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='completed_sections_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='completed_topics_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='required_sections_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='required_topics_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='total_sections_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='total_topics_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='sectionprogress',
+            name='completed_required_topics_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='sectionprogress',
+            name='completed_topics_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='sectionprogress',
+            name='required_topics_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='sectionprogress',
+            name='total_topics_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_progress_counters, migrations.RunPython.noop),
+    ]
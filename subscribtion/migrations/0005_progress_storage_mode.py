@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-18 03:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribtion', '0004_progress_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='courseprogress',
+            name='active_bits',
+            field=models.BinaryField(blank=True, default=b''),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='completed_bits',
+            field=models.BinaryField(blank=True, default=b''),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='storage_mode',
+            field=models.CharField(choices=[('rows', 'Topic progress rows'), ('bitmap', 'Bitmap')], default='rows', max_length=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 03:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribtion', '0005_progress_storage_mode'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='courseprogress',
+            name='storage_mode',
+            field=models.CharField(choices=[('rows', 'Topic progress rows'), ('sparse', 'Lazy topic progress rows'), ('bitmap', 'Bitmap')], default='rows', max_length=10),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 03:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0007_topic_sequence'),
+        ('subscribtion', '0006_sparse_storage_mode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProgressSync',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('superseded', 'Superseded'), ('failed', 'Failed')], default='pending', max_length=12)),
+                ('task_id', models.CharField(blank=True, max_length=255)),
+                ('last_enrollment_id', models.PositiveIntegerField(default=0)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='progress_syncs', to='courses.course')),
+            ],
+            options={
+                'verbose_name': 'Progress Sync',
+                'verbose_name_plural': 'Progress Syncs',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
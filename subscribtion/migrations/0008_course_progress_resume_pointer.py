@@ -0,0 +1,25 @@
+# Generated by Django 5.1.7 on 2026-10-18 03:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_course_structure_version'),
+        ('subscribtion', '0007_progress_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='courseprogress',
+            name='resume_section',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='courses.section'),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='resume_topic',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='courses.topic'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-18 03:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_course_structure_version'),
+        ('subscribtion', '0008_course_progress_resume_pointer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WatchPosition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.FloatField(default=0)),
+                ('duration', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField()),
+                ('course_progress', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='watch_positions', to='subscribtion.courseprogress')),
+                ('topic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='courses.topic')),
+            ],
+            options={
+                'verbose_name': 'Watch Position',
+                'verbose_name_plural': 'Watch Positions',
+                'unique_together': {('course_progress', 'topic')},
+            },
+        ),
+    ]
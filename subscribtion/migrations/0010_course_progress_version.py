@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscribtion', '0009_watch_position'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='courseprogress',
+            name='progress_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
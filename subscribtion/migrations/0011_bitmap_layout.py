@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-18 04:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0012_course_sequence_version'),
+        ('subscribtion', '0010_course_progress_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='courseprogress',
+            name='bits_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='BitmapLayout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('topics', models.JSONField(default=list)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bitmap_layouts', to='courses.course')),
+            ],
+            options={
+                'verbose_name': 'Bitmap Layout',
+                'verbose_name_plural': 'Bitmap Layouts',
+                'unique_together': {('course', 'version')},
+            },
+        ),
+    ]
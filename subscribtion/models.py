@@ -31,11 +31,46 @@ class Enrollment(models.Model):
         verbose_name = "Enrollment"
 
 class CourseProgress(models.Model):
+    # Where the per-topic completed / active state lives, see subscribtion.topic_store
+    ROWS = 'rows'
+    SPARSE = 'sparse'
+    BITMAP = 'bitmap'
+    STORAGE_CHOICES = [
+        (ROWS, 'Topic progress rows'),
+        (SPARSE, 'Lazy topic progress rows'),
+        (BITMAP, 'Bitmap'),
+    ]
+
     enrollment_model = models.OneToOneField(Enrollment, on_delete=models.CASCADE, related_name='progress')
     # No need for a separate course field - we can access it through enrollment_model.course
     progress_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=0.00)
     last_accessed = models.DateTimeField(auto_now=True)
     completed = models.BooleanField(default=False)
+
+    storage_mode = models.CharField(max_length=10, choices=STORAGE_CHOICES, default=ROWS)
+    # Bitmap mode only: bit N describes the topic at TopicSequence.position N
+    completed_bits = models.BinaryField(default=b'', blank=True)
+    active_bits = models.BinaryField(default=b'', blank=True)
+    # The Course.sequence_version whose positions the bits follow, see BitmapLayout
+    bits_version = models.PositiveIntegerField(default=0)
+
+    # Denormalized counters, kept in sync when a TopicProgress / SectionProgress flips.
+    # Totals describe the course structure, completed counts describe the learner.
+    total_topics_count = models.PositiveIntegerField(default=0)
+    completed_topics_count = models.PositiveIntegerField(default=0)
+    required_topics_count = models.PositiveIntegerField(default=0)
+    completed_required_topics_count = models.PositiveIntegerField(default=0)
+    total_sections_count = models.PositiveIntegerField(default=0)
+    completed_sections_count = models.PositiveIntegerField(default=0)
+    required_sections_count = models.PositiveIntegerField(default=0)
+    completed_required_sections_count = models.PositiveIntegerField(default=0)
+
+    # Where "continue learning" links lead: the topic opened or unlocked last,
+    # kept by the completion engine and the topic views, see subscribtion.activity
+    resume_section = models.ForeignKey(Section, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    resume_topic = models.ForeignKey(Topic, null=True, blank=True, on_delete=models.SET_NULL, related_name='+')
+    # Bumped with every progress write, keys the cached overlay, see subscribtion.overlay
+    progress_version = models.PositiveIntegerField(default=0)
     
     def __str__(self):
         return f"{self.enrollment_model.user.username} progress in {self.enrollment_model.course.title}"
@@ -49,6 +84,40 @@ class CourseProgress(models.Model):
         """Convenience property to access the course directly"""
         return self.enrollment_model.course
 
+    def is_complete(self):
+        """
+        A course is complete when all of its required sections are complete,
+        or all of its sections when none of them is marked as required.
+        """
+        if self.required_sections_count:
+            return self.completed_required_sections_count >= self.required_sections_count
+        return self.total_sections_count > 0 and self.completed_sections_count >= self.total_sections_count
+
+    def calculate_percentage(self):
+        """
+        Progress is based on the required topics only when the course has any,
+        otherwise on all topics.
+        """
+        if self.required_topics_count:
+            return (self.completed_required_topics_count / self.required_topics_count) * 100
+        if self.total_topics_count:
+            return (self.completed_topics_count / self.total_topics_count) * 100
+        return 100 if self.completed else 0
+
+    def topic_states(self):
+        """
+        Topic id -> progress state for every topic with a known state, whatever
+        the storage mode. Values expose completed, is_active and last_accessed
+        like TopicProgress, so views and template lookups work unchanged.
+        """
+        from .topic_store import store_for
+        return store_for(self).all_states()
+
+    def topic_state(self, topic_id):
+        """The progress state of one topic, or None when it has none."""
+        from .topic_store import store_for
+        return store_for(self).load([topic_id]).get(topic_id)
+
 
 class SectionProgress(models.Model):
     course_progress = models.ForeignKey(CourseProgress, on_delete=models.CASCADE, related_name='section_progress')
@@ -57,8 +126,31 @@ class SectionProgress(models.Model):
     last_accessed = models.DateTimeField(auto_now=True)
     completed = models.BooleanField(default=False)
     is_active = models.BooleanField(default=False)  # Indicates if the section is active
+
+    # Denormalized counters, see CourseProgress
+    total_topics_count = models.PositiveIntegerField(default=0)
+    completed_topics_count = models.PositiveIntegerField(default=0)
+    required_topics_count = models.PositiveIntegerField(default=0)
+    completed_required_topics_count = models.PositiveIntegerField(default=0)
+
     def __str__(self):
         return f"{self.course_progress.enrollment_model.user.username} progress in {self.section.title}"
+
+    def is_complete(self):
+        """
+        A section is complete when all of its required topics are complete,
+        or all of its topics when none of them is marked as required.
+        """
+        if self.required_topics_count:
+            return self.completed_required_topics_count >= self.required_topics_count
+        return self.total_topics_count > 0 and self.completed_topics_count >= self.total_topics_count
+
+    def calculate_percentage(self):
+        if self.required_topics_count:
+            return (self.completed_required_topics_count / self.required_topics_count) * 100
+        if self.total_topics_count:
+            return (self.completed_topics_count / self.total_topics_count) * 100
+        return 0
     
 class TopicProgress(models.Model):
     section_progress = models.ForeignKey(SectionProgress, on_delete=models.CASCADE, related_name='topic_progress')
@@ -105,4 +197,87 @@ class Certificate(models.Model):
     
     @property
     def course(self):
-        return self.enrollment.course
\ No newline at end of file
+        return self.enrollment.course
+
+class ProgressSync(models.Model):
+    """
+    A background run bringing every enrollment of a course in line with its
+    structure after a section or topic was added, see subscribtion.tasks.
+    last_enrollment_id is the checkpoint a resumed run continues after.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    SUPERSEDED = 'superseded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (SUPERSEDED, 'Superseded'),
+        (FAILED, 'Failed'),
+    ]
+
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='progress_syncs')
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default=PENDING)
+    task_id = models.CharField(max_length=255, blank=True)
+    last_enrollment_id = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Progress sync of {self.course.title} ({self.status})"
+
+    class Meta:
+        verbose_name = "Progress Sync"
+        verbose_name_plural = "Progress Syncs"
+        ordering = ['-created_at']
+
+    @property
+    def percentage(self):
+        if not self.total:
+            return 100 if self.status == self.DONE else 0
+        return min(100, round(self.processed * 100 / self.total))
+
+
+class WatchPosition(models.Model):
+    """
+    Where a learner stopped in a video topic. Heartbeats of the player are
+    buffered in the cache and only the latest one is written, by
+    subscribtion.activity.flush().
+    """
+    course_progress = models.ForeignKey(CourseProgress, on_delete=models.CASCADE, related_name='watch_positions')
+    topic = models.ForeignKey(Topic, on_delete=models.CASCADE, related_name='+')
+    position = models.FloatField(default=0)  # Seconds into the video
+    duration = models.FloatField(default=0)
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.course_progress} at {self.position:.0f}s of topic {self.topic_id}"
+
+    class Meta:
+        verbose_name = "Watch Position"
+        verbose_name_plural = "Watch Positions"
+        unique_together = ('course_progress', 'topic')
+
+
+class BitmapLayout(models.Model):
+    """
+    The topic order of a course before a sequence rebuild moved its topics.
+    Bitmap enrollments whose bits_version is still `version` read their bits
+    through it until the progress sync rewrote them, see subscribtion.topic_store.
+    """
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='bitmap_layouts')
+    version = models.PositiveIntegerField()
+    topics = models.JSONField(default=list)  # Topic id at each position, null for gaps
+
+    def __str__(self):
+        return f"Bitmap layout {self.version} of course {self.course_id}"
+
+    class Meta:
+        verbose_name = "Bitmap Layout"
+        verbose_name_plural = "Bitmap Layouts"
+        unique_together = ('course', 'version')
@@ -0,0 +1,122 @@
+"""
+Per-enrollment progress overlay of the cached course outline.
+
+The overlay is the learner's side of the curriculum: one flags byte per topic
+and one (flags, progress, last_accessed) entry per section, both aligned with
+the order of courses.outline. It is cached under the CourseProgress id and
+progress_version, together with the outline version it was built against, so
+a structure change rebuilds it. Every path writing progress rows (the
+completion engine, resyncs, recounts) bumps progress_version in the
+transaction of its writes: the new version commits with the rows, and an
+overlay a concurrent request built from the old rows stays under the old key
+where no one reads it. Views iterate the merged curriculum() instead of
+looking progress up per section and topic.
+"""
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db.models import F
+
+from .models import CourseProgress, SectionProgress
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+# Bits of a flags byte, KNOWN is unset when the enrollment has no progress for the item
+KNOWN = 1
+ACTIVE = 2
+COMPLETED = 4
+
+ProgressSection = namedtuple('ProgressSection', 'section known completed is_active progress last_accessed topics')
+ProgressTopic = namedtuple('ProgressTopic', 'topic known completed is_active')
+
+_NO_SECTION = (0, None, None)
+
+
+def _flags(completed, is_active):
+    return KNOWN | (ACTIVE if is_active else 0) | (COMPLETED if completed else 0)
+
+
+def _topic(topic, flags):
+    return ProgressTopic(topic, bool(flags & KNOWN), bool(flags & COMPLETED), bool(flags & ACTIVE))
+
+
+class ProgressOverlay:
+    """The progress of one enrollment, aligned with an Outline."""
+
+    def __init__(self, outline, topic_flags, sections):
+        self.outline = outline
+        self.topic_flags = topic_flags  # bytes, one per outline topic
+        self.sections = sections  # (flags, progress, last_accessed) per outline section
+
+    @classmethod
+    def blank(cls, outline):
+        """An overlay without progress, for visitors who are not enrolled."""
+        return cls(outline, bytes(len(outline.topics)), (_NO_SECTION,) * len(outline.sections))
+
+    def topic_state(self, topic_id):
+        """The ProgressTopic of `topic_id`, None when it is not part of the outline."""
+        index = self.outline.position(topic_id)
+        if index is None:
+            return None
+        return _topic(self.outline.topics[index], self.topic_flags[index])
+
+    def curriculum(self):
+        """The outline sections with their progress, each with its topics' progress."""
+        offset = 0
+        for section, (flags, progress, last_accessed) in zip(self.outline.sections, self.sections):
+            topics = tuple(
+                _topic(topic, self.topic_flags[offset + index]) for index, topic in enumerate(section.topics)
+            )
+            offset += len(topics)
+            yield ProgressSection(
+                section, bool(flags & KNOWN), bool(flags & COMPLETED), bool(flags & ACTIVE),
+                progress, last_accessed, topics,
+            )
+
+    def first_active_topic(self):
+        """The first active topic of an active section, where studying resumes."""
+        for entry in self.curriculum():
+            if entry.is_active:
+                for item in entry.topics:
+                    if item.is_active:
+                        return item.topic
+        return None
+
+
+def _cache_key(course_progress_id, progress_version):
+    return f'progress-overlay:{course_progress_id}:{progress_version}'
+
+
+def _build(course_progress, outline):
+    states = course_progress.topic_states()
+    topic_flags = bytearray(len(outline.topics))
+    for index, topic in enumerate(outline.topics):
+        state = states.get(topic.id)
+        if state is not None:
+            topic_flags[index] = _flags(state.completed, state.is_active)
+    rows = {
+        section_id: (_flags(completed, is_active), progress, last_accessed)
+        for section_id, completed, is_active, progress, last_accessed in
+        SectionProgress.objects.filter(course_progress=course_progress)
+        .values_list('section_id', 'completed', 'is_active', 'progress_percentage', 'last_accessed')
+    }
+    return bytes(topic_flags), tuple(rows.get(section.id, _NO_SECTION) for section in outline.sections)
+
+
+def get_overlay(course_progress, outline):
+    """
+    The ProgressOverlay of `course_progress`, a CourseProgress with a current
+    progress_version, for `outline` (courses.outline.get_outline).
+    """
+    key = _cache_key(course_progress.pk, course_progress.progress_version)
+    cached = cache.get(key)
+    if cached is None or cached[0] != outline.version:
+        cached = (outline.version,) + _build(course_progress, outline)
+        cache.set(key, cached, CACHE_TIMEOUT)
+    return ProgressOverlay(outline, cached[1], cached[2])
+
+
+def bump_progress_version(course_progress_ids):
+    """Make the cached overlays of `course_progress_ids` unreachable. update() skips the save signals."""
+    if course_progress_ids:
+        CourseProgress.objects.filter(pk__in=course_progress_ids).update(progress_version=F('progress_version') + 1)
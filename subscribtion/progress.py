@@ -0,0 +1,102 @@
+from django.db.models import F
+from django.utils import timezone
+
+from courses.models import Section, Topic
+from .models import CourseProgress, SectionProgress
+from .topic_store import store_for
+
+SECTION_COUNTER_FIELDS = [
+    'total_topics_count', 'completed_topics_count',
+    'required_topics_count', 'completed_required_topics_count',
+]
+COURSE_COUNTER_FIELDS = SECTION_COUNTER_FIELDS + [
+    'total_sections_count', 'completed_sections_count',
+    'required_sections_count', 'completed_required_sections_count',
+]
+
+
+def _apply_course_completion(course_progress, course_completed):
+    """
+    Store the completed flag and percentage derived from the counters.
+    Returns True when this call is the one that finished the course.
+    """
+    course_progress.completed = course_completed
+    course_progress.progress_percentage = 100 if course_completed else course_progress.calculate_percentage()
+    CourseProgress.objects.filter(pk=course_progress.pk).update(
+        completed=course_progress.completed,
+        progress_percentage=course_progress.progress_percentage,
+    )
+
+    if not course_completed:
+        return False
+
+    enrollment = course_progress.enrollment_model
+    if enrollment.completed_at:
+        return False
+    enrollment.completed_at = timezone.now()
+    enrollment.save(update_fields=['completed_at'])
+    return True
+
+
+def recount_course_progress(course_progress):
+    """
+    Rebuild every counter of a CourseProgress and its SectionProgress rows from
+    the course structure and the topic state ground truth (TopicProgress rows or bits).
+    This is the repair path, the completion engine only moves counters by deltas.
+    """
+    course = course_progress.course
+
+    sections = {
+        section_id: is_required
+        for section_id, is_required in Section.objects.filter(course=course).values_list('id', 'is_required')
+    }
+    totals = {section_id: [0, 0] for section_id in sections}
+    topics = {}
+    for topic_id, section_id, is_required in Topic.objects.filter(section__course=course).values_list('id', 'section_id', 'is_required'):
+        topics[topic_id] = (section_id, is_required)
+        totals[section_id][0] += 1
+        totals[section_id][1] += 1 if is_required else 0
+
+    completed = {section_id: [0, 0] for section_id in sections}
+    for topic_id in store_for(course_progress).completed_topic_ids():
+        if topic_id in topics:
+            section_id, is_required = topics[topic_id]
+            completed[section_id][0] += 1
+            completed[section_id][1] += 1 if is_required else 0
+
+    course_counters = dict.fromkeys(COURSE_COUNTER_FIELDS, 0)
+    course_counters['total_sections_count'] = len(sections)
+    course_counters['required_sections_count'] = sum(1 for required in sections.values() if required)
+
+    section_rows = list(SectionProgress.objects.filter(course_progress=course_progress))
+    for section_progress in section_rows:
+        section_id = section_progress.section_id
+        if section_id not in sections:
+            continue
+        section_progress.total_topics_count, section_progress.required_topics_count = totals[section_id]
+        section_progress.completed_topics_count, section_progress.completed_required_topics_count = completed[section_id]
+        section_progress.completed = section_progress.is_complete()
+        section_progress.progress_percentage = section_progress.calculate_percentage()
+        if section_progress.completed:
+            course_counters['completed_sections_count'] += 1
+            if sections[section_id]:
+                course_counters['completed_required_sections_count'] += 1
+
+    for section_id in sections:
+        course_counters['total_topics_count'] += totals[section_id][0]
+        course_counters['required_topics_count'] += totals[section_id][1]
+        course_counters['completed_topics_count'] += completed[section_id][0]
+        course_counters['completed_required_topics_count'] += completed[section_id][1]
+
+    SectionProgress.objects.bulk_update(
+        section_rows, SECTION_COUNTER_FIELDS + ['completed', 'progress_percentage'], batch_size=500
+    )
+
+    for field, value in course_counters.items():
+        setattr(course_progress, field, value)
+    # A new progress_version makes the cached overlay unreachable, see subscribtion.overlay
+    CourseProgress.objects.filter(pk=course_progress.pk).update(
+        progress_version=F('progress_version') + 1, **course_counters,
+    )
+    _apply_course_completion(course_progress, course_progress.is_complete())
+    return course_progress
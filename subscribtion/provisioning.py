@@ -0,0 +1,233 @@
+from collections import Counter, namedtuple
+
+from django.db import transaction
+
+from courses import sequence
+from courses.models import Course, Section, Topic, TopicSequence
+from .models import CourseProgress, SectionProgress, TopicProgress
+from .progress import recount_course_progress
+from .topic_store import bits_from_positions, default_storage_mode
+
+# Rows per INSERT when bulk creating progress records
+BULK_BATCH_SIZE = 500
+
+# What a provisioning run created for an enrollment
+ProvisioningReport = namedtuple(
+    'ProvisioningReport',
+    ['course_progress', 'course_progress_created', 'sections_created', 'topics_created']
+)
+
+# Process-wide counters of provisioning work. Enrolling must walk the course
+# tree exactly once, tests assert on the 'runs' delta to keep it that way.
+provisioning_stats = Counter()
+
+
+def _section_is_active(course, index):
+    """
+    For unlocked courses every section is active, for locked courses only the
+    first one is. Managed courses start with everything inactive.
+    """
+    if course.course_type == Course.UNLOCKED:
+        return True
+    return course.course_type == Course.LOCKED and index == 0
+
+
+def _topic_is_active(course, section_active, index):
+    """
+    For unlocked courses every topic is active, for locked courses only the
+    first topic of the active section is.
+    """
+    if course.course_type == Course.UNLOCKED:
+        return True
+    return course.course_type == Course.LOCKED and section_active and index == 0
+
+
+def provision_course_progress(enrollment):
+    """
+    Build the whole CourseProgress / SectionProgress / TopicProgress tree for an
+    enrollment with a fixed number of queries, regardless of the course size.
+
+    This is the single provisioning path: it runs from the Enrollment post_save
+    receiver, so it executes once per enrollment inside the transaction that
+    created it. Views must not call it again after creating an enrollment.
+
+    The course structure is read with two set-based queries and the missing
+    progress rows are written with bulk inserts. Rows that already exist are
+    never touched, which keeps the learner's completed / active state intact.
+    Enrollments in sparse storage mode get no TopicProgress rows up front,
+    bitmap enrollments get their topic states as bits on the CourseProgress row.
+
+    Returns a ProvisioningReport describing what was created.
+    """
+    with transaction.atomic():
+        report = _provision(enrollment)
+
+    provisioning_stats['runs'] += 1
+    provisioning_stats['sections_created'] += report.sections_created
+    provisioning_stats['topics_created'] += report.topics_created
+    return report
+
+
+def ensure_course_progress(enrollment):
+    """
+    Return the CourseProgress of an enrollment, provisioning it only when it is
+    missing (enrollments created before the post_save receiver existed).
+    Use this in views instead of provisioning unconditionally.
+    """
+    try:
+        return CourseProgress.objects.get(enrollment_model=enrollment)
+    except CourseProgress.DoesNotExist:
+        return provision_course_progress(enrollment).course_progress
+
+
+def _provision(enrollment):
+    course = enrollment.course
+
+    course_progress, course_progress_created = CourseProgress.objects.get_or_create(
+        enrollment_model=enrollment,
+        defaults={
+            'progress_percentage': 0.0,
+            'completed': False,
+            'storage_mode': default_storage_mode(),
+        }
+    )
+
+    sections = list(Section.objects.filter(course=course).order_by('created_at', 'id'))
+    if not sections:
+        return ProvisioningReport(course_progress, course_progress_created, 0, 0)
+
+    # One query for every topic of the course, grouped by section in Python
+    topics_by_section = {section.id: [] for section in sections}
+    required_by_section = dict.fromkeys(topics_by_section, 0)
+    topic_rows = (
+        Topic.objects.filter(section__course=course)
+        .order_by('created_at', 'id')
+        .values_list('id', 'section_id', 'is_required')
+    )
+    for topic_id, section_id, is_required in topic_rows:
+        topics_by_section[section_id].append(topic_id)
+        if is_required:
+            required_by_section[section_id] += 1
+
+    # A freshly created CourseProgress cannot have children yet
+    if course_progress_created:
+        existing_section_ids = {}
+    else:
+        existing_section_ids = dict(
+            SectionProgress.objects.filter(course_progress=course_progress)
+            .values_list('section_id', 'id')
+        )
+
+    section_active = {}
+    new_sections = []
+    for index, section in enumerate(sections):
+        is_active = _section_is_active(course, index)
+        section_active[section.id] = is_active
+        if section.id not in existing_section_ids:
+            new_sections.append(SectionProgress(
+                course_progress=course_progress,
+                section=section,
+                progress_percentage=0.0,
+                completed=False,
+                is_active=is_active,
+                total_topics_count=len(topics_by_section[section.id]),
+                required_topics_count=required_by_section[section.id],
+            ))
+
+    if new_sections:
+        SectionProgress.objects.bulk_create(new_sections, batch_size=BULK_BATCH_SIZE)
+        # Not every backend returns primary keys from bulk inserts, re-read them
+        section_progress_ids = dict(
+            SectionProgress.objects.filter(course_progress=course_progress)
+            .values_list('section_id', 'id')
+        )
+    else:
+        section_progress_ids = existing_section_ids
+
+    if course_progress.storage_mode != CourseProgress.ROWS:
+        # Sparse enrollments materialize topic rows on first use, see topic_store.SparseStore
+        if course_progress.storage_mode == CourseProgress.BITMAP:
+            _provision_bits(course, course_progress, course_progress_created, topics_by_section, section_active)
+        return _finish(course_progress, course_progress_created, sections, topics_by_section,
+                       required_by_section, len(new_sections), 0)
+
+    if course_progress_created:
+        existing_topic_ids = set()
+    else:
+        existing_topic_ids = set(
+            TopicProgress.objects.filter(section_progress__course_progress=course_progress)
+            .values_list('topic_id', flat=True)
+        )
+
+    new_topics = []
+    for section in sections:
+        for index, topic_id in enumerate(topics_by_section[section.id]):
+            if topic_id in existing_topic_ids:
+                continue
+            new_topics.append(TopicProgress(
+                section_progress_id=section_progress_ids[section.id],
+                topic_id=topic_id,
+                completed=False,
+                is_active=_topic_is_active(course, section_active[section.id], index),
+            ))
+
+    if new_topics:
+        TopicProgress.objects.bulk_create(new_topics, batch_size=BULK_BATCH_SIZE)
+
+    return _finish(course_progress, course_progress_created, sections, topics_by_section,
+                   required_by_section, len(new_sections), len(new_topics))
+
+
+def _sequence_positions(course):
+    """Topic id -> TopicSequence position, and the Course.sequence_version they are at."""
+    rows = list(
+        TopicSequence.objects.filter(course=course).values_list('topic_id', 'position', 'course__sequence_version')
+    )
+    return {topic_id: position for topic_id, position, _ in rows}, rows[0][2] if rows else course.sequence_version
+
+
+def _provision_bits(course, course_progress, course_progress_created, topics_by_section, section_active):
+    """
+    Bitmap mode: the initial active topics become bits of the CourseProgress
+    row, no TopicProgress rows are written. An existing bitmap is left alone.
+    """
+    if not course_progress_created:
+        return
+
+    positions, version = _sequence_positions(course)
+    topic_count = sum(len(topics) for topics in topics_by_section.values())
+    if len(positions) != topic_count:
+        sequence.rebuild_course_sequence(course.id)
+        positions, version = _sequence_positions(course)
+
+    active_positions = [
+        positions[topic_id]
+        for section_id, topic_ids in topics_by_section.items()
+        for index, topic_id in enumerate(topic_ids)
+        if _topic_is_active(course, section_active[section_id], index)
+    ]
+    course_progress.active_bits = bits_from_positions(active_positions)
+    course_progress.bits_version = version
+    CourseProgress.objects.filter(pk=course_progress.pk).update(
+        active_bits=course_progress.active_bits, bits_version=version,
+    )
+
+
+def _finish(course_progress, course_progress_created, sections, topics_by_section,
+            required_by_section, sections_created, topics_created):
+    if course_progress_created:
+        # Nothing is completed yet, only the structure totals need storing
+        totals = {
+            'total_topics_count': sum(len(topics) for topics in topics_by_section.values()),
+            'required_topics_count': sum(required_by_section.values()),
+            'total_sections_count': len(sections),
+            'required_sections_count': sum(1 for section in sections if section.is_required),
+        }
+        CourseProgress.objects.filter(pk=course_progress.pk).update(**totals)
+        for field, value in totals.items():
+            setattr(course_progress, field, value)
+    else:
+        # Filling in an older tree, the structure may have changed since
+        recount_course_progress(course_progress)
+
+    return ProvisioningReport(course_progress, course_progress_created, sections_created, topics_created)
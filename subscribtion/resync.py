@@ -0,0 +1,355 @@
+"""
+Set-based resynchronisation of progress rows with the course structure.
+
+Used when the curriculum changes under existing enrollments (see
+subscribtion.tasks) and by the recompute_progress command. It works on one
+chunk of enrollments of a course at a time, with a fixed number of queries per
+chunk: missing SectionProgress / TopicProgress rows are created, the topic
+states are read as ground truth, and every counter, completion flag and
+percentage is recomputed from them. Locked courses also get the topics that
+the completion engine would have unlocked.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from courses import sequence
+from courses.models import Course, Section, Topic, TopicSequence
+from . import overlay
+from .models import CourseProgress, Enrollment, SectionProgress, TopicProgress
+from .progress import SECTION_COUNTER_FIELDS, COURSE_COUNTER_FIELDS
+from .provisioning import BULK_BATCH_SIZE, _section_is_active, provision_course_progress
+from .topic_store import BitmapStore, TopicState, bits_from_positions
+
+ResyncReport = namedtuple('ResyncReport', ['enrollments', 'last_enrollment_id', 'changes'])
+
+SECTION_FIELDS = SECTION_COUNTER_FIELDS + ['completed', 'is_active', 'progress_percentage']
+COURSE_FIELDS = COURSE_COUNTER_FIELDS + ['completed', 'progress_percentage', 'completed_bits', 'active_bits', 'bits_version']
+
+
+def _percentage(value):
+    """Round like the DecimalField stores it, so unchanged values compare equal."""
+    return Decimal(str(value)).quantize(Decimal('0.01'))
+
+
+class CourseStructure:
+    """The sections and the topic sequence of a course, read once per run."""
+
+    def __init__(self, course):
+        self.course = course
+        self.sections = list(
+            Section.objects.filter(course=course).order_by('created_at', 'id').values_list('id', 'is_required')
+        )
+        self.topics, self.sequence_version = self._sequence()
+        if len(self.topics) != Topic.objects.filter(section__course=course).count():
+            sequence.rebuild_course_sequence(course.pk)
+            self.topics, self.sequence_version = self._sequence()
+
+        self.positions = {topic_id: position for topic_id, _, position, _ in self.topics}
+        self.totals = {section_id: [0, 0] for section_id, _ in self.sections}
+        self.first_of_section = set()
+        self.previous = {}  # topic id -> (topic id, section id) of the topic before it
+        previous = None
+        for topic_id, section_id, _, is_required in self.topics:
+            self.totals[section_id][0] += 1
+            self.totals[section_id][1] += 1 if is_required else 0
+            if previous is None or previous[1] != section_id:
+                self.first_of_section.add(topic_id)
+            self.previous[topic_id] = previous
+            previous = (topic_id, section_id)
+
+    def _sequence(self):
+        """The (topic id, section id, position, required) rows and the Course.sequence_version they are at."""
+        rows = list(
+            TopicSequence.objects.filter(course=self.course)
+            .order_by('position')
+            .values_list('topic_id', 'section_id', 'position', 'topic__is_required', 'course__sequence_version')
+        )
+        return [row[:4] for row in rows], rows[0][4] if rows else self.course.sequence_version
+
+    def default_active(self, topic_id):
+        """The active state a topic starts with, see provisioning._topic_is_active."""
+        if self.course.course_type == Course.UNLOCKED:
+            return True
+        if self.course.course_type != Course.LOCKED or not self.topics:
+            return False
+        first_topic_id, first_section_id = self.topics[0][0], self.topics[0][1]
+        return topic_id == first_topic_id and first_section_id == self.sections[0][0]
+
+
+def enrollment_chunks(course, after_id=0, chunk_size=BULK_BATCH_SIZE, provision=True):
+    """
+    Keyset pagination over the enrollments of a course, ordered by id.
+    Yields lists of CourseProgress ids, provisioning enrollments that have
+    none, or skipping them when `provision` is off.
+    """
+    while True:
+        rows = list(
+            Enrollment.objects.filter(course=course, id__gt=after_id)
+            .order_by('id')
+            .values_list('id', 'progress__id')[:chunk_size]
+        )
+        if not rows:
+            return
+        missing = [enrollment_id for enrollment_id, course_progress_id in rows if course_progress_id is None]
+        provisioned = {}
+        if provision:
+            for enrollment in Enrollment.objects.filter(id__in=missing).select_related('course'):
+                provisioned[enrollment.id] = provision_course_progress(enrollment).course_progress.pk
+        yield [
+            course_progress_id or provisioned[enrollment_id]
+            for enrollment_id, course_progress_id in rows
+            if course_progress_id or enrollment_id in provisioned
+        ]
+        after_id = rows[-1][0]
+
+
+def resync_chunk(structure, course_progress_ids, dry_run=False):
+    """
+    Bring the progress rows of `course_progress_ids` (enrollments of one
+    course) in line with `structure`. The CourseProgress rows are locked like
+    the completion engine locks them, so a learner completing a topic at the
+    same time waits for the chunk. With dry_run nothing is written. Returns a
+    ResyncReport whose changes use the completion engine's diff format.
+    """
+    with transaction.atomic():
+        course_progresses = list(
+            CourseProgress.objects.select_for_update(of=('self',))
+            .select_related('enrollment_model')
+            .filter(pk__in=course_progress_ids)
+            .order_by('enrollment_model_id')
+        )
+        return _Resync(structure, course_progresses, dry_run).run()
+
+
+class _Resync:
+
+    def __init__(self, structure, course_progresses, dry_run):
+        self.structure = structure
+        self.course = structure.course
+        self.course_progresses = course_progresses
+        self.dry_run = dry_run
+        self.now = timezone.now()
+        self.changes = []
+        self.original = {}
+
+    def _remember(self, obj, fields, model_name):
+        self.original[id(obj)] = (model_name, {field: getattr(obj, field) for field in fields})
+
+    def _changed(self, obj, created=False):
+        """Record the diff of a row, True when an existing row has to be written."""
+        model_name, original = self.original[id(obj)]
+        fields = {
+            field: [old, getattr(obj, field)]
+            for field, old in original.items()
+            if getattr(obj, field) != old
+        }
+        if fields or created:
+            self.changes.append({'model': model_name, 'id': obj.pk, 'created': created, 'fields': fields})
+        return bool(fields) and not created
+
+    # -- loading -------------------------------------------------------------
+
+    def _load_sections(self, ids):
+        section_ids = [section_id for section_id, _ in self.structure.sections]
+        sections = {course_progress_id: {} for course_progress_id in ids}
+        rows = SectionProgress.objects.filter(course_progress_id__in=ids, section_id__in=section_ids).order_by('id')
+        for section_progress in rows:
+            sections[section_progress.course_progress_id].setdefault(section_progress.section_id, section_progress)
+
+        for course_progress_id, section_rows in sections.items():
+            for index, section_id in enumerate(section_ids):
+                if section_id not in section_rows:
+                    section_rows[section_id] = SectionProgress(
+                        course_progress_id=course_progress_id,
+                        section_id=section_id,
+                        progress_percentage=Decimal('0.00'),
+                        completed=False,
+                        is_active=_section_is_active(self.course, index),
+                    )
+                self._remember(section_rows[section_id], SECTION_FIELDS, 'SectionProgress')
+        return sections
+
+    def _load_topic_states(self, ids):
+        """Topic id -> state for every topic of every enrollment, placeholders for missing rows."""
+        states = {course_progress_id: {} for course_progress_id in ids}
+        row_ids = [cp.pk for cp in self.course_progresses if cp.storage_mode != CourseProgress.BITMAP]
+        if row_ids:
+            rows = (
+                TopicProgress.objects.filter(section_progress__course_progress_id__in=row_ids, topic_id__in=self.structure.positions)
+                .annotate(course_progress_id=F('section_progress__course_progress_id'))
+                .order_by('id')
+            )
+            for topic_progress in rows:
+                states[topic_progress.course_progress_id].setdefault(topic_progress.topic_id, topic_progress)
+
+        for course_progress in self.course_progresses:
+            topic_states = states[course_progress.pk]
+            if course_progress.storage_mode == CourseProgress.BITMAP:
+                topic_states.update(
+                    BitmapStore(course_progress, self.structure.positions, self.structure.sequence_version).all_states()
+                )
+            for topic_id in self.structure.positions:
+                if topic_id not in topic_states:
+                    topic_states[topic_id] = TopicState(topic_id, is_active=self.structure.default_active(topic_id))
+        return states
+
+    # -- evaluation ----------------------------------------------------------
+
+    def _recount(self, course_progress, section_rows, topic_states):
+        completed = {section_id: [0, 0] for section_id, _ in self.structure.sections}
+        for topic_id, section_id, _, is_required in self.structure.topics:
+            if topic_states[topic_id].completed:
+                completed[section_id][0] += 1
+                completed[section_id][1] += 1 if is_required else 0
+
+        counters = dict.fromkeys(COURSE_COUNTER_FIELDS, 0)
+        counters['total_sections_count'] = len(self.structure.sections)
+        for section_id, is_required in self.structure.sections:
+            section_progress = section_rows[section_id]
+            section_progress.total_topics_count, section_progress.required_topics_count = self.structure.totals[section_id]
+            section_progress.completed_topics_count, section_progress.completed_required_topics_count = completed[section_id]
+            section_progress.completed = section_progress.is_complete()
+            section_progress.progress_percentage = _percentage(section_progress.calculate_percentage())
+
+            counters['total_topics_count'] += section_progress.total_topics_count
+            counters['required_topics_count'] += section_progress.required_topics_count
+            counters['completed_topics_count'] += section_progress.completed_topics_count
+            counters['completed_required_topics_count'] += section_progress.completed_required_topics_count
+            counters['required_sections_count'] += 1 if is_required else 0
+            if section_progress.completed:
+                counters['completed_sections_count'] += 1
+                counters['completed_required_sections_count'] += 1 if is_required else 0
+
+        for field, value in counters.items():
+            setattr(course_progress, field, value)
+
+    def _unlock(self, course_progress, section_rows, topic_states):
+        """
+        Locked courses: activate every topic the completion engine would have
+        unlocked, the topic after a completed one and the first topic after a
+        completed section. Returns the ids of the topics activated.
+        """
+        activated = set()
+        if self.course.course_type != Course.LOCKED:
+            return activated
+        for topic_id, section_id, _, _ in self.structure.topics:
+            state = topic_states[topic_id]
+            previous = self.structure.previous[topic_id]
+            if not state.is_active and previous:
+                previous_id, previous_section_id = previous
+                after_completed_section = topic_id in self.structure.first_of_section and section_rows[previous_section_id].completed
+                if topic_states[previous_id].completed or after_completed_section:
+                    state.is_active = True
+                    activated.add(topic_id)
+            if state.is_active:
+                section_rows[section_id].is_active = True
+        return activated
+
+    def _finish(self, course_progress):
+        completed = course_progress.is_complete()
+        course_progress.completed = completed
+        course_progress.progress_percentage = _percentage(100 if completed else course_progress.calculate_percentage())
+        enrollment = course_progress.enrollment_model
+        if completed and not enrollment.completed_at:
+            enrollment.completed_at = self.now
+            return True
+        return False
+
+    def run(self):
+        ids = [course_progress.pk for course_progress in self.course_progresses]
+        for course_progress in self.course_progresses:
+            self._remember(course_progress, COURSE_FIELDS, 'CourseProgress')
+        sections = self._load_sections(ids)
+        states = self._load_topic_states(ids)
+
+        new_topics, dirty_topics = [], []  # new_topics holds (course progress id, section id, row)
+        dirty_sections, dirty_courses, finished = [], [], []
+        for course_progress in self.course_progresses:
+            section_rows = sections[course_progress.pk]
+            topic_states = states[course_progress.pk]
+            self._recount(course_progress, section_rows, topic_states)
+            activated = self._unlock(course_progress, section_rows, topic_states)
+
+            if course_progress.storage_mode == CourseProgress.BITMAP:
+                positions = self.structure.positions
+                course_progress.completed_bits = bits_from_positions(
+                    positions[topic_id] for topic_id, state in topic_states.items() if state.completed
+                )
+                course_progress.active_bits = bits_from_positions(
+                    positions[topic_id] for topic_id, state in topic_states.items() if state.is_active
+                )
+                course_progress.bits_version = self.structure.sequence_version
+            else:
+                for topic_id, section_id, _, _ in self.structure.topics:
+                    state = topic_states[topic_id]
+                    if isinstance(state, TopicProgress):
+                        if topic_id in activated:
+                            dirty_topics.append(state)
+                    elif course_progress.storage_mode == CourseProgress.ROWS or topic_id in activated:
+                        # Eager enrollments get every missing row, sparse ones only unlocked topics
+                        row = TopicProgress(topic_id=topic_id, completed=False, is_active=state.is_active)
+                        new_topics.append((course_progress.pk, section_id, row))
+
+            for section_progress in section_rows.values():
+                if self._changed(section_progress, created=section_progress.pk is None):
+                    dirty_sections.append(section_progress)
+            if self._finish(course_progress):
+                finished.append(course_progress.enrollment_model)
+            if self._changed(course_progress):
+                dirty_courses.append(course_progress)
+
+        for topic_progress in dirty_topics:
+            self.changes.append({
+                'model': 'TopicProgress', 'id': topic_progress.pk, 'created': False,
+                'fields': {'is_active': [False, True]},
+            })
+        for _, _, topic_progress in new_topics:
+            self.changes.append({
+                'model': 'TopicProgress', 'id': None, 'created': True,
+                'fields': {'topic_id': [None, topic_progress.topic_id], 'is_active': [None, topic_progress.is_active]},
+            })
+        for enrollment in finished:
+            self.changes.append({
+                'model': 'Enrollment', 'id': enrollment.pk, 'created': False,
+                'fields': {'completed_at': [None, enrollment.completed_at]},
+            })
+
+        if not self.dry_run:
+            self._write(ids, sections, new_topics, dirty_topics, dirty_sections, dirty_courses, finished)
+        last_id = max((cp.enrollment_model_id for cp in self.course_progresses), default=0)
+        return ResyncReport(len(self.course_progresses), last_id, self.changes)
+
+    # -- writing -------------------------------------------------------------
+
+    def _write(self, ids, sections, new_topics, dirty_topics, dirty_sections, dirty_courses, finished):
+        new_sections = [
+            section_progress
+            for section_rows in sections.values()
+            for section_progress in section_rows.values()
+            if section_progress.pk is None
+        ]
+        if new_sections:
+            SectionProgress.objects.bulk_create(new_sections, batch_size=BULK_BATCH_SIZE)
+
+        if new_topics:
+            # Not every backend returns primary keys from bulk inserts, re-read them
+            section_progress_ids = {
+                (course_progress_id, section_id): section_progress_id
+                for course_progress_id, section_id, section_progress_id in
+                SectionProgress.objects.filter(course_progress_id__in=ids).values_list('course_progress_id', 'section_id', 'id')
+            }
+            for course_progress_id, section_id, topic_progress in new_topics:
+                topic_progress.section_progress_id = section_progress_ids[(course_progress_id, section_id)]
+            TopicProgress.objects.bulk_create([row for _, _, row in new_topics], batch_size=BULK_BATCH_SIZE)
+
+        for topic_progress in dirty_topics:
+            topic_progress.last_accessed = self.now
+        TopicProgress.objects.bulk_update(dirty_topics, ['is_active', 'last_accessed'], batch_size=BULK_BATCH_SIZE)
+        SectionProgress.objects.bulk_update(dirty_sections, SECTION_FIELDS, batch_size=BULK_BATCH_SIZE)
+        CourseProgress.objects.bulk_update(dirty_courses, COURSE_FIELDS, batch_size=BULK_BATCH_SIZE)
+        Enrollment.objects.bulk_update(finished, ['completed_at'], batch_size=BULK_BATCH_SIZE)
+        overlay.bump_progress_version(ids)
@@ -0,0 +1,50 @@
+# subscribtion/serializers.py
+import math
+
+from rest_framework import serializers
+
+# Upper bound of completions accepted in one sync request
+MAX_BATCH_COMPLETIONS = 500
+
+
+class TopicCompletionSerializer(serializers.Serializer):
+    topic = serializers.IntegerField(min_value=1)
+    completed_at = serializers.DateTimeField(required=False)
+
+
+class CompletionBatchSerializer(serializers.Serializer):
+    """
+    A replay of completions recorded while the client was offline, e.g.
+    {"completions": [{"topic": 12, "completed_at": "2025-04-01T10:15:00Z"}, ...]}
+    """
+    completions = TopicCompletionSerializer(many=True, allow_empty=False)
+
+    def validate_completions(self, completions):
+        if len(completions) > MAX_BATCH_COMPLETIONS:
+            raise serializers.ValidationError(f"At most {MAX_BATCH_COMPLETIONS} completions per request.")
+        return completions
+
+    def timestamps(self):
+        """Topic id -> completion time, keeping the earliest when a topic is repeated."""
+        stamps = {}
+        for item in self.validated_data['completions']:
+            stamp = item.get('completed_at')
+            if stamp and (item['topic'] not in stamps or stamp < stamps[item['topic']]):
+                stamps[item['topic']] = stamp
+        return stamps
+
+    def topic_ids(self):
+        return [item['topic'] for item in self.validated_data['completions']]
+
+
+class WatchHeartbeatSerializer(serializers.Serializer):
+    """Playback position of a video topic in seconds, {"position": 754.2, "duration": 1800.0}"""
+    position = serializers.FloatField(min_value=0)
+    duration = serializers.FloatField(min_value=0)
+
+    def validate(self, data):
+        if not all(math.isfinite(value) for value in data.values()):
+            raise serializers.ValidationError("Position and duration must be finite numbers.")
+        if data['duration'] and data['position'] > data['duration']:
+            raise serializers.ValidationError("The position lies past the end of the video.")
+        return data
@@ -1,98 +1,72 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
-from .models import Enrollment, CourseProgress, SectionProgress, TopicProgress
-from courses.models import Course, Section, Topic
+from courses.models import Section, Topic
+from courses.sequence import sequence_rebuilt
+from .models import Enrollment
+from .provisioning import provision_course_progress
+from .tasks import schedule_progress_sync
+from .topic_store import record_bitmap_layout
 
 @receiver(post_save, sender=Enrollment)
 def create_progress_on_enrollment(sender, instance, created, **kwargs):
     """
-    Modified signal handler that doesn't use is_active field
-    if it doesn't exist in the database schema yet.
+    Build the progress tree for a new enrollment.
+    The heavy lifting is done by the bulk provisioning engine so the cost
+    no longer grows with the number of sections and topics in the course.
     """
     if not created:
         return
-        
-    # Create course progress
-    course_progress, created = CourseProgress.objects.get_or_create(
-        enrollment_model=instance,
-        defaults={
-            'progress_percentage': 0.0,
-            'completed': False
-        }
+
+    provision_course_progress(instance)
+
+
+@receiver(sequence_rebuilt)
+def remap_progress_bits(sender, course_id, old_topics, new_positions, version, **kwargs):
+    """
+    Bitmap enrollments index topics by sequence position. Their bits are read
+    through the replaced layout until the progress sync, queued once the
+    rebuild committed, rewrote them chunk by chunk.
+    """
+    if record_bitmap_layout(course_id, old_topics, new_positions, version):
+        transaction.on_commit(lambda: schedule_progress_sync(course_id))
+
+
+@receiver(post_init, sender=Section)
+@receiver(post_init, sender=Topic)
+def remember_counted_fields(sender, instance, **kwargs):
+    """The fields the progress counters depend on as loaded, so a save knows whether they changed."""
+    # __dict__ so deferred fields are not loaded here
+    instance._stored_counted = (
+        (instance.__dict__.get('is_required'), instance.__dict__.get('section_id')) if instance.pk else None
     )
-    
-    # Get all sections for the course
-    course = instance.course
-    sections = Section.objects.filter(course=course).order_by('created_at')
-    
-    # Track if we've set the first section/topic active (for locked courses)
-    first_section_done = False
-    
-    # Create section progress for each section
-    for index, section in enumerate(sections):
-        # Determine if this section should be active
-        is_active = False
-        if course.course_type == Course.UNLOCKED:
-            # For unlocked courses, all sections are active
-            is_active = True
-        elif course.course_type == Course.LOCKED and not first_section_done:
-            # For locked courses, only the first section is active
-            is_active = True
-            first_section_done = True
-        
-        # Create section progress - don't use is_active if the field doesn't exist
-        try:
-            section_progress, section_created = SectionProgress.objects.get_or_create(
-                course_progress=course_progress,
-                section=section,
-                defaults={
-                    'progress_percentage': 0.0,
-                    'completed': False,
-                    'is_active': is_active  # May cause error if field doesn't exist
-                }
-            )
-        except Exception:
-            # Fallback if is_active doesn't exist in database yet
-            section_progress, section_created = SectionProgress.objects.get_or_create(
-                course_progress=course_progress,
-                section=section,
-                defaults={
-                    'progress_percentage': 0.0,
-                    'completed': False
-                }
-            )
-        
-        # Create topic progress for each topic in this section
-        topics = Topic.objects.filter(section=section).order_by('created_at')
-        first_topic_done = False
-        
-        for topic_index, topic in enumerate(topics):
-            # Determine if this topic should be active
-            topic_is_active = False
-            if course.course_type == Course.UNLOCKED:
-                # For unlocked courses, all topics are active
-                topic_is_active = True
-            elif course.course_type == Course.LOCKED and is_active and not first_topic_done:
-                # For locked courses, only the first topic of the active section is active
-                topic_is_active = True
-                first_topic_done = True
-            
-            # Create topic progress - don't use is_active if the field doesn't exist
-            try:
-                topic_progress, topic_created = TopicProgress.objects.get_or_create(
-                    section_progress=section_progress,
-                    topic=topic,
-                    defaults={
-                        'completed': False,
-                        'is_active': topic_is_active  # May cause error if field doesn't exist
-                    }
-                )
-            except Exception:
-                # Fallback if is_active doesn't exist in database yet
-                topic_progress, topic_created = TopicProgress.objects.get_or_create(
-                    section_progress=section_progress,
-                    topic=topic,
-                    defaults={
-                        'completed': False
-                    }
-                )
\ No newline at end of file
+
+
+def _course_id(sender, instance):
+    if sender is Section:
+        return instance.course_id
+    # The section is gone when it is the one being deleted, its own signal syncs the course
+    return Section.objects.filter(pk=instance.section_id).values_list('course_id', flat=True).first()
+
+
+@receiver(post_save, sender=Section)
+@receiver(post_save, sender=Topic)
+@receiver(post_delete, sender=Section)
+@receiver(post_delete, sender=Topic)
+def sync_progress_on_curriculum_change(sender, instance, created=False, raw=False, **kwargs):
+    """
+    Existing enrollments need progress rows for new content, and recounted
+    totals whenever content is added, deleted, marked required or optional,
+    or a topic moves to another section. The work is queued once the staff
+    request committed.
+    """
+    if raw:
+        return
+    if kwargs['signal'] is post_save:
+        stored = instance._stored_counted
+        instance._stored_counted = (instance.is_required, getattr(instance, 'section_id', None))
+        if not created and stored == instance._stored_counted:
+            return
+    course_id = _course_id(sender, instance)
+    if course_id:
+        transaction.on_commit(lambda: schedule_progress_sync(course_id))
@@ -0,0 +1,113 @@
+"""
+Celery tasks propagating curriculum changes to existing enrollments.
+
+Adding a section or topic schedules a ProgressSync for the course once the
+staff request committed. The worker walks the enrollments in keyset chunks,
+resyncing each chunk in its own transaction (see subscribtion.resync) and
+checkpointing the last enrollment id after it, so a crashed or restarted
+run continues where it stopped. Re-running a chunk is harmless, the resync
+only writes what differs from the course structure.
+"""
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.db.models import F
+from django.utils import timezone
+
+from . import activity
+from .models import Enrollment, ProgressSync
+from .resync import CourseStructure, enrollment_chunks, resync_chunk
+
+logger = logging.getLogger(__name__)
+
+# Enrollments resynced per transaction, and per checkpoint
+SYNC_CHUNK_SIZE = 200
+# A running sync without a checkpoint for this long is assumed to be dead
+STALE_AFTER = timedelta(minutes=10)
+
+
+def _dispatch(sync):
+    try:
+        sync_course_progress.apply_async((sync.pk,), retry=False)
+    except Exception:
+        # Broker unavailable: the sync stays pending, resume_progress_syncs picks it up
+        logger.exception("Could not queue progress sync %s", sync.pk)
+
+
+def schedule_progress_sync(course_id):
+    """
+    Queue a sync of every enrollment of a course, replacing the unfinished
+    ones, which would only repeat the work. Returns the ProgressSync, or None
+    when the course has no enrollments.
+    """
+    total = Enrollment.objects.filter(course_id=course_id).count()
+    if not total:
+        return None
+    ProgressSync.objects.filter(
+        course_id=course_id, status__in=[ProgressSync.PENDING, ProgressSync.RUNNING]
+    ).update(status=ProgressSync.SUPERSEDED, updated_at=timezone.now())
+    sync = ProgressSync.objects.create(course_id=course_id, total=total)
+    _dispatch(sync)
+    return sync
+
+
+@shared_task(bind=True, acks_late=True)
+def sync_course_progress(self, sync_id):
+    """Run or resume a ProgressSync, reporting PROGRESS states with processed / total."""
+    sync = ProgressSync.objects.select_related('course').filter(pk=sync_id).first()
+    if sync is None or sync.status not in (ProgressSync.PENDING, ProgressSync.RUNNING):
+        return sync.status if sync else None
+
+    ProgressSync.objects.filter(pk=sync_id).update(
+        status=ProgressSync.RUNNING, task_id=self.request.id or '', updated_at=timezone.now(),
+    )
+    processed = sync.processed
+    try:
+        structure = CourseStructure(sync.course)
+        for course_progress_ids in enrollment_chunks(sync.course, sync.last_enrollment_id, SYNC_CHUNK_SIZE):
+            report = resync_chunk(structure, course_progress_ids)
+            processed += report.enrollments
+            checkpointed = ProgressSync.objects.filter(pk=sync_id, status=ProgressSync.RUNNING).update(
+                last_enrollment_id=report.last_enrollment_id,
+                processed=F('processed') + report.enrollments,
+                updated_at=timezone.now(),
+            )
+            if not checkpointed:
+                # A newer sync of the course took over
+                return ProgressSync.SUPERSEDED
+            if self.request.id and not self.request.is_eager:
+                self.update_state(state='PROGRESS', meta={'processed': processed, 'total': sync.total})
+    except Exception as exc:
+        ProgressSync.objects.filter(pk=sync_id).update(
+            status=ProgressSync.FAILED, error=str(exc), updated_at=timezone.now(),
+        )
+        raise
+
+    ProgressSync.objects.filter(pk=sync_id, status=ProgressSync.RUNNING).update(
+        status=ProgressSync.DONE, updated_at=timezone.now(),
+    )
+    return ProgressSync.DONE
+
+
+@shared_task
+def resume_progress_syncs():
+    """Periodic: queue syncs that never reached a worker or whose worker died."""
+    stale = timezone.now() - STALE_AFTER
+    syncs = list(ProgressSync.objects.filter(
+        status__in=[ProgressSync.PENDING, ProgressSync.RUNNING], updated_at__lt=stale,
+    ))
+    # Give the requeued runs a full period before they count as stale again
+    ProgressSync.objects.filter(pk__in=[sync.pk for sync in syncs]).update(updated_at=timezone.now())
+    for sync in syncs:
+        _dispatch(sync)
+    return len(syncs)
+
+
+@shared_task
+def flush_activity():
+    """Write the buffered last accessed timestamps, see subscribtion.activity."""
+    written = activity.flush()
+    if written:
+        logger.info("Flushed the activity of %s enrollments", written)
+    return written
@@ -1,3 +1,647 @@
-from django.test import TestCase
+from decimal import Decimal
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from accounts.models import User
+
+from courses.models import Course, Section, Topic
+from courses.outline import get_outline
+from learning_platform.testing import SharedCacheMixin, create_course, create_curriculum, create_learner
+from subscribtion import activity
+from subscribtion.checks import check_activity_cache
+from subscribtion.completion import complete_topics, progress_snapshot
+from subscribtion.models import BitmapLayout, CourseProgress, Enrollment, ProgressSync, SectionProgress, TopicProgress, WatchPosition
+from subscribtion.overlay import get_overlay
+from subscribtion.provisioning import provision_course_progress, provisioning_stats
+from subscribtion.resync import CourseStructure, resync_chunk
+from subscribtion.tasks import sync_course_progress
+from subscribtion.topic_store import bits_from_positions
+
+
+class ProvisioningTests(TestCase):
+    """The progress tree must be walked exactly once per enrollment."""
+
+    def setUp(self):
+        self.course = create_course(course_type=Course.LOCKED)
+        create_curriculum(self.course, sections=3, topics=4)
+        self.user = create_learner()
+        self.client.force_login(self.user)
+
+    def test_free_enrollment_provisions_once(self):
+        runs = provisioning_stats['runs']
+
+        self.client.get(reverse('enroll_free_course', args=[self.course.id]))
+        self.client.get(reverse('course_detail', args=[self.course.id]))
+        self.client.get(reverse('study_course', args=[self.course.id]))
+
+        self.assertEqual(provisioning_stats['runs'] - runs, 1)
+        enrollment = Enrollment.objects.get(user=self.user, course=self.course)
+        self.assertEqual(SectionProgress.objects.filter(course_progress__enrollment_model=enrollment).count(), 3)
+        self.assertEqual(TopicProgress.objects.filter(section_progress__course_progress__enrollment_model=enrollment).count(), 12)
+
+    def active(self, enrollment):
+        sections = list(
+            SectionProgress.objects.filter(course_progress__enrollment_model=enrollment)
+            .order_by('section_id').values_list('is_active', flat=True)
+        )
+        topics = list(
+            TopicProgress.objects.filter(section_progress__course_progress__enrollment_model=enrollment)
+            .order_by('topic_id').values_list('is_active', flat=True)
+        )
+        return sections, topics
+
+    def test_locked_course_activates_the_first_topic_only(self):
+        enrollment = Enrollment.objects.create(user=self.user, course=self.course)
+        sections, topics = self.active(enrollment)
+        self.assertEqual(sections, [True, False, False])
+        self.assertEqual(topics, [True] + [False] * 11)
+
+    def test_unlocked_course_activates_every_topic(self):
+        self.course.course_type = Course.UNLOCKED
+        self.course.save()
+        enrollment = Enrollment.objects.create(user=self.user, course=self.course)
+        self.assertEqual(self.active(enrollment), ([True] * 3, [True] * 12))
+
+    def test_second_run_keeps_progress_and_fills_gaps(self):
+        enrollment = Enrollment.objects.create(user=self.user, course=self.course)
+        topics = list(Topic.objects.filter(section__course=self.course).order_by('id'))
+        complete_topics(enrollment, topics[:1])
+
+        report = provision_course_progress(enrollment)
+        self.assertEqual(
+            (report.course_progress_created, report.sections_created, report.topics_created), (False, 0, 0),
+        )
+        TopicProgress.objects.filter(topic=topics[-1]).delete()
+        report = provision_course_progress(enrollment)
+        self.assertEqual((report.sections_created, report.topics_created), (0, 1))
+
+        states = report.course_progress.topic_states()
+        self.assertEqual([(states[topic.id].completed, states[topic.id].is_active) for topic in topics[:3]],
+                         [(True, True), (False, True), (False, False)])
+        self.assertEqual(TopicProgress.objects.count(), 12)
+        self.assertEqual((report.course_progress.completed_topics_count, report.course_progress.total_topics_count), (1, 12))
+
+    @override_settings(PROGRESS_STORAGE='bitmap')
+    def test_bitmap_provisioning_sets_the_active_bits(self):
+        enrollment = Enrollment.objects.create(user=self.user, course=self.course)
+        course_progress = CourseProgress.objects.get(enrollment_model=enrollment)
+        self.assertEqual(bytes(course_progress.active_bits), bits_from_positions([0]))
+        self.assertEqual(bytes(course_progress.completed_bits), b'')
+        self.assertEqual(course_progress.total_topics_count, 12)
+        self.assertFalse(TopicProgress.objects.exists())
+
+        # A second run leaves the bitmap alone
+        complete_topics(enrollment, [Topic.objects.filter(section__course=self.course).order_by('id').first()])
+        bits = bytes(CourseProgress.objects.get(pk=course_progress.pk).active_bits)
+        provision_course_progress(enrollment)
+        self.assertEqual(bytes(CourseProgress.objects.get(pk=course_progress.pk).active_bits), bits)
+
+        self.course.course_type = Course.UNLOCKED
+        self.course.save()
+        other = Enrollment.objects.create(user=create_learner('other'), course=self.course)
+        self.assertEqual(bytes(other.progress.active_bits), bits_from_positions(range(12)))
+
+
+class CompletionBatchTests(TestCase):
+    """An offline replay is applied in one transaction with a fixed query budget."""
+
+    def setUp(self):
+        self.course = create_course(course_type=Course.LOCKED)
+        self.topics = create_curriculum(self.course, sections=3, topics=10)
+        self.user = create_learner()
+        self.enrollment = Enrollment.objects.create(user=self.user, course=self.course)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('api-completion-batch', args=[self.course.id])
+
+    def test_replay_completes_course_in_sequence_order(self):
+        # Sent out of order, the locked course must still accept every topic
+        payload = {'completions': [
+            {'topic': topic.id, 'completed_at': '2025-01-01T10:%02d:00Z' % index}
+            for index, topic in reversed(list(enumerate(self.topics)))
+        ]}
+
+        with self.assertNumQueries(13):
+            response = self.client.post(self.url, payload, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['rejected_topic_ids'], [])
+        self.assertTrue(response.data['course_just_completed'])
+        self.assertEqual(response.data['progress']['completed_topics_count'], 30)
+
+        course_progress = CourseProgress.objects.get(enrollment_model=self.enrollment)
+        self.assertTrue(course_progress.completed)
+        self.assertEqual(course_progress.completed_sections_count, 3)
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.completed_at.minute, 29)
+
+    def test_locked_topics_are_rejected(self):
+        response = self.client.post(self.url, {'completions': [{'topic': self.topics[5].id}]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['rejected_topic_ids'], [self.topics[5].id])
+        self.assertFalse(TopicProgress.objects.filter(completed=True).exists())
+
+
+class CompletionEngineTests(TestCase):
+    """complete_topics() flips topics, unlocks what follows and reports the rows it changed."""
+
+    def setUp(self):
+        self.course = create_course(course_type=Course.LOCKED)
+        self.topics = create_curriculum(self.course, sections=2, topics=2)
+        self.user = create_learner()
+        self.enrollment = Enrollment.objects.create(user=self.user, course=self.course)
+
+    def states(self):
+        states = CourseProgress.objects.get(enrollment_model=self.enrollment).topic_states()
+        return [(states[topic.id].completed, states[topic.id].is_active) for topic in self.topics]
+
+    def sections(self):
+        return list(
+            SectionProgress.objects.filter(course_progress__enrollment_model=self.enrollment)
+            .order_by('section_id').values_list('completed', 'is_active', 'completed_topics_count')
+        )
+
+    def test_changes_list_the_written_rows(self):
+        result = complete_topics(self.enrollment, self.topics[:1])
+
+        self.assertEqual(result.completed_topic_ids, [self.topics[0].id])
+        self.assertEqual(result.activated_topic_ids, [self.topics[1].id])
+        changed = {(change['model'], change['id']): change['fields'] for change in result.changes}
+        topic_rows = dict(TopicProgress.objects.values_list('topic_id', 'id'))
+        self.assertEqual(changed[('TopicProgress', topic_rows[self.topics[0].id])], {'completed': [False, True]})
+        self.assertEqual(changed[('TopicProgress', topic_rows[self.topics[1].id])], {'is_active': [False, True]})
+        section_progress = SectionProgress.objects.get(section=self.topics[0].section)
+        self.assertEqual(changed[('SectionProgress', section_progress.pk)]['completed_topics_count'], [0, 1])
+        self.assertEqual(changed[('CourseProgress', result.course_progress.pk)]['completed_topics_count'], [0, 1])
+        self.assertFalse(any(change['created'] for change in result.changes))
+        self.assertEqual(len(result.changes), 4)
+
+    def test_completing_twice_changes_nothing(self):
+        complete_topics(self.enrollment, self.topics[:1])
+        result = complete_topics(self.enrollment, self.topics[:1])
+
+        self.assertEqual(result.changes, [])
+        self.assertEqual(result.rejected_topic_ids, [])
+        self.assertFalse(result.course_just_completed)
+        self.assertEqual(result.course_progress.completed_topics_count, 1)
+        self.assertEqual(self.states(), [(True, True), (False, True), (False, False), (False, False)])
+
+    def test_section_boundary_unlocks_the_next_section(self):
+        complete_topics(self.enrollment, self.topics[:1])
+        self.assertEqual(self.sections(), [(False, True, 1), (False, False, 0)])
+
+        result = complete_topics(self.enrollment, self.topics[1:2])
+        self.assertEqual(result.activated_topic_ids, [self.topics[2].id])
+        self.assertEqual(self.sections(), [(True, True, 2), (False, True, 0)])
+        self.assertEqual(self.states(), [(True, True), (True, True), (False, True), (False, False)])
+
+        result = complete_topics(self.enrollment, self.topics[2:])
+        self.assertTrue(result.course_just_completed)
+        self.assertEqual(self.sections(), [(True, True, 2), (True, True, 2)])
+        self.enrollment.refresh_from_db()
+        self.assertIsNotNone(self.enrollment.completed_at)
+
+    def test_locked_topic_is_rejected_by_the_view(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('mark_topic_completed', args=[self.topics[2].id]))
+
+        self.assertRedirects(response, reverse('study_course', args=[self.course.id]), fetch_redirect_response=False)
+        self.assertEqual(self.states(), [(False, True), (False, False), (False, False), (False, False)])
+        self.assertEqual(CourseProgress.objects.get(enrollment_model=self.enrollment).completed_topics_count, 0)
+
+    def test_passed_quiz_ignores_the_lock(self):
+        self.assertEqual(complete_topics(self.enrollment, self.topics[2:3]).rejected_topic_ids, [self.topics[2].id])
+
+        result = complete_topics(self.enrollment, self.topics[2:3], enforce_lock=False)
+        self.assertEqual(result.completed_topic_ids, [self.topics[2].id])
+        self.assertEqual(result.activated_topic_ids, [self.topics[3].id])
+        self.assertEqual(self.states(), [(False, True), (False, False), (True, False), (False, True)])
+
+
+@override_settings(PROGRESS_STORAGE='bitmap')
+class BitmapStorageTests(TestCase):
+    """Bitmap enrollments keep topic states on the CourseProgress row."""
+
+    def setUp(self):
+        self.course = create_course(course_type=Course.LOCKED)
+        self.topics = create_curriculum(self.course, sections=2, topics=3)
+        self.sections = [self.topics[0].section, self.topics[3].section]
+        self.user = create_learner()
+        self.client.force_login(self.user)
+        self.enrollment = Enrollment.objects.create(user=self.user, course=self.course)
+
+    def states(self):
+        course_progress = CourseProgress.objects.get(enrollment_model=self.enrollment)
+        return {topic_id: (state.completed, state.is_active) for topic_id, state in course_progress.topic_states().items()}
+
+    def test_provisioning_writes_no_topic_rows(self):
+        course_progress = CourseProgress.objects.get(enrollment_model=self.enrollment)
+        self.assertEqual(course_progress.storage_mode, CourseProgress.BITMAP)
+        self.assertFalse(TopicProgress.objects.exists())
+        self.assertEqual(self.states()[self.topics[0].id], (False, True))
+        self.assertEqual(self.states()[self.topics[1].id], (False, False))
+
+    def test_completion_and_remap(self):
+        for topic in self.topics[:3]:
+            self.client.post(reverse('mark_topic_completed', args=[topic.id]))
+
+        states = self.states()
+        self.assertEqual([states[topic.id] for topic in self.topics[:4]], [(True, True)] * 3 + [(False, True)])
+        self.assertEqual(SectionProgress.objects.get(section=self.sections[0]).completed_topics_count, 3)
+
+        # A topic added to the first section shifts the positions of the second one,
+        # the bits are read through the old layout until the sync rewrote them
+        with patch('subscribtion.tasks._dispatch'), self.captureOnCommitCallbacks(execute=True):
+            added = Topic.objects.create(section=self.sections[0], title='Topic 0.3')
+        course_progress = CourseProgress.objects.get(enrollment_model=self.enrollment)
+        self.assertEqual(course_progress.bits_version, 0)
+        self.assertEqual(BitmapLayout.objects.get(course=self.course).version, 0)
+        states = self.states()
+        self.assertEqual(states[added.id], (False, False))
+        self.assertEqual(states[self.topics[2].id], (True, True))
+        self.assertEqual(states[self.topics[3].id], (False, True))
+
+        # The sync also unlocks the added topic, the next one after the completed ones
+        sync = ProgressSync.objects.get(status=ProgressSync.PENDING)
+        self.assertEqual(sync_course_progress(sync.pk), ProgressSync.DONE)
+        self.assertEqual(CourseProgress.objects.get(pk=course_progress.pk).bits_version, 1)
+        states = self.states()
+        self.assertEqual(states[added.id], (False, True))
+        self.assertEqual(states[self.topics[2].id], (True, True))
+        self.assertEqual(states[self.topics[3].id], (False, True))
+
+        # Study resumes after the last completed topic
+        response = self.client.get(reverse('study_course', args=[self.course.id]))
+        self.assertEqual(response.context['active_topic'], self.topics[3])
+        self.assertFalse(TopicProgress.objects.exists())
+
+
+@override_settings(PROGRESS_STORAGE='sparse')
+class SparseStorageTests(TestCase):
+    """Sparse enrollments create topic rows only when a topic is touched."""
+
+    def setUp(self):
+        self.course = create_course(course_type=Course.LOCKED)
+        self.topics = create_curriculum(self.course, topics=50)
+        self.user = create_learner()
+        self.client.force_login(self.user)
+
+    def test_enrollment_writes_no_topic_rows(self):
+        enrollment = Enrollment.objects.create(user=self.user, course=self.course)
+
+        self.assertFalse(TopicProgress.objects.exists())
+        states = CourseProgress.objects.get(enrollment_model=enrollment).topic_states()
+        self.assertEqual(len(states), 50)
+        self.assertTrue(states[self.topics[0].id].is_active)
+        self.assertFalse(states[self.topics[1].id].is_active)
+
+        self.client.post(reverse('mark_topic_completed', args=[self.topics[0].id]))
+
+        rows = {tp.topic_id: (tp.completed, tp.is_active) for tp in TopicProgress.objects.all()}
+        self.assertEqual(rows, {self.topics[0].id: (True, True), self.topics[1].id: (False, True)})
+
+
+class CurriculumSyncTests(TestCase):
+    """Content added to a course reaches the progress of existing enrollments."""
+
+    def setUp(self):
+        self.course = create_course(course_type=Course.LOCKED)
+        self.topics = create_curriculum(self.course)
+        self.section = self.topics[0].section
+        self.finished = Enrollment.objects.create(user=create_learner('a'), course=self.course)
+        self.starting = Enrollment.objects.create(user=create_learner('b'), course=self.course)
+        complete_topics(self.finished, self.topics)
+
+    def test_new_content_is_synced_in_chunks(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            added = Topic.objects.create(section=self.section, title='Topic 0.2')
+            section = Section.objects.create(course=self.course, title='Section 1')
+            Topic.objects.create(section=section, title='Topic 1.0')
+        self.assertEqual(len(callbacks), 3)
+
+        sync = ProgressSync.objects.create(course=self.course, total=2)
+        with patch('subscribtion.tasks.SYNC_CHUNK_SIZE', 1):
+            self.assertEqual(sync_course_progress(sync.pk), ProgressSync.DONE)
+
+        sync.refresh_from_db()
+        self.assertEqual((sync.processed, sync.last_enrollment_id), (2, self.starting.id))
+
+        finished = CourseProgress.objects.get(enrollment_model=self.finished)
+        self.assertEqual((finished.total_topics_count, finished.completed_topics_count), (4, 2))
+        self.assertEqual((finished.total_sections_count, finished.completed_sections_count), (2, 0))
+        self.assertFalse(finished.completed)
+        self.assertEqual(finished.progress_percentage, Decimal('50.00'))
+        # The topic after the completed ones is unlocked, the next section is not
+        self.assertTrue(TopicProgress.objects.get(section_progress__course_progress=finished, topic=added).is_active)
+        self.assertFalse(SectionProgress.objects.get(course_progress=finished, section=section).is_active)
+
+        starting = CourseProgress.objects.get(enrollment_model=self.starting)
+        self.assertEqual(TopicProgress.objects.filter(section_progress__course_progress=starting, is_active=True).count(), 1)
+        self.assertEqual(starting.total_topics_count, 4)
+
+        # A second run finds nothing left to change
+        report = resync_chunk(CourseStructure(self.course), [finished.pk, starting.pk], dry_run=True)
+        self.assertEqual(report.changes, [])
+
+    def run_scheduled_sync(self, change):
+        with patch('subscribtion.tasks._dispatch'), self.captureOnCommitCallbacks(execute=True):
+            change()
+        sync = ProgressSync.objects.get(status=ProgressSync.PENDING)
+        self.assertEqual(sync_course_progress(sync.pk), ProgressSync.DONE)
+        return CourseProgress.objects.get(enrollment_model=self.starting)
+
+    def test_required_flags_and_deletions_are_recounted(self):
+        def require_both():
+            for topic in self.topics:
+                topic.is_required = True
+                topic.save()
+        starting = self.run_scheduled_sync(require_both)
+        self.assertEqual((starting.total_topics_count, starting.required_topics_count), (2, 2))
+
+        complete_topics(self.starting, self.topics[:1])
+        starting = self.run_scheduled_sync(self.topics[1].delete)
+        self.assertEqual((starting.total_topics_count, starting.required_topics_count), (1, 1))
+        self.assertTrue(starting.completed)
+        self.assertEqual(starting.progress_percentage, Decimal('100.00'))
+
+        # Saving without touching the counted fields queues nothing
+        with patch('subscribtion.tasks._dispatch'), self.captureOnCommitCallbacks(execute=True):
+            self.topics[0].title = 'Renamed'
+            self.topics[0].save()
+        self.assertFalse(ProgressSync.objects.filter(status=ProgressSync.PENDING).exists())
+
+
+class RecomputeProgressTests(TestCase):
+    """recompute_progress repairs counters and percentages from the topic states."""
+
+    def setUp(self):
+        self.course = create_course(course_type=Course.UNLOCKED)
+        self.topics = create_curriculum(self.course, topics=4)
+        self.enrollment = Enrollment.objects.create(user=create_learner(), course=self.course)
+        complete_topics(self.enrollment, self.topics[:1])
+        CourseProgress.objects.update(progress_percentage=Decimal('90.00'), completed_topics_count=3)
+
+    def test_dry_run_then_repair(self):
+        out = StringIO()
+        call_command('recompute_progress', '--workers=1', '--dry-run', stdout=out)
+        self.assertIn('progress_percentage: 90.00 -> 25.00', out.getvalue())
+        self.assertEqual(CourseProgress.objects.get().progress_percentage, Decimal('90.00'))
+
+        call_command('recompute_progress', '--workers=1', stdout=StringIO())
+        course_progress = CourseProgress.objects.get()
+        self.assertEqual((course_progress.progress_percentage, course_progress.completed_topics_count), (Decimal('25.00'), 1))
+
+    def test_dry_run_lists_enrollment_completion(self):
+        complete_topics(self.enrollment, self.topics)
+        Enrollment.objects.update(completed_at=None)
+        out = StringIO()
+        call_command('recompute_progress', '--workers=1', '--dry-run', stdout=out)
+        self.assertIn(f'Enrollment id={self.enrollment.pk} updated: completed_at: None -> ', out.getvalue())
+        self.assertIsNone(Enrollment.objects.get().completed_at)
+
+        call_command('recompute_progress', '--workers=1', stdout=StringIO())
+        self.assertIsNotNone(Enrollment.objects.get().completed_at)
+
+
+class ProgressOverlayTests(TestCase):
+    """The curriculum pages read progress from the cached overlay, completions refresh it."""
+
+    def setUp(self):
+        cache.clear()
+        self.course = create_course(course_type=Course.LOCKED)
+        self.topics = create_curriculum(self.course, sections=2)
+        self.user = create_learner()
+        self.enrollment = Enrollment.objects.create(user=self.user, course=self.course)
+        self.client.force_login(self.user)
+
+    def states(self):
+        response = self.client.get(reverse('study_course', args=[self.course.id]))
+        return [(item.completed, item.is_active) for entry in response.context['curriculum'] for item in entry.topics]
+
+    def test_completion_refreshes_the_overlay(self):
+        self.assertEqual(self.states(), [(False, True), (False, False), (False, False), (False, False)])
+        course_progress = CourseProgress.objects.get(enrollment_model=self.enrollment)
+        self.course.refresh_from_db()
+        with self.assertNumQueries(0):
+            get_overlay(course_progress, get_outline(self.course))
+
+        self.client.post(reverse('mark_topic_completed', args=[self.topics[0].id]))
+        # The overlay cached before the completion is still there, under a version no one reads
+        self.assertFalse(get_overlay(course_progress, get_outline(self.course)).topic_state(self.topics[0].id).completed)
+        self.assertEqual(self.states(), [(True, True), (False, True), (False, False), (False, False)])
+        response = self.client.get(reverse('course_detail', args=[self.course.id]))
+        self.assertEqual(response.context['next_section'].id, self.topics[0].section_id)
+
+
+    def test_staff_edit_recounts_and_refreshes_the_overlay(self):
+        self.assertEqual(self.states()[0], (False, True))
+        staff = User.objects.create_superuser(email='staff@example.com', password='pass', username='staff')
+        self.client.force_login(staff)
+        topic_progress = TopicProgress.objects.get(topic=self.topics[0])
+
+        response = self.client.post(reverse('admin:subscribtion_topicprogress_change', args=[topic_progress.pk]), {
+            'section_progress': topic_progress.section_progress_id, 'topic': self.topics[0].id,
+            'completed': 'on', 'is_active': 'on',
+        })
+
+        self.assertEqual(response.status_code, 302)
+        course_progress = CourseProgress.objects.get(enrollment_model=self.enrollment)
+        self.assertEqual((course_progress.completed_topics_count, course_progress.progress_percentage), (1, Decimal('25.00')))
+        self.client.force_login(self.user)
+        self.assertEqual(self.states()[0], (True, True))
+
+class ResumePointerTests(SharedCacheMixin, TestCase):
+    """Completions and opened topics move the resume pointer, study starts there."""
+
+    def setUp(self):
+        cache.clear()
+        self.course = create_course(course_type=Course.LOCKED)
+        self.topics = create_curriculum(self.course, sections=2)
+        self.user = create_learner()
+        self.enrollment = Enrollment.objects.create(user=self.user, course=self.course)
+        self.client.force_login(self.user)
+
+    def pointer(self):
+        return CourseProgress.objects.values_list('resume_topic_id', 'resume_section_id').get(enrollment_model=self.enrollment)
+
+    def test_pointer_follows_the_learner(self):
+        self.assertEqual(self.pointer(), (None, None))
+        complete_topics(self.enrollment, self.topics[:2])
+        self.assertEqual(self.pointer(), (self.topics[2].id, self.topics[2].section_id))
+
+        url = reverse('study_course', args=[self.course.id])
+        self.assertEqual(self.client.get(url).context['active_topic'].id, self.topics[2].id)
+
+        # Opening a topic buffers the pointer, the pages show it before the flush writes it
+        self.client.get(url, {'topic_id': self.topics[0].id})
+        self.assertEqual(self.pointer(), (self.topics[2].id, self.topics[2].section_id))
+        response = self.client.get(reverse('course_detail', args=[self.course.id]))
+        self.assertEqual(response.context['next_section'].id, self.topics[0].section_id)
+        self.assertContains(response, f'?topic_id={self.topics[0].id}')
+        self.assertEqual(self.client.get(url).context['active_topic'].id, self.topics[0].id)
+        activity.flush()
+        activity.flush()
+        self.assertEqual(self.pointer(), (self.topics[0].id, self.topics[0].section_id))
+
+    def test_buffered_pointer_does_not_override_a_later_completion(self):
+        url = reverse('study_course', args=[self.course.id])
+        self.client.get(url, {'topic_id': self.topics[0].id})
+        complete_topics(self.enrollment, self.topics[:1])
+        self.assertEqual(self.client.get(url).context['active_topic'].id, self.topics[1].id)
+        activity.flush()
+        activity.flush()
+        self.assertEqual(self.pointer(), (self.topics[1].id, self.topics[1].section_id))
+
+
+class ActivityBufferTests(SharedCacheMixin, TestCase):
+    """Opening a topic buffers its last accessed time until the next flush."""
+
+    def setUp(self):
+        cache.clear()
+        self.course = create_course(course_type=Course.LOCKED)
+        self.topics = create_curriculum(self.course)
+        self.user = create_learner()
+        self.enrollment = Enrollment.objects.create(user=self.user, course=self.course)
+        self.client.force_login(self.user)
+
+    def stored(self):
+        return TopicProgress.objects.get(
+            section_progress__course_progress__enrollment_model=self.enrollment, topic=self.topics[1],
+        ).last_accessed
+
+    def test_access_is_written_by_flush(self):
+        complete_topics(self.enrollment, self.topics[:1])
+        before = self.stored()
+        self.client.get(reverse('study_course', args=[self.course.id]), {'topic_id': self.topics[1].id})
+        self.assertEqual(self.stored(), before)
+
+        course_progress = CourseProgress.objects.get(enrollment_model=self.enrollment)
+        buffered = activity.pending(course_progress.pk)[(activity.TOPIC, self.topics[1].id)]
+        self.assertGreater(buffered, before)
+        topics = {topic['topic_id']: topic for topic in progress_snapshot(course_progress)['topics']}
+        self.assertEqual(topics[self.topics[1].id]['last_accessed'], buffered)
+
+        self.assertEqual(activity.flush(), 0)  # Closes the generation the request wrote to
+        self.assertEqual(self.stored(), before)
+        self.assertEqual(activity.flush(), 1)
+        self.assertEqual(self.stored(), buffered)
+        self.assertEqual(activity.pending(course_progress.pk), {})
+        self.assertEqual(activity.flush(), 0)
+
+    def test_access_during_a_flush_is_kept(self):
+        complete_topics(self.enrollment, self.topics[:1])
+        course_progress = CourseProgress.objects.get(enrollment_model=self.enrollment)
+        first = timezone.now()
+        activity.record_access(course_progress, self.topics[1].id, self.topics[1].section_id, first)
+        activity.flush()
+
+        # A request writing while the next flush reads the closed generation
+        drain = activity._drain
+
+        def late_write(generation):
+            written = drain(generation)
+            activity.record_access(course_progress, self.topics[1].id, self.topics[1].section_id, first + timedelta(seconds=1))
+            return written
+
+        with patch('subscribtion.activity._drain', late_write):
+            self.assertEqual(activity.flush(), 1)
+        self.assertEqual(self.stored(), first)
+        self.assertEqual(activity.pending(course_progress.pk)[(activity.TOPIC, self.topics[1].id)], first + timedelta(seconds=1))
+        activity.flush()
+        activity.flush()
+        self.assertEqual(self.stored(), first + timedelta(seconds=1))
+
+    def test_concurrent_writes_of_an_enrollment_are_kept(self):
+        complete_topics(self.enrollment, self.topics[:1])
+        course_progress = CourseProgress.objects.get(enrollment_model=self.enrollment)
+        topic = self.topics[1]
+        incr = activity._incr
+        raced = []
+
+        def racing_incr(key):
+            # A heartbeat of the same enrollment arrives while the access is being listed
+            if not raced:
+                raced.append(key)
+                activity.record_position(course_progress, topic.id, topic.section_id, 42, 600)
+            return incr(key)
+
+        with patch('subscribtion.activity._incr', racing_incr):
+            activity.record_access(course_progress, topic.id, topic.section_id, resume=True)
+
+        buffered = activity.pending(course_progress.pk)
+        self.assertEqual(buffered[(activity.POSITION, topic.id)][:2], (42, 600))
+        self.assertEqual(buffered[(activity.RESUME, course_progress.pk)][:2], (topic.id, topic.section_id))
+        activity.flush()
+        activity.flush()
+        self.assertEqual(WatchPosition.objects.get().position, 42)
+        self.assertEqual(CourseProgress.objects.get(pk=course_progress.pk).resume_topic_id, topic.id)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_process_local_cache_writes_directly(self):
+        self.assertEqual([warning.id for warning in check_activity_cache(None)], ['subscribtion.W001'])
+        complete_topics(self.enrollment, self.topics[:1])
+        before = self.stored()
+        self.client.get(reverse('study_course', args=[self.course.id]), {'topic_id': self.topics[1].id})
+        self.assertGreater(self.stored(), before)
+        self.assertEqual(activity.flush(), 0)
+
+
+class WatchHeartbeatTests(SharedCacheMixin, TestCase):
+    """Video heartbeats are coalesced in the cache and complete the topic near the end."""
+
+    def setUp(self):
+        cache.clear()
+        self.course = create_course(course_type=Course.LOCKED)
+        self.topics = create_curriculum(self.course, content_type='video')
+        self.user = create_learner()
+        self.enrollment = Enrollment.objects.create(user=self.user, course=self.course)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def heartbeat(self, topic, position, duration=600):
+        url = reverse('api-watch-heartbeat', args=[self.course.id, topic.id])
+        return self.client.post(url, {'position': position, 'duration': duration}, format='json')
+
+    def flush_in_worker(self):
+        """
+        Flush through a cache instance of its own, as the Celery worker does,
+        twice so the generation the heartbeats wrote to is closed and drained.
+        """
+        worker_cache = caches.create_connection('default')
+        self.assertIsNot(worker_cache, caches['default'])
+        with patch('subscribtion.activity.cache', worker_cache):
+            return activity.flush() + activity.flush()
+
+    def test_latest_position_is_written_once(self):
+        self.heartbeat(self.topics[0], 10)
+        with self.assertNumQueries(3):  # The enrollment lookup of each heartbeat
+            for position in (20, 30, 40):
+                response = self.heartbeat(self.topics[0], position)
+        self.assertEqual(response.data, {'position': 40, 'completed': False})
+        self.assertFalse(WatchPosition.objects.exists())
+
+        self.assertEqual(self.flush_in_worker(), 1)
+        self.assertEqual(
+            list(WatchPosition.objects.values_list('topic_id', 'position', 'duration')), [(self.topics[0].id, 40, 600)],
+        )
+        self.heartbeat(self.topics[0], 50)
+        self.flush_in_worker()
+        self.assertEqual(WatchPosition.objects.get().position, 50)
+        self.assertEqual(activity.pending(CourseProgress.objects.get().pk), {})
+
+    def test_threshold_completes_the_topic(self):
+        self.assertEqual(self.heartbeat(self.topics[1], 590).status_code, 200)  # Still locked
+        self.assertTrue(self.heartbeat(self.topics[0], 550).data['completed'])
+        states = CourseProgress.objects.get(enrollment_model=self.enrollment).topic_states()
+        self.assertEqual(
+            [(states[topic.id].completed, states[topic.id].is_active) for topic in self.topics], [(True, True), (False, True)],
+        )
+        self.assertEqual(self.heartbeat(self.topics[0], 700).status_code, 400)
@@ -0,0 +1,332 @@
+"""
+Storage of the per-topic progress state of an enrollment.
+
+CourseProgress.ROWS keeps one TopicProgress row per topic. CourseProgress.SPARSE
+keeps TopicProgress rows only for topics that were opened, unlocked or completed,
+untouched topics resolve to defaults derived from the course type and sequence.
+CourseProgress.BITMAP keeps two bitsets on the CourseProgress row itself, bit N
+describing the topic at TopicSequence.position N, so reading or provisioning an
+enrollment touches one row. A rebuild that moves topics records the replaced
+order as a BitmapLayout, rows still laid out in it are remapped when read. Every store hands out objects with topic_id,
+completed, is_active and last_accessed attributes.
+"""
+from django.conf import settings
+
+from courses.models import Course, TopicSequence
+from .models import BitmapLayout, CourseProgress, SectionProgress, TopicProgress
+
+def default_storage_mode():
+    """The storage mode of newly provisioned enrollments."""
+    return getattr(settings, 'PROGRESS_STORAGE', CourseProgress.ROWS)
+
+
+# -- bitsets ------------------------------------------------------------------
+
+def test_bit(bits, index):
+    byte = index >> 3
+    return byte < len(bits) and bool(bits[byte] & (1 << (index & 7)))
+
+
+def set_bit(bits, index, value=True):
+    """Set or clear a bit of a bytearray in place, growing it when needed."""
+    byte = index >> 3
+    if byte >= len(bits):
+        if not value:
+            return
+        bits.extend(bytes(byte + 1 - len(bits)))
+    if value:
+        bits[byte] |= 1 << (index & 7)
+    else:
+        bits[byte] &= ~(1 << (index & 7))
+
+
+def bits_from_positions(positions):
+    bits = bytearray()
+    for position in positions:
+        set_bit(bits, position)
+    return bytes(bits)
+
+
+def remap_bits(bits, old_topics, new_positions):
+    """
+    Move every set bit from the old position of its topic to the new one.
+    `old_topics` maps old positions to topic ids, `new_positions` maps topic
+    ids to new positions. Bits of topics that no longer exist are dropped.
+    """
+    bits = bytes(bits)
+    remapped = bytearray()
+    for position, topic_id in old_topics.items():
+        if test_bit(bits, position) and topic_id in new_positions:
+            set_bit(remapped, new_positions[topic_id])
+    return bytes(remapped)
+
+
+def record_bitmap_layout(course_id, old_topics, new_positions, version):
+    """
+    Keep the topic order a sequence rebuild replaced, as the layout of the
+    previous sequence version, when it moved topics of a course with bitmap
+    enrollments. Their bits follow the topics when read and are rewritten by
+    the progress sync. Returns whether a layout was recorded.
+    """
+    if all(new_positions.get(topic_id) == position for position, topic_id in old_topics.items()):
+        return False
+    if not CourseProgress.objects.filter(enrollment_model__course_id=course_id, storage_mode=CourseProgress.BITMAP).exists():
+        return False
+    topics = [None] * (max(old_topics) + 1)
+    for position, topic_id in old_topics.items():
+        topics[position] = topic_id
+    BitmapLayout.objects.update_or_create(course_id=course_id, version=version - 1, defaults={'topics': topics})
+    return True
+
+
+def bitmap_layout(course_id, version):
+    """Old position -> topic id of a recorded layout, None when there is none."""
+    topics = BitmapLayout.objects.filter(course_id=course_id, version=version).values_list('topics', flat=True).first()
+    if topics is None:
+        return None
+    return {position: topic_id for position, topic_id in enumerate(topics) if topic_id is not None}
+
+
+# -- stores -------------------------------------------------------------------
+
+class TopicState:
+    """The progress of a topic without a TopicProgress row, reads like one."""
+    __slots__ = ('topic_id', 'completed', 'is_active', 'last_accessed')
+
+    def __init__(self, topic_id, completed=False, is_active=False, last_accessed=None):
+        self.topic_id = topic_id
+        self.completed = completed
+        self.is_active = is_active
+        self.last_accessed = last_accessed
+
+    @property
+    def pk(self):
+        return self.topic_id
+
+    def __repr__(self):
+        return f"<TopicState topic={self.topic_id} completed={self.completed} active={self.is_active}>"
+
+
+class RowStore:
+    model_name = 'TopicProgress'
+
+    def __init__(self, course_progress, positions=None, sequence_version=None):
+        self.course_progress = course_progress
+
+    def _rows(self):
+        return TopicProgress.objects.filter(section_progress__course_progress=self.course_progress)
+
+    def all_states(self):
+        return {tp.topic_id: tp for tp in self._rows().order_by('topic__sequence__position', 'id')}
+
+    def load(self, topic_ids):
+        states = {}
+        for topic_progress in self._rows().filter(topic_id__in=topic_ids).order_by('id'):
+            states.setdefault(topic_progress.topic_id, topic_progress)
+        return states
+
+    def new(self, topic_id):
+        return TopicProgress(topic_id=topic_id, completed=False, is_active=False)
+
+    def completed_topic_ids(self):
+        return list(self._rows().filter(completed=True).values_list('topic_id', flat=True))
+
+    def save(self, created, updated, section_progress_id):
+        """
+        Write new and changed states. `section_progress_id` maps a topic id to
+        its SectionProgress id. Returns the CourseProgress fields to save.
+        """
+        for topic_progress in created:
+            topic_progress.section_progress_id = section_progress_id(topic_progress.topic_id)
+        if created:
+            TopicProgress.objects.bulk_create(created)
+        if updated:
+            TopicProgress.objects.bulk_update(updated, ['completed', 'is_active', 'last_accessed'])
+        return []
+
+    def touch(self, state):
+        state.save()  # auto_now bumps last_accessed
+
+
+class SparseStore(RowStore):
+    """
+    TopicProgress rows are materialized lazily, a missing row means the topic
+    was never touched: it is not completed, and it is active only when the
+    course type says so (every topic of an unlocked course, the first topic
+    of a locked one).
+    """
+
+    def __init__(self, course_progress, positions=None, sequence_version=None):
+        super().__init__(course_progress, positions, sequence_version)
+        self._first_topic_id = None
+
+    @property
+    def course(self):
+        return self.course_progress.enrollment_model.course
+
+    @property
+    def first_topic_id(self):
+        """The topic a locked course starts with, the first topic of its first section."""
+        if self._first_topic_id is None:
+            self._first_topic_id = (
+                TopicSequence.objects.filter(course_id=self.course.pk, section_index=0)
+                .order_by('section_position')
+                .values_list('topic_id', flat=True)
+                .first()
+            ) or 0
+        return self._first_topic_id
+
+    def default_active(self, topic_id):
+        if self.course.course_type == Course.UNLOCKED:
+            return True
+        return self.course.course_type == Course.LOCKED and topic_id == self.first_topic_id
+
+    def all_states(self):
+        rows = {}
+        for topic_progress in self._rows().order_by('id'):
+            rows.setdefault(topic_progress.topic_id, topic_progress)
+        entries = (
+            TopicSequence.objects.filter(course_id=self.course.pk)
+            .order_by('position')
+            .values_list('topic_id', 'section_index', 'section_position')
+        )
+        states = {}
+        for topic_id, section_index, section_position in entries:
+            if topic_id in rows:
+                states[topic_id] = rows[topic_id]
+            else:
+                locked_start = self.course.course_type == Course.LOCKED and section_index == 0 and section_position == 0
+                states[topic_id] = TopicState(
+                    topic_id, is_active=self.course.course_type == Course.UNLOCKED or locked_start,
+                )
+        return states
+
+    def load(self, topic_ids):
+        states = super().load(topic_ids)
+        for topic_id in topic_ids:
+            if topic_id not in states:
+                states[topic_id] = self.new(topic_id)
+        return states
+
+    def new(self, topic_id):
+        return TopicProgress(topic_id=topic_id, completed=False, is_active=self.default_active(topic_id))
+
+    def touch(self, state):
+        if state.pk is None:
+            # First time this topic is opened, materialize its row
+            section_id = TopicSequence.objects.filter(topic_id=state.topic_id).values_list('section_id', flat=True).first()
+            state.section_progress = SectionProgress.objects.get(
+                course_progress=self.course_progress, section_id=section_id
+            )
+        state.save()
+
+
+class BitmapStore:
+    """
+    Bits written for an older sequence version (a rebuild moved topics since)
+    are remapped to the current positions in memory when first read, and
+    saved that way with the next write.
+    """
+    model_name = 'TopicState'
+
+    def __init__(self, course_progress, positions=None, sequence_version=None):
+        self.course_progress = course_progress
+        self._positions = positions
+        self._sequence_version = sequence_version
+
+    def _load_sequence(self):
+        # One query, so the positions and their version belong together
+        rows = list(
+            TopicSequence.objects.filter(course_id=self.course_progress.enrollment_model.course_id)
+            .values_list('topic_id', 'position', 'course__sequence_version')
+        )
+        self._positions = {topic_id: position for topic_id, position, _ in rows}
+        self._sequence_version = rows[0][2] if rows else self.course_progress.bits_version
+
+    @property
+    def positions(self):
+        """Topic id -> TopicSequence position, pass it in when already loaded."""
+        if self._positions is None:
+            self._load_sequence()
+        return self._positions
+
+    @property
+    def sequence_version(self):
+        """The Course.sequence_version of `positions`, pass it in with them."""
+        if self._sequence_version is None:
+            self._load_sequence()
+        return self._sequence_version
+
+    def _follow_sequence(self):
+        course_progress = self.course_progress
+        if course_progress.bits_version == self.sequence_version:
+            return
+        old_topics = bitmap_layout(course_progress.enrollment_model.course_id, course_progress.bits_version)
+        if old_topics is not None:
+            course_progress.completed_bits = remap_bits(course_progress.completed_bits or b'', old_topics, self.positions)
+            course_progress.active_bits = remap_bits(course_progress.active_bits or b'', old_topics, self.positions)
+        course_progress.bits_version = self.sequence_version
+
+    def _state(self, topic_id, position):
+        return TopicState(
+            topic_id,
+            completed=test_bit(self.completed_bits, position),
+            is_active=test_bit(self.active_bits, position),
+            last_accessed=self.course_progress.last_accessed,
+        )
+
+    @property
+    def completed_bits(self):
+        self._follow_sequence()
+        return bytes(self.course_progress.completed_bits or b'')
+
+    @property
+    def active_bits(self):
+        self._follow_sequence()
+        return bytes(self.course_progress.active_bits or b'')
+
+    def all_states(self):
+        ordered = sorted(self.positions.items(), key=lambda item: item[1])
+        return {topic_id: self._state(topic_id, position) for topic_id, position in ordered}
+
+    def load(self, topic_ids):
+        return {
+            topic_id: self._state(topic_id, self.positions[topic_id])
+            for topic_id in topic_ids if topic_id in self.positions
+        }
+
+    def new(self, topic_id):
+        return TopicState(topic_id)
+
+    def completed_topic_ids(self):
+        completed_bits = self.completed_bits
+        return [topic_id for topic_id, position in self.positions.items() if test_bit(completed_bits, position)]
+
+    def save(self, created, updated, section_progress_id):
+        completed_bits = bytearray(self.completed_bits)
+        active_bits = bytearray(self.active_bits)
+        for state in list(created) + list(updated):
+            position = self.positions[state.topic_id]
+            set_bit(completed_bits, position, state.completed)
+            set_bit(active_bits, position, state.is_active)
+        self.course_progress.completed_bits = bytes(completed_bits)
+        self.course_progress.active_bits = bytes(active_bits)
+        return ['completed_bits', 'active_bits', 'bits_version']
+
+    def touch(self, state):
+        self.course_progress.save(update_fields=['last_accessed'])
+
+
+STORES = {
+    CourseProgress.ROWS: RowStore,
+    CourseProgress.SPARSE: SparseStore,
+    CourseProgress.BITMAP: BitmapStore,
+}
+
+
+def store_for(course_progress, positions=None, sequence_version=None):
+    """
+    The topic state store of a CourseProgress, `positions` maps topic ids to
+    sequence positions of the course at `sequence_version`.
+    """
+    return STORES[course_progress.storage_mode](course_progress, positions, sequence_version)
@@ -6,10 +6,10 @@ from django.urls import reverse
 from django.conf import settings
 from django.contrib import messages
 from django.views.decorators.csrf import csrf_exempt
+from django.db import transaction
 
 from courses.models import Course
 from subscribtion.models import Enrollment, CourseProgress, TopicProgress
-from utils import create_course_progress
 
 # Import the ZainCash utilities
 from zaincash import create_transaction, verify_transaction, decode_redirect_token
@@ -97,18 +97,19 @@ def payment_callback(request):
             try:
                 course = Course.objects.get(id=course_id)
                 
-                # Check if user is already enrolled
-                enrollment, created = Enrollment.objects.get_or_create(
-                    user=request.user,
-                    course=course,
-                    defaults={
-                        'enrolement_status': 'active'
-                    }
-                )
+                # Check if user is already enrolled.
+                # The progress tree is provisioned by the Enrollment post_save
+                # receiver inside this transaction, don't provision it again here.
+                with transaction.atomic():
+                    enrollment, created = Enrollment.objects.get_or_create(
+                        user=request.user,
+                        course=course,
+                        defaults={
+                            'enrolement_status': 'active'
+                        }
+                    )
                 
                 if created:
-                    # Create progress records
-                    create_course_progress(enrollment)
                     messages.success(request, f"You have successfully enrolled in {course.title}!")
                 else:
                     messages.info(request, f"You were already enrolled in {course.title}.")
@@ -169,19 +170,17 @@ def mark_topic_as_completed(request, topic_id):
     and also fixes the optional content lockout.
     """
     # Self-contained imports to prevent NameErrors
-    from utils import create_course_progress
-    from courses.models import Topic, Section, Course
-    from .models import Enrollment, CourseProgress, SectionProgress, TopicProgress
+    from .completion import complete_topic
+    from courses.models import Topic
+    from .models import Enrollment
     from django.contrib import messages
-    from django.utils import timezone
 
     if request.method != 'POST':
         messages.error(request, "Invalid request method.")
         return redirect('course_list')
     
-    topic = get_object_or_404(Topic, id=topic_id)
-    section = topic.section
-    course = section.course
+    topic = get_object_or_404(Topic.objects.select_related('section__course'), id=topic_id)
+    course = topic.section.course
     
     try:
         enrollment = Enrollment.objects.get(user=request.user, course=course)
@@ -189,113 +188,20 @@ def mark_topic_as_completed(request, topic_id):
         messages.error(request, "You are not enrolled in this course.")
         return redirect('course_detail', course_id=course.id)
     
-    try:
-        course_progress = CourseProgress.objects.get(enrollment_model=enrollment)
-        section_progress = SectionProgress.objects.get(course_progress=course_progress, section=section)
-        topic_progress, created = TopicProgress.objects.get_or_create(section_progress=section_progress, topic=topic)
-    except (CourseProgress.DoesNotExist, SectionProgress.DoesNotExist):
-        create_course_progress(enrollment)
-        return redirect('study_course', course_id=course.id)
+    # --- UNIFIED COMPLETION LOGIC ---
+    # The engine locks this enrollment's CourseProgress, flips the topic,
+    # moves the stored counters, unlocks the next content of locked courses
+    # and finishes the course in one transaction.
+    # Optional topics stay markable after the main course is finished.
+    completion = complete_topic(enrollment, topic)
     
-    # This check has been moved down to allow marking optional topics as complete
-    # after the main course is finished.
-    if course.course_type == 'locked' and not topic_progress.is_active and not enrollment.completed_at:
+    if completion.rejected_topic_ids:
         messages.error(request, "You must complete previous topics first.")
         return redirect('study_course', course_id=course.id)
-    
-    if not topic_progress.completed:
-        topic_progress.completed = True
-        topic_progress.save()
+    if completion.completed_topic_ids:
         messages.success(request, f"Topic '{topic.title}' marked as completed!")
-    
-    # --- UNIFIED COMPLETION LOGIC ---
-    
-    # Step 1: Check for SECTION completion
-    section_completed = False
-    required_topics = Topic.objects.filter(section=section, is_required=True)
-    if required_topics.exists():
-        completed_required_count = TopicProgress.objects.filter(section_progress=section_progress, topic__in=required_topics, completed=True).count()
-        if completed_required_count >= required_topics.count():
-            section_completed = True
-    else:
-        all_topics_count = Topic.objects.filter(section=section).count()
-        completed_count = TopicProgress.objects.filter(section_progress=section_progress, completed=True).count()
-        if all_topics_count > 0 and completed_count >= all_topics_count:
-            section_completed = True
-            
-    if section_completed != section_progress.completed:
-        section_progress.completed = section_completed
-        section_progress.save()
-    
-    # Step 2: Check for COURSE completion
-    course_completed = False
-    required_sections = Section.objects.filter(course=course, is_required=True)
-    if required_sections.exists():
-        completed_required_sections_count = SectionProgress.objects.filter(course_progress=course_progress, section__in=required_sections, completed=True).count()
-        if completed_required_sections_count >= required_sections.count():
-            course_completed = True
-    else:
-        all_sections_count = Section.objects.filter(course=course).count()
-        completed_sections_count = SectionProgress.objects.filter(course_progress=course_progress, completed=True).count()
-        if all_sections_count > 0 and completed_sections_count >= all_sections_count:
-            course_completed = True
-            
-    # --- START OF THE CRITICAL FIX ---
-    # The logic is now unified into a single if/else block to prevent contradictions.
-    
-    if course_completed:
-        # If the course is now complete, FORCE the state to 100% and done.
-        # This block is the single source of truth for a completed course.
-        course_progress.completed = True
-        course_progress.progress_percentage = 100
-        
-        # Only update timestamp and show the "Congratulations" message ONCE.
-        if not enrollment.completed_at:
-            enrollment.completed_at = timezone.now()
-            enrollment.save()
-            messages.success(request, f"Congratulations! You have completed the course '{course.title}'!")
-    else:
-        # If the course is NOT yet complete, ensure the 'completed' flag is False
-        # and calculate the real percentage based on required topics.
-        course_progress.completed = False
-        all_required_topics = Topic.objects.filter(section__course=course, is_required=True)
-        if all_required_topics.exists():
-            total_count = all_required_topics.count()
-            completed_count = TopicProgress.objects.filter(section_progress__course_progress=course_progress, topic__in=all_required_topics, completed=True).count()
-        else:
-            total_count = Topic.objects.filter(section__course=course).count()
-            completed_count = TopicProgress.objects.filter(section_progress__course_progress=course_progress, completed=True).count()
-        course_progress.progress_percentage = (completed_count / total_count) * 100 if total_count > 0 else 0
-    
-    # Save the final, correct state of the course progress record.
-    course_progress.save()
-    
-    # --- END OF THE CRITICAL FIX ---
-    
-    # Step 4: Activate next content (for LOCKED courses)
-    if course.course_type == 'locked' and not enrollment.completed_at:
-        # This logic now only runs if the course isn't finished,
-        # preventing it from trying to activate content after completion.
-        if section_completed:
-            next_section = Section.objects.filter(course=course, created_at__gt=section.created_at).order_by('created_at').first()
-            if next_section:
-                next_sp, created = SectionProgress.objects.get_or_create(course_progress=course_progress, section=next_section)
-                if not next_sp.is_active:
-                    next_sp.is_active = True
-                    next_sp.save()
-                first_topic = Topic.objects.filter(section=next_section).order_by('created_at').first()
-                if first_topic:
-                    first_tp, created = TopicProgress.objects.get_or_create(section_progress=next_sp, topic=first_topic)
-                    if not first_tp.is_active:
-                        first_tp.is_active = True
-                        first_tp.save()
-        else:
-            next_topic = Topic.objects.filter(section=section, created_at__gt=topic.created_at).order_by('created_at').first()
-            if next_topic:
-                next_tp, created = TopicProgress.objects.get_or_create(section_progress=section_progress, topic=next_topic)
-                if not next_tp.is_active:
-                    next_tp.is_active = True
-                    next_tp.save()
+    if completion.course_just_completed:
+        messages.success(request, f"Congratulations! You have completed the course '{course.title}'!")
 
     # Step 5: FINAL, UNCONDITIONAL REDIRECTION
     # After all logic is done, ALWAYS return to the main study page.
@@ -317,6 +223,7 @@ import logging
 
 from courses.models import Topic, Section
 from subscribtion.models import Enrollment, CourseProgress, SectionProgress, TopicProgress
+from subscribtion.completion import complete_topic, describe_changes
 
 # Set up logging
 logger = logging.getLogger(__name__)
@@ -352,116 +259,23 @@ def mark_topic_as_completed_debug(request, topic_id):
         debug_info.append("ERROR: User is not enrolled in this course")
         return HttpResponse("<br>".join(debug_info))
     
-    # 3. Get progression records
-    try:
-        course_progress = CourseProgress.objects.get(enrollment_model=enrollment)
-        debug_info.append(f"Found course progress (id={course_progress.id})")
-        
-        section_progress = SectionProgress.objects.get(
-            course_progress=course_progress,
-            section=section
-        )
-        debug_info.append(f"Found section progress (id={section_progress.id}, completed={section_progress.completed})")
-        
-        topic_progress = TopicProgress.objects.get(
-            section_progress=section_progress,
-            topic=topic
-        )
-        debug_info.append(f"Found topic progress (id={topic_progress.id}, completed={topic_progress.completed}, is_active={topic_progress.is_active})")
-    except Exception as e:
-        debug_info.append(f"ERROR in getting progress records: {str(e)}")
-        return HttpResponse("<br>".join(debug_info))
-    
-    # 4. Mark topic as completed
-    if not topic_progress.completed:
-        topic_progress.completed = True
-        topic_progress.save()
+    # 3. Run the completion engine
+    completion = complete_topic(enrollment, topic)
+    course_progress = completion.course_progress
+    debug_info.append(f"Course progress (id={course_progress.id}, completed={course_progress.completed})")
+    if completion.rejected_topic_ids:
+        debug_info.append("Topic is locked, complete the previous topics first")
+    elif completion.completed_topic_ids:
         debug_info.append(f"Marked topic as completed")
     else:
         debug_info.append(f"Topic was already marked as completed")
     
-    # 5. Check if all topics in section are completed
-    try:
-        # Get all topics in section
-        section_topics = Topic.objects.filter(section=section)
-        debug_info.append(f"Section has {section_topics.count()} total topics")
-        
-        # Get completed topics in section
-        section_completed_topics = TopicProgress.objects.filter(
-            section_progress=section_progress,
-            completed=True
-        )
-        debug_info.append(f"User has completed {section_completed_topics.count()} topics in this section")
-        
-        # Check if section is completed
-        section_completed = (section_completed_topics.count() == section_topics.count())
-        debug_info.append(f"Is section completed? {section_completed}")
-    except Exception as e:
-        debug_info.append(f"ERROR checking section completion: {str(e)}")
-        return HttpResponse("<br>".join(debug_info))
+    # 4. Section and unlock outcome
+    debug_info.append(f"Section completed by this call? {section.id in completion.completed_section_ids}")
+    debug_info.append(f"Activated topics: {completion.activated_topic_ids or 'none'}")
     
-    # 6. If section is completed, activate next section
-    if section_completed and not section_progress.completed:
-        try:
-            # Mark current section as completed
-            section_progress.completed = True
-            section_progress.save()
-            debug_info.append(f"Marked section as completed")
-            
-            # Find next section
-            next_section = Section.objects.filter(
-                course=course,
-                created_at__gt=section.created_at
-            ).order_by('created_at').first()
-            
-            if next_section:
-                debug_info.append(f"Found next section: {next_section.title} (id={next_section.id})")
-                
-                # Activate next section
-                next_section_progress, created = SectionProgress.objects.get_or_create(
-                    course_progress=course_progress,
-                    section=next_section,
-                    defaults={
-                        'progress_percentage': 0.0,
-                        'completed': False,
-                        'is_active': True
-                    }
-                )
-                
-                if created:
-                    debug_info.append(f"Created new section progress record (id={next_section_progress.id})")
-                else:
-                    next_section_progress.is_active = True
-                    next_section_progress.save()
-                    debug_info.append(f"Updated existing section progress record (id={next_section_progress.id})")
-                
-                # Activate first topic in next section
-                first_topic = Topic.objects.filter(section=next_section).order_by('created_at').first()
-                if first_topic:
-                    debug_info.append(f"Found first topic in next section: {first_topic.title} (id={first_topic.id})")
-                    
-                    first_topic_progress, created = TopicProgress.objects.get_or_create(
-                        section_progress=next_section_progress,
-                        topic=first_topic,
-                        defaults={
-                            'completed': False,
-                            'is_active': True
-                        }
-                    )
-                    
-                    if created:
-                        debug_info.append(f"Created new topic progress record (id={first_topic_progress.id})")
-                    else:
-                        first_topic_progress.is_active = True
-                        first_topic_progress.save()
-                        debug_info.append(f"Updated existing topic progress record (id={first_topic_progress.id})")
-                else:
-                    debug_info.append("ERROR: Could not find first topic in next section")
-            else:
-                debug_info.append("No next section found - this was the last section")
-        except Exception as e:
-            debug_info.append(f"ERROR activating next section: {str(e)}")
-            return HttpResponse("<br>".join(debug_info))
+    # 5. Every row the engine changed
+    debug_info.extend(describe_changes(completion.changes))
     
     # Return all debug info as a simple HTML response
     return HttpResponse("<br>".join(debug_info))
@@ -486,15 +300,16 @@ def enroll_free_course(request, course_id):
         messages.info(request, "You are already enrolled in this course.")
         return redirect('course_detail', course_id=course_id)
     
-    # Create enrollment for free course
-    enrollment = Enrollment.objects.create(
-        user=request.user,
-        course=course,
-        enrolement_status='active'
-    )
+    # Create enrollment for free course.
+    # Progress records are provisioned by the Enrollment post_save receiver
+    # inside this transaction.
+    with transaction.atomic():
+        Enrollment.objects.create(
+            user=request.user,
+            course=course,
+            enrolement_status='active'
+        )
     
-    # Create progress records
-    #create_course_progress(enrollment)
     messages.success(request, f"You have successfully enrolled in the free course: {course.title}!")
     
     # Redirect back to course detail
@@ -526,14 +341,9 @@ def debug_video_view(request, topic_id):
             course_progress=course_progress,
             section=section
         )
-        topic_progress, created = TopicProgress.objects.get_or_create(
-            section_progress=section_progress,
-            topic=topic,
-            defaults={
-                'completed': False,
-                'is_active': True
-            }
-        )
+        topic_progress = course_progress.topic_state(topic.id)
+        if topic_progress is None:
+            raise TopicProgress.DoesNotExist("No progress state for this topic")
     except Exception as e:
         messages.error(request, f"Error loading progress: {str(e)}")
         return redirect('course_detail', course_id=course.id)
@@ -559,6 +369,7 @@ from django.http import HttpResponse
 
 from courses.models import Topic, Section
 from subscribtion.models import Enrollment, CourseProgress, SectionProgress, TopicProgress
+from subscribtion.completion import complete_topic, describe_changes
 
 @login_required
 def super_detailed_debug(request, topic_id):
@@ -601,181 +412,44 @@ def super_detailed_debug(request, topic_id):
             section=section
         )
         debug_info.append(f"Found section progress (id={section_progress.id}, completed={section_progress.completed}, is_active={section_progress.is_active})")
-        
-        topic_progress = TopicProgress.objects.get(
-            section_progress=section_progress,
-            topic=topic
+        debug_info.append(
+            f"Stored counters: {section_progress.completed_topics_count}/{section_progress.total_topics_count} topics, "
+            f"{section_progress.completed_required_topics_count}/{section_progress.required_topics_count} required"
         )
-        debug_info.append(f"Found topic progress (id={topic_progress.id}, completed={topic_progress.completed}, is_active={topic_progress.is_active})")
+        
+        topic_progress = course_progress.topic_state(topic.id)
+        if topic_progress is None:
+            raise TopicProgress.DoesNotExist("No progress state for this topic")
+        debug_info.append(f"Found topic progress ({course_progress.storage_mode} storage, completed={topic_progress.completed}, is_active={topic_progress.is_active})")
     except Exception as e:
         debug_info.append(f"ERROR in getting progress records: {str(e)}")
         return HttpResponse("<br>".join(debug_info))
     
-    # Mark topic as completed if not already
-    if not topic_progress.completed:
-        topic_progress.completed = True
-        topic_progress.save()
-        debug_info.append(f"Marked topic as completed")
-    else:
-        debug_info.append(f"Topic was already marked as completed")
-    
-    # Check section completion
-    debug_info.append("\nCHECKING SECTION COMPLETION:")
+    # Run the completion engine, it also handles the next section activation
+    debug_info.append("\nRUNNING COMPLETION ENGINE:")
     debug_info.append("-" * 50)
-    
     try:
-        # Get all topics in section
-        section_topics = Topic.objects.filter(section=section)
-        debug_info.append(f"Section has {section_topics.count()} total topics:")
-        
-        # List all topics in the section
-        for idx, t in enumerate(section_topics):
-            debug_info.append(f"  {idx+1}. Topic: {t.title} (id={t.id})")
-        
-        # Get completed topics in section
-        section_completed_topics = TopicProgress.objects.filter(
-            section_progress=section_progress,
-            completed=True
-        )
-        debug_info.append(f"User has completed {section_completed_topics.count()} topics in this section:")
-        
-        # List all completed topics
-        for idx, tp in enumerate(section_completed_topics):
-            debug_info.append(f"  {idx+1}. Completed Topic: {tp.topic.title} (id={tp.topic.id})")
-        
-        # Check if section is completed
-        section_completed = (section_completed_topics.count() == section_topics.count())
-        debug_info.append(f"Is section completed? {section_completed}")
-        
-        # Mark section as completed if needed
-        debug_info.append(f"Was section already marked as completed in DB? {section_progress.completed}")
-        
-        section_progress.completed = section_completed
-        section_progress.save()
-        debug_info.append(f"Updated section completed status to: {section_completed}")
+        completion = complete_topic(enrollment, topic)
     except Exception as e:
-        debug_info.append(f"ERROR checking section completion: {str(e)}")
+        debug_info.append(f"ERROR in completion engine: {str(e)}")
+        import traceback
+        debug_info.append(traceback.format_exc())
         return HttpResponse("<br>".join(debug_info))
     
-    # NEXT SECTION ACTIVATION
-    debug_info.append("\nCHECKING NEXT SECTION ACTIVATION:")
-    debug_info.append("-" * 50)
-    
-    if section_completed:
-        try:
-            debug_info.append("Section is completed, looking for next section...")
-            
-            # Find next section
-            all_sections = Section.objects.filter(course=course).order_by('created_at')
-            debug_info.append(f"Course has {all_sections.count()} total sections:")
-            
-            # List all sections in the course
-            for idx, s in enumerate(all_sections):
-                debug_info.append(f"  {idx+1}. Section: {s.title} (id={s.id}, created_at={s.created_at})")
-            
-            next_section = Section.objects.filter(
-                course=course,
-                created_at__gt=section.created_at
-            ).order_by('created_at').first()
-            
-            if next_section:
-                debug_info.append(f"Found next section: {next_section.title} (id={next_section.id})")
-                
-                # Check if next section is already active
-                try:
-                    existing_next_section_progress = SectionProgress.objects.get(
-                        course_progress=course_progress,
-                        section=next_section
-                    )
-                    debug_info.append(f"Next section already has progress record (id={existing_next_section_progress.id}, is_active={existing_next_section_progress.is_active}, completed={existing_next_section_progress.completed})")
-                    
-                    # Update the next section progress to be active
-                    existing_next_section_progress.is_active = True
-                    existing_next_section_progress.save()
-                    debug_info.append(f"Updated next section progress to be active")
-                    
-                except SectionProgress.DoesNotExist:
-                    debug_info.append(f"No existing progress record for next section, creating new one...")
-                    
-                    # Create new section progress for next section
-                    next_section_progress = SectionProgress.objects.create(
-                        course_progress=course_progress,
-                        section=next_section,
-                        progress_percentage=0.0,
-                        completed=False,
-                        is_active=True
-                    )
-                    debug_info.append(f"Created new section progress record (id={next_section_progress.id})")
-                
-                # Reload to confirm
-                next_section_progress = SectionProgress.objects.get(
-                    course_progress=course_progress,
-                    section=next_section
-                )
-                debug_info.append(f"Confirmed next section progress: is_active={next_section_progress.is_active}")
-                
-                # Now activate first topic in next section
-                debug_info.append("\nACTIVATING FIRST TOPIC IN NEXT SECTION:")
-                debug_info.append("-" * 50)
-                
-                # Find the first topic in the next section
-                first_topics = Topic.objects.filter(section=next_section).order_by('created_at')
-                
-                if first_topics.exists():
-                    first_topic = first_topics.first()
-                    debug_info.append(f"Found first topic in next section: {first_topic.title} (id={first_topic.id})")
-                    
-                    # Check if this topic already has a progress record
-                    try:
-                        existing_topic_progress = TopicProgress.objects.get(
-                            section_progress=next_section_progress,
-                            topic=first_topic
-                        )
-                        debug_info.append(f"First topic already has progress record (id={existing_topic_progress.id}, is_active={existing_topic_progress.is_active}, completed={existing_topic_progress.completed})")
-                        
-                        # Update the topic progress to be active
-                        existing_topic_progress.is_active = True
-                        existing_topic_progress.save()
-                        debug_info.append(f"Updated first topic progress to be active")
-                        
-                    except TopicProgress.DoesNotExist:
-                        debug_info.append(f"No existing progress record for first topic, creating new one...")
-                        
-                        # Create new topic progress
-                        first_topic_progress = TopicProgress.objects.create(
-                            section_progress=next_section_progress,
-                            topic=first_topic,
-                            completed=False,
-                            is_active=True
-                        )
-                        debug_info.append(f"Created new topic progress record (id={first_topic_progress.id})")
-                    
-                    # Reload to confirm
-                    first_topic_progress = TopicProgress.objects.get(
-                        section_progress=next_section_progress,
-                        topic=first_topic
-                    )
-                    debug_info.append(f"Confirmed first topic progress: is_active={first_topic_progress.is_active}")
-                    
-                else:
-                    debug_info.append("ERROR: No topics found in the next section!")
-            else:
-                debug_info.append("No next section found - this might be the last section")
-                
-                # List all sections with their sequence
-                debug_info.append("Listing all sections by created_at to verify:")
-                all_sections = Section.objects.filter(course=course).order_by('created_at')
-                for idx, s in enumerate(all_sections):
-                    debug_info.append(f"  {idx+1}. Section: {s.title} (id={s.id}, created_at={s.created_at})")
-                
-                current_section_index = list(s.id for s in all_sections).index(section.id)
-                debug_info.append(f"Current section index: {current_section_index} of {all_sections.count()-1}")
-        except Exception as e:
-            debug_info.append(f"ERROR in next section activation: {str(e)}")
-            import traceback
-            debug_info.append(traceback.format_exc())
+    if completion.rejected_topic_ids:
+        debug_info.append("Topic is locked, complete the previous topics first")
+    elif completion.completed_topic_ids:
+        debug_info.append(f"Marked topic as completed")
     else:
-        debug_info.append("Section is NOT completed, no need to activate next section")
+        debug_info.append(f"Topic was already marked as completed")
+    debug_info.append(f"Section completed by this call? {section.id in completion.completed_section_ids}")
+    debug_info.append(f"Activated topics: {completion.activated_topic_ids or 'none'}")
+    debug_info.append(f"Course completed? {completion.course_completed} (just now: {completion.course_just_completed})")
+    
+    # Every row the engine changed
+    debug_info.append("\nCHANGED ROWS:")
+    debug_info.append("-" * 50)
+    debug_info.extend(describe_changes(completion.changes))
     
     # Return all debug info as a simple HTML response
     return HttpResponse("<br>".join(debug_info))
@@ -828,16 +502,13 @@ def generate_certificate(request, course_id):
     try:
         course_progress = CourseProgress.objects.get(enrollment_model=enrollment)
         
-        # Calculate completion percentage
-        total_topics = Topic.objects.filter(section__course=course).count()
+        # Calculate completion percentage from the stored counters
+        total_topics = course_progress.total_topics_count
         if total_topics == 0:
             messages.error(request, "This course has no topics to complete.")
             return redirect('study_course', course_id=course_id)
         
-        completed_topics = TopicProgress.objects.filter(
-            section_progress__course_progress=course_progress,
-            completed=True
-        ).count()
+        completed_topics = course_progress.completed_topics_count
         
         completion_percentage = (completed_topics / total_topics) * 100
         